@@ -0,0 +1,150 @@
+import asyncio
+import queue
+import threading
+import time
+
+import numpy as np
+
+LIMITES_PADRAO = (128, 512, 2048, 8192)
+
+
+class BatchingEngine:
+    """
+    Junta textos de requisições concorrentes em lotes compartilhados e roda a
+    inferência em uma thread dedicada, sem bloquear o event loop do FastAPI.
+    Cada chamador recebe de volta apenas a sua fatia dos vetores.
+
+    Com `concorrencia` > 1, várias threads consomem a mesma fila e mantêm
+    vários lotes em voo ao mesmo tempo (um por worker do pool de inferência).
+    """
+
+    def __init__(self, encode_fn, max_batch_size=32, max_wait_ms=10, concorrencia=1):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.concorrencia = concorrencia
+        self._queue = queue.Queue()
+        self._pendente = None
+        # só uma thread monta lote por vez; as outras ficam livres rodando o encode
+        self._coleta = threading.Lock()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.concorrencia):
+            thread = threading.Thread(target=self._worker, name=f"embed-batching-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    async def submit(self, texts):
+        """Enfileira os textos e aguarda os embeddings correspondentes."""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.put((texts, future, loop))
+        return await future
+
+    def _proximo(self, timeout=None):
+        if self._pendente is not None:
+            item, self._pendente = self._pendente, None
+            return item
+        return self._queue.get(timeout=timeout)
+
+    def _coletar_lote(self):
+        """Bloqueia até chegar um pedido e depois completa o lote até o limite ou o prazo."""
+        primeiro = self._proximo()
+        if primeiro is None:
+            return None
+        lote = [primeiro]
+        total = len(primeiro[0])
+        prazo = time.monotonic() + self.max_wait
+
+        while total < self.max_batch_size:
+            restante = prazo - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                item = self._proximo(timeout=restante)
+            except queue.Empty:
+                break
+            if item is None:
+                # repassa o sinal de parada para depois deste lote
+                self._queue.put(None)
+                break
+            if total + len(item[0]) > self.max_batch_size:
+                self._pendente = item
+                break
+            lote.append(item)
+            total += len(item[0])
+        return lote
+
+    def _worker(self):
+        while True:
+            with self._coleta:
+                lote = self._coletar_lote()
+            if lote is None:
+                return
+
+            textos = [texto for texts, _, _ in lote for texto in texts]
+            try:
+                vetores = self.encode_fn(textos)
+            except Exception as e:
+                for _, future, loop in lote:
+                    loop.call_soon_threadsafe(_set_exception, future, e)
+                continue
+
+            inicio = 0
+            for texts, future, loop in lote:
+                fim = inicio + len(texts)
+                loop.call_soon_threadsafe(_set_result, future, vetores[inicio:fim])
+                inicio = fim
+
+
+def _set_result(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future, exc):
+    if not future.done():
+        future.set_exception(exc)
+
+
+def encode_por_tamanho(textos, encode_fn, contar_tokens, limites=LIMITES_PADRAO):
+    """
+    Agrupa os textos em buckets por número de tokens e codifica cada bucket com
+    o menor max_length que o comporta, para que um texto longo não obrigue os
+    curtos a pagar o padding completo. A saída volta na ordem original.
+    """
+    if not textos:
+        return np.empty((0, 0), dtype=np.float32)
+
+    limites = sorted(limites)
+    tamanhos = np.asarray(contar_tokens(textos))
+    ordem = np.argsort(tamanhos, kind="stable")
+    # índice do bucket de cada texto; os que passam do último limite são truncados nele
+    bucket_de = np.minimum(np.searchsorted(limites, tamanhos[ordem]), len(limites) - 1)
+
+    resultado = None
+    for b in np.unique(bucket_de):
+        indices = ordem[bucket_de == b]
+        vetores = np.asarray(encode_fn([textos[i] for i in indices], max_length=limites[b]))
+        if resultado is None:
+            resultado = np.empty((len(textos), vetores.shape[1]), dtype=vetores.dtype)
+        resultado[indices] = vetores
+    return resultado
+
+
+def contador_de_tokens(tokenizer):
+    """Cria uma função que devolve o número de tokens de cada texto."""
+    def contar(textos):
+        ids = tokenizer(list(textos), add_special_tokens=True, truncation=False)["input_ids"]
+        return [len(x) for x in ids]
+    return contar
@@ -0,0 +1,98 @@
+"""
+Compara o encode atual (lotes de 8 com max_length=8192) com o encode por
+buckets de tamanho em uma carga mista de perguntas curtas e artigos longos.
+O modelo é carregado como no server.py (carregar_modelo, no backend de
+EMBEDDING_BACKEND, do snapshot local quando existe), então a medida é a do
+caminho servido.
+
+Uso (no container, ou fora dele com PYTHONPATH=../services):
+    python benchmark_buckets.py --requisicoes 50 --fracao-longos 0.2
+"""
+import argparse
+import os
+import random
+import time
+
+import numpy as np
+
+from batching import LIMITES_PADRAO, encode_por_tamanho, contador_de_tokens
+from common.embedding_backend import carregar_modelo
+from server import MODEL_NAME, MODEL_LOCAL_DIR
+
+PALAVRAS = (
+    "nota fiscal emissão cadastro cliente produto estoque imposto sistema "
+    "relatório financeiro boleto pagamento erro configuração usuário senha "
+    "legislação tributária icms pis cofins venda compra pedido"
+).split()
+
+
+def gerar_texto(n_palavras, rng):
+    return " ".join(rng.choice(PALAVRAS) for _ in range(n_palavras))
+
+
+def gerar_carga(n_requisicoes, textos_por_requisicao, fracao_longos, seed=42):
+    """Cada requisição mistura perguntas curtas com alguns artigos longos."""
+    rng = random.Random(seed)
+    carga = []
+    for _ in range(n_requisicoes):
+        textos = []
+        for _ in range(textos_por_requisicao):
+            if rng.random() < fracao_longos:
+                textos.append(gerar_texto(rng.randint(1500, 4000), rng))
+            else:
+                textos.append(gerar_texto(rng.randint(8, 40), rng))
+        carga.append(textos)
+    return carga
+
+
+def medir(nome, encode_fn, carga, contar_tokens):
+    latencias = []
+    total_tokens = 0
+    inicio = time.perf_counter()
+    for textos in carga:
+        t0 = time.perf_counter()
+        encode_fn(textos)
+        latencias.append(time.perf_counter() - t0)
+        total_tokens += sum(contar_tokens(textos))
+    total = time.perf_counter() - inicio
+
+    latencias_ms = np.array(latencias) * 1000
+    print(
+        f"[{nome}] tokens/s: {total_tokens / total:.0f} | "
+        f"p50: {np.percentile(latencias_ms, 50):.1f} ms | "
+        f"p99: {np.percentile(latencias_ms, 99):.1f} ms | "
+        f"total: {total:.2f} s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modelo", default=MODEL_LOCAL_DIR if os.path.isdir(MODEL_LOCAL_DIR) else MODEL_NAME)
+    parser.add_argument("--cache-dir", default="/app/cache/flag_model")
+    parser.add_argument("--requisicoes", type=int, default=50)
+    parser.add_argument("--textos-por-requisicao", type=int, default=8)
+    parser.add_argument("--fracao-longos", type=float, default=0.2)
+    args = parser.parse_args()
+
+    model = carregar_modelo(args.modelo, cache_dir=args.cache_dir)
+    contar_tokens = contador_de_tokens(model.tokenizer)
+    carga = gerar_carga(args.requisicoes, args.textos_por_requisicao, args.fracao_longos)
+
+    def encode_atual(textos):
+        return model.encode(textos, batch_size=8, max_length=8192)['dense_vecs']
+
+    def encode_dense(textos, max_length):
+        return model.encode(textos, batch_size=8, max_length=max_length)['dense_vecs']
+
+    def encode_buckets(textos):
+        return encode_por_tamanho(textos, encode_dense, contar_tokens, LIMITES_PADRAO)
+
+    # aquecimento para não medir a primeira alocação
+    encode_atual(carga[0][:1])
+
+    medir("atual", encode_atual, carga, contar_tokens)
+    medir("buckets", encode_buckets, carga, contar_tokens)
+
+
+if __name__ == "__main__":
+    main()
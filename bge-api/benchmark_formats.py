@@ -0,0 +1,61 @@
+"""
+Compara tamanho do payload e latência ponta a ponta do /embed em JSON e nos
+formatos binários (float32 e float16).
+
+Uso:
+    python benchmark_formats.py --url http://localhost:8000 --textos 64 --repeticoes 20
+"""
+import argparse
+import time
+
+import numpy as np
+import requests
+
+from formats import FORMATO_BINARIO, decodificar_binario
+
+FORMATOS = [
+    ("json", "application/json", None),
+    ("binario float32", f"{FORMATO_BINARIO}; dtype=float32", "float32"),
+    ("binario float16", f"{FORMATO_BINARIO}; dtype=float16", "float16"),
+]
+
+
+def medir(session, url, textos, accept, dtype, repeticoes):
+    latencias = []
+    tamanho = 0
+    for i in range(repeticoes):
+        # sufixo único por formato e repetição: o servidor tem cache de embeddings, e
+        # repetir os textos de outro formato mediria acertos do cache, não o modelo
+        corpo = {"texts": [f"{texto} {accept} {i}" for texto in textos]}
+        t0 = time.perf_counter()
+        resposta = session.post(f"{url}/embed", json=corpo, headers={"Accept": accept})
+        resposta.raise_for_status()
+        if dtype is None:
+            vetores = np.asarray(resposta.json()["dense_vecs"], dtype=np.float32)
+        else:
+            vetores = decodificar_binario(resposta.content, dtype)
+        latencias.append((time.perf_counter() - t0) * 1000)
+        tamanho = len(resposta.content)
+    return tamanho, vetores.shape, np.array(latencias)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--textos", type=int, default=64)
+    parser.add_argument("--repeticoes", type=int, default=20)
+    args = parser.parse_args()
+
+    textos = [f"como emitir nota fiscal de serviço número {i}" for i in range(args.textos)]
+    session = requests.Session()
+
+    for nome, accept, dtype in FORMATOS:
+        tamanho, shape, latencias = medir(session, args.url, textos, accept, dtype, args.repeticoes)
+        print(
+            f"[{nome}] shape: {shape} | payload: {tamanho / 1024:.1f} KiB | "
+            f"p50: {np.percentile(latencias, 50):.1f} ms | p99: {np.percentile(latencias, 99):.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
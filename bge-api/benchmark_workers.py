@@ -0,0 +1,115 @@
+"""
+Teste de carga do /embed variando o número de workers de inferência. Para
+cada valor de EMBED_WORKERS sobe um servidor novo, espera o /readyz e dispara
+requisições concorrentes, reportando textos/s, latência e a memória (PSS)
+somada do processo principal com os workers.
+
+Uso:
+    python benchmark_workers.py --workers 0,1,2,4 --threads 1 --concorrencia 16 --requisicoes 200
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+
+def pss_mb(pid):
+    """PSS do processo e dos filhos: as páginas compartilhadas são divididas entre eles."""
+    total = 0
+    pids = [pid]
+    while pids:
+        atual = pids.pop()
+        try:
+            with open(f"/proc/{atual}/smaps_rollup") as f:
+                for linha in f:
+                    if linha.startswith("Pss:"):
+                        total += int(linha.split()[1])
+            with open(f"/proc/{atual}/task/{atual}/children") as f:
+                pids.extend(int(p) for p in f.read().split())
+        except FileNotFoundError:
+            continue
+    return total / 1024
+
+
+def subir_servidor(workers, threads, porta, pasta):
+    env = dict(
+        os.environ,
+        EMBED_WORKERS=str(workers),
+        EMBED_WORKER_THREADS=str(threads),
+        # cache vazio a cada rodada, para medir inferência e não acertos
+        EMBEDDING_CACHE_PATH=os.path.join(pasta, f"embeddings_{workers}.sqlite"),
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(porta)],
+        env=env,
+    )
+
+
+def aguardar_pronto(url, processo, timeout):
+    prazo = time.monotonic() + timeout
+    while time.monotonic() < prazo:
+        if processo.poll() is not None:
+            raise RuntimeError("servidor terminou antes de ficar pronto")
+        try:
+            if requests.get(f"{url}/readyz", timeout=1).status_code == 200:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError("servidor não ficou pronto a tempo")
+
+
+def carga(url, workers, textos_por_requisicao, requisicoes, concorrencia):
+    session = requests.Session()
+    adaptador = requests.adapters.HTTPAdapter(pool_maxsize=concorrencia)
+    session.mount("http://", adaptador)
+
+    def uma(i):
+        corpo = {"texts": [f"como emitir nota fiscal {workers}-{i}-{j}" for j in range(textos_por_requisicao)]}
+        t0 = time.perf_counter()
+        session.post(f"{url}/embed", json=corpo).raise_for_status()
+        return (time.perf_counter() - t0) * 1000
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        latencias = np.array(list(executor.map(uma, range(requisicoes))))
+    duracao = time.perf_counter() - inicio
+    return requisicoes * textos_por_requisicao / duracao, latencias
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", default="0,1,2,4", help="valores de EMBED_WORKERS separados por vírgula")
+    parser.add_argument("--threads", type=int, default=1, help="EMBED_WORKER_THREADS")
+    parser.add_argument("--porta", type=int, default=8123)
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--requisicoes", type=int, default=200)
+    parser.add_argument("--textos", type=int, default=4, help="textos por requisição")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    url = f"http://127.0.0.1:{args.porta}"
+    with tempfile.TemporaryDirectory() as pasta:
+        for workers in [int(w) for w in args.workers.split(",")]:
+            processo = subir_servidor(workers, args.threads, args.porta, pasta)
+            try:
+                aguardar_pronto(url, processo, args.timeout)
+                textos_s, latencias = carga(url, workers, args.textos, args.requisicoes, args.concorrencia)
+                print(
+                    f"[workers={workers}] {textos_s:.1f} textos/s | "
+                    f"p50: {np.percentile(latencias, 50):.1f} ms | p99: {np.percentile(latencias, 99):.1f} ms | "
+                    f"PSS: {pss_mb(processo.pid):.0f} MiB"
+                )
+            finally:
+                processo.terminate()
+                processo.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import struct
+
+import numpy as np
+
+FORMATO_JSON = "application/json"
+FORMATO_BINARIO = "application/octet-stream"
+DTYPES_BINARIOS = ("float32", "float16")
+
+# cabeçalho do formato binário: número de vetores e dimensão, uint32 little-endian
+CABECALHO = struct.Struct("<II")
+
+
+def _faixas(accept):
+    """(tipo, parâmetros, q) de cada faixa do header Accept."""
+    for parte in accept.split(","):
+        campos = [c.strip() for c in parte.split(";")]
+        if not campos[0]:
+            continue
+        parametros = {}
+        for campo in campos[1:]:
+            chave, _, valor = campo.partition("=")
+            parametros[chave.strip().lower()] = valor.strip()
+        try:
+            q = float(parametros.pop("q", "1"))
+        except ValueError:
+            q = 1.0
+        yield campos[0].lower(), parametros, q
+
+
+def _casar(formato, faixas):
+    """
+    (especificidade, q, parâmetros) da faixa mais específica que aceita
+    `formato` (o tipo exato vale mais que "tipo/*", que vale mais que "*/*");
+    None se nenhuma aceita.
+    """
+    tipo = formato.split("/")[0]
+    especificidades = {formato: 2, f"{tipo}/*": 1, "*/*": 0}
+    melhor = None
+    for faixa, parametros, q in faixas:
+        especificidade = especificidades.get(faixa)
+        if especificidade is not None and (melhor is None or especificidade > melhor[0]):
+            melhor = (especificidade, q, parametros)
+    return melhor
+
+
+def negociar(accept):
+    """
+    Escolhe o formato de resposta a partir do header Accept, pelo maior q
+    entre os formatos suportados (q=0 recusa o formato). Devolve
+    (media_type, dtype); JSON é o padrão quando nada binário é pedido, e o
+    binário só ganha um empate quando foi pedido pelo nome.
+    Ex.: "application/octet-stream; dtype=float16, application/json; q=0.5".
+    """
+    faixas = list(_faixas(accept or ""))
+    binario = _casar(FORMATO_BINARIO, faixas)
+    json_ = _casar(FORMATO_JSON, faixas)
+    q_binario = binario[1] if binario else 0
+    q_json = json_[1] if json_ else 0
+    if q_binario > 0 and (q_binario > q_json or (q_binario == q_json and binario[0] == 2)):
+        dtype = binario[2].get("dtype", "float32") if binario[0] == 2 else "float32"
+        return FORMATO_BINARIO, dtype if dtype in DTYPES_BINARIOS else "float32"
+    return FORMATO_JSON, None
+
+
+def codificar_binario(vetores, dtype="float32"):
+    vetores = np.asarray(vetores)
+    if vetores.ndim != 2:
+        vetores = vetores.reshape(len(vetores), -1)
+    linhas, dim = vetores.shape
+    corpo = np.ascontiguousarray(vetores, dtype=np.dtype(dtype).newbyteorder("<"))
+    return CABECALHO.pack(linhas, dim) + corpo.tobytes()
+
+
+def decodificar_binario(dados, dtype="float32"):
+    """Inverso de codificar_binario, para uso pelos clientes."""
+    linhas, dim = CABECALHO.unpack_from(dados)
+    vetores = np.frombuffer(dados, dtype=np.dtype(dtype).newbyteorder("<"), offset=CABECALHO.size)
+    return vetores.reshape(linhas, dim)
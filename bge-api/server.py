@@ -1,30 +1,331 @@
 # server.py
-from fastapi import FastAPI, Request
+import os
+import threading
+import time
+from fastapi import FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel
-from FlagEmbedding import FlagModel
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Fusion, FusionQuery, Prefetch, SparseVector
+import numpy as np
 import uvicorn
 
+from batching import BatchingEngine, encode_por_tamanho, contador_de_tokens
+from common.embedding_backend import carregar_modelo, identidade_do_modelo
+from common.embedding_cache import EmbeddingCache, normalizar_texto
+from common.sparse import VETOR_DENSO, VETOR_ESPARSO, pesos_para_esparso
+from ttl_cache import TTLCache
+from worker_pool import InferencePool
+from formats import FORMATO_BINARIO, negociar, codificar_binario
+
+MODEL_NAME = "davidoneil/bge-m3-ft-corpus-pt"
+# snapshot local com os pesos em safetensors (ver snapshot_model.py); quando existe,
+# o modelo é carregado dele via mmap, sem passar pelo hub
+MODEL_LOCAL_DIR = os.getenv("MODEL_LOCAL_DIR", "/app/cache/snapshot/bge-m3")
+
+MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "32"))
+MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "10"))
+# 0 roda a inferência no próprio processo; N > 0 cria N workers por fork após carregar o modelo
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", "0"))
+# threads de intra-op (torch/ONNX Runtime) de cada worker; workers x threads <= núcleos
+EMBED_WORKER_THREADS = int(os.getenv("EMBED_WORKER_THREADS", "1"))
+# limites de max_length dos buckets por número de tokens
+LENGTH_BUCKETS = [int(x) for x in os.getenv("EMBED_LENGTH_BUCKETS", "128,512,2048,8192").split(",")]
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "/app/cache/embeddings.sqlite")
+EMBEDDING_CACHE_ITEMS = int(os.getenv("EMBEDDING_CACHE_ITEMS", "10000"))
+# mesma instrução usada nas consultas pelo estágio gold
+QUERY_INSTRUCTION = "Represent this sentence for searching relevant passages:"
+QDRANT_URL = os.getenv("QDRANT_URL", "http://host.docker.internal:6333")
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "true").lower() == "true"
+QDRANT_COLLECTION = os.getenv("QDRANT_COLLECTION", "tickets_homolog")
+# 0 desliga o cache de resultados de busca
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+SEARCH_CACHE_ITEMS = int(os.getenv("SEARCH_CACHE_ITEMS", "1024"))
+# coleção com vetores nomeados denso + esparso (ver QDRANT_HYBRID no create_collection)
+QDRANT_HYBRID = os.getenv("QDRANT_HYBRID", "false").lower() == "true"
+# candidatos buscados por cada vetor antes da fusão por RRF, em múltiplos de k
+HYBRID_PREFETCH = int(os.getenv("HYBRID_PREFETCH", "4"))
+# campo do payload com o documento de origem das passagens; vazio devolve passagens soltas
+SEARCH_GROUP_BY = os.getenv("SEARCH_GROUP_BY", "")
+# passagens devolvidas por documento quando os resultados são agrupados
+SEARCH_GROUP_SIZE = int(os.getenv("SEARCH_GROUP_SIZE", "3"))
+
 class EmbeddingRequest(BaseModel):
     texts: list[str]
+    return_sparse: bool = False
+    return_colbert: bool = False
+
+class SearchRequest(BaseModel):
+    query: str
+    k: int = 5
 
 app = FastAPI()
 model = None
+# o modelo carrega em uma thread; /readyz só fica verde quando ele já foi aquecido
+estado = {"pronto": False, "erro": None, "startup_s": None}
+engine = None
+engine_m3 = None
+pool = None
+contar_tokens = None
+# ids dos tokens de QUERY_INSTRUCTION, tirados do esparso das buscas híbridas
+tokens_instrucao = frozenset()
+cache = None
+qdrant = None
+search_cache = None
+
+def encode_dense(texts, max_length):
+    output = model.encode(texts, batch_size=MAX_BATCH_SIZE, max_length=max_length)
+    return output['dense_vecs']
+
+def encode_m3(texts):
+    # denso, esparso e ColBERT saem do mesmo forward do BGE-M3
+    output = model.encode(
+        texts,
+        batch_size=MAX_BATCH_SIZE,
+        max_length=max(LENGTH_BUCKETS),
+        return_dense=True,
+        return_sparse=True,
+        return_colbert_vecs=True,
+    )
+    return [
+        {"dense": denso, "sparse": pesos_para_esparso(pesos), "colbert": colbert}
+        for denso, pesos, colbert in zip(output['dense_vecs'], output['lexical_weights'], output['colbert_vecs'])
+    ]
+
+def esparso_sem_instrucao(esparso, query):
+    """
+    Tira do vetor esparso da pergunta os tokens que só vêm da instrução: são
+    os mesmos em toda busca e não existem nas passagens do gold, que são
+    embedadas sem instrução. Os que a pergunta também tem ficam.
+    """
+    indices, valores = esparso
+    remover = tokens_instrucao - set(model.tokenizer(query, add_special_tokens=False)["input_ids"])
+    if not remover:
+        return indices, valores
+    manter = ~np.isin(indices, list(remover))
+    return indices[manter], valores[manter]
+
+def inferir_dense(texts, max_length):
+    if pool is not None:
+        return pool.executar(encode_dense, texts, max_length)
+    return encode_dense(texts, max_length)
+
+def inferir_m3(texts):
+    if pool is not None:
+        return pool.executar(encode_m3, texts)
+    return encode_m3(texts)
+
+def encode_batch(texts):
+    # só os textos que não estão no cache chegam ao modelo
+    return cache.encode(
+        texts, lambda faltando: encode_por_tamanho(faltando, inferir_dense, contar_tokens, LENGTH_BUCKETS)
+    )
+
+def aquecer():
+    # aquecimento fora do cache, para a primeira requisição não pagar a alocação inicial
+    encode_dense(["aquecimento do modelo"] * min(MAX_BATCH_SIZE, 8), max_length=min(LENGTH_BUCKETS))
+    encode_m3(["aquecimento do modelo"])
+
+def preparar_worker(threads):
+    # roda em cada worker logo após o fork
+    if hasattr(model, "reabrir_sessao"):
+        model.reabrir_sessao(threads)
+    else:
+        import torch
+        torch.set_num_threads(threads)
+    aquecer()
+
+def carregar_e_aquecer():
+    global model, engine, engine_m3, pool, contar_tokens, tokens_instrucao
+    inicio = time.perf_counter()
+    try:
+        if os.path.isdir(MODEL_LOCAL_DIR):
+            # evita qualquer consulta ao hub quando os pesos já estão no disco
+            os.environ.setdefault("HF_HUB_OFFLINE", "1")
+            origem = MODEL_LOCAL_DIR
+        else:
+            origem = MODEL_NAME
+        # backend (torch ou onnx) escolhido por EMBEDDING_BACKEND
+        model = carregar_modelo(origem, cache_dir="/app/cache/flag_model")
+        contar_tokens = contador_de_tokens(model.tokenizer)
+        tokens_instrucao = frozenset(model.tokenizer(QUERY_INSTRUCTION, add_special_tokens=False)["input_ids"])
+        carregado = time.perf_counter()
+
+        if EMBED_WORKERS > 0:
+            # fork antes de qualquer inferência no processo principal; cada worker se aquece
+            pool = InferencePool(EMBED_WORKERS, EMBED_WORKER_THREADS, preparar=preparar_worker)
+            pool.start()
+        else:
+            aquecer()
+
+        # um lote em voo por worker
+        concorrencia = max(1, EMBED_WORKERS)
+        engine = BatchingEngine(
+            encode_batch, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, concorrencia=concorrencia
+        )
+        engine.start()
+        # fila separada para pedidos de esparsos/ColBERT, que não passam pelo cache de densos
+        engine_m3 = BatchingEngine(
+            inferir_m3, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, concorrencia=concorrencia
+        )
+        engine_m3.start()
+
+        estado["startup_s"] = time.perf_counter() - inicio
+        estado["pronto"] = True
+        print(f"[startup] modelo carregado de {origem} em {carregado - inicio:.2f}s, "
+              f"pronto em {estado['startup_s']:.2f}s ({EMBED_WORKERS} workers)")
+    except Exception as e:
+        estado["erro"] = str(e)
+        print(f"[startup] falha ao carregar o modelo: {e}")
+
+def exigir_pronto():
+    if not estado["pronto"]:
+        raise HTTPException(status_code=503, detail="modelo ainda carregando")
 
 @app.on_event("startup")
 def startup_event():
-    global model
-    model = FlagModel(
-        model_name_or_path="davidoneil/bge-m3-ft-corpus-pt",
-        use_fp16=True,
-        cache_dir="/app/cache/flag_model"
+    global cache, qdrant, search_cache
+    cache = EmbeddingCache(
+        EMBEDDING_CACHE_PATH,
+        # backend e precisão entram na chave: trocar de backend não reaproveita vetores do outro
+        model_name=identidade_do_modelo(MODEL_NAME),
+        max_length=max(LENGTH_BUCKETS),
+        memory_items=EMBEDDING_CACHE_ITEMS,
     )
+    threading.Thread(target=carregar_e_aquecer, name="model-startup", daemon=True).start()
+    # um único cliente por processo, reaproveitando as conexões com o Qdrant
+    qdrant = AsyncQdrantClient(url=QDRANT_URL, prefer_grpc=QDRANT_PREFER_GRPC)
+    if SEARCH_CACHE_TTL > 0:
+        search_cache = TTLCache(maxsize=SEARCH_CACHE_ITEMS, ttl=SEARCH_CACHE_TTL)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if engine is not None:
+        engine.stop()
+    if engine_m3 is not None:
+        engine_m3.stop()
+    if pool is not None:
+        pool.stop()
+    if cache is not None:
+        cache.close()
+    if qdrant is not None:
+        await qdrant.close()
 
 @app.post("/embed")
-async def embed(req: EmbeddingRequest):
-    texts = req.texts
-    output = model.encode(texts, batch_size=8, max_length=8192)
+async def embed(req: EmbeddingRequest, request: Request):
+    exigir_pronto()
+    if req.return_sparse or req.return_colbert:
+        # saídas estruturadas só em JSON; o formato binário cobre apenas os densos
+        saidas = await engine_m3.submit(req.texts)
+        resposta = {"dense_vecs": [s["dense"].tolist() for s in saidas]}
+        if req.return_sparse:
+            resposta["sparse_vecs"] = [
+                {"indices": s["sparse"][0].tolist(), "values": s["sparse"][1].tolist()} for s in saidas
+            ]
+        if req.return_colbert:
+            resposta["colbert_vecs"] = [s["colbert"].tolist() for s in saidas]
+        return resposta
+
+    # os textos entram na fila compartilhada e são agrupados com os de outras requisições
+    dense_vecs = await engine.submit(req.texts)
+    formato, dtype = negociar(request.headers.get("accept"))
+    if formato == FORMATO_BINARIO:
+        # cabeçalho (linhas, dim) + floats little-endian, sem passar pelo encoder JSON
+        return Response(
+            content=codificar_binario(dense_vecs, dtype),
+            media_type=f"{FORMATO_BINARIO}; dtype={dtype}",
+        )
     # retornamos apenas dense embeddings como exemplo
-    return {"dense_vecs": output['dense_vecs']}
+    return {"dense_vecs": dense_vecs.tolist()}
+
+@app.post("/search")
+async def search(req: SearchRequest):
+    exigir_pronto()
+    chave = (normalizar_texto(req.query), req.k)
+    if search_cache is not None:
+        resultado = search_cache.get(chave)
+        if resultado is not None:
+            return resultado
+
+    # embed e busca no mesmo processo: o vetor não precisa voltar para o cliente
+    if QDRANT_HYBRID:
+        # denso e esparso do mesmo forward; os tokens da instrução saem do esparso
+        saida = (await engine_m3.submit([QUERY_INSTRUCTION + req.query]))[0]
+        indices, valores = esparso_sem_instrucao(saida["sparse"], req.query)
+        # com agrupamento cada documento pode trazer várias passagens entre os candidatos
+        candidatos = req.k * HYBRID_PREFETCH * (SEARCH_GROUP_SIZE if SEARCH_GROUP_BY else 1)
+        consulta = {
+            "prefetch": [
+                Prefetch(query=saida["dense"].tolist(), using=VETOR_DENSO, limit=candidatos),
+                Prefetch(
+                    query=SparseVector(indices=indices.tolist(), values=valores.tolist()),
+                    using=VETOR_ESPARSO,
+                    limit=candidatos,
+                ),
+            ],
+            "query": FusionQuery(fusion=Fusion.RRF),
+        }
+    else:
+        vetor = (await engine.submit([QUERY_INSTRUCTION + req.query]))[0]
+        consulta = {"query": vetor.tolist()}
+
+    if SEARCH_GROUP_BY:
+        # um resultado por documento de origem, com as melhores passagens dele
+        resposta = await qdrant.query_points_groups(
+            collection_name=QDRANT_COLLECTION,
+            group_by=SEARCH_GROUP_BY,
+            limit=req.k,
+            group_size=SEARCH_GROUP_SIZE,
+            with_payload=True,
+            **consulta,
+        )
+        resultado = {
+            "results": [
+                {
+                    "parent_id": grupo.id,
+                    "score": grupo.hits[0].score,
+                    "hits": [{"id": ponto.id, "score": ponto.score, "payload": ponto.payload} for ponto in grupo.hits],
+                }
+                for grupo in resposta.groups
+            ]
+        }
+    else:
+        resposta = await qdrant.query_points(
+            collection_name=QDRANT_COLLECTION,
+            limit=req.k,
+            with_payload=True,
+            **consulta,
+        )
+        resultado = {
+            "results": [
+                {"id": ponto.id, "score": ponto.score, "payload": ponto.payload}
+                for ponto in resposta.points
+            ]
+        }
+    if search_cache is not None:
+        search_cache.set(chave, resultado)
+    return resultado
+
+@app.get("/healthz")
+async def healthz():
+    # processo vivo, mesmo que o modelo ainda esteja carregando
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    if not estado["pronto"]:
+        return Response(
+            content='{"status": "loading"}' if estado["erro"] is None else '{"status": "error"}',
+            status_code=503,
+            media_type="application/json",
+        )
+    return {"status": "ready", "startup_s": estado["startup_s"]}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    stats = {"embeddings": cache.stats()}
+    if search_cache is not None:
+        stats["search"] = search_cache.stats()
+    return stats
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
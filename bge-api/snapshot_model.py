@@ -0,0 +1,46 @@
+"""
+Baixa o modelo para uma pasta local (MODEL_LOCAL_DIR) com os pesos em
+safetensors, para o servidor carregar via mmap sem consultar o hub no startup.
+Se o repositório só tiver pytorch_model.bin, os pesos são convertidos.
+
+Uso:
+    python snapshot_model.py --saida /app/cache/snapshot/bge-m3
+"""
+import argparse
+import os
+
+from huggingface_hub import snapshot_download
+
+MODEL_NAME = "davidoneil/bge-m3-ft-corpus-pt"
+# pesos do encoder, tokenizer e as cabeças esparsa/ColBERT do BGE-M3
+PADROES = ["*.json", "*.safetensors", "*.model", "*.txt", "sparse_linear.pt", "colbert_linear.pt"]
+
+
+def converter_para_safetensors(pasta):
+    import torch
+    from safetensors.torch import save_file
+
+    origem = os.path.join(pasta, "pytorch_model.bin")
+    estado = torch.load(origem, map_location="cpu")
+    # safetensors não aceita tensores que compartilham memória
+    estado = {k: v.contiguous().clone() for k, v in estado.items()}
+    save_file(estado, os.path.join(pasta, "model.safetensors"), metadata={"format": "pt"})
+    os.remove(origem)
+    print(f"[OK] pesos convertidos para safetensors em {pasta}")
+
+
+def baixar(model_name, saida):
+    os.makedirs(saida, exist_ok=True)
+    snapshot_download(model_name, local_dir=saida, allow_patterns=PADROES)
+    if not any(nome.endswith(".safetensors") for nome in os.listdir(saida)):
+        snapshot_download(model_name, local_dir=saida, allow_patterns=["pytorch_model.bin"])
+        converter_para_safetensors(saida)
+    print(f"[OK] snapshot de {model_name} salvo em {saida}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modelo", default=MODEL_NAME)
+    parser.add_argument("--saida", default=os.getenv("MODEL_LOCAL_DIR", "/app/cache/snapshot/bge-m3"))
+    args = parser.parse_args()
+    baixar(args.modelo, args.saida)
@@ -0,0 +1,59 @@
+import multiprocessing
+import queue
+
+
+def _inicializar(preparar, threads, prontos):
+    try:
+        if preparar is not None:
+            preparar(threads)
+    except Exception as e:
+        prontos.put(repr(e))
+        raise
+    prontos.put(None)
+
+
+class InferencePool:
+    """
+    Pool de processos de inferência criado por fork depois que o modelo já foi
+    carregado no processo principal. Os workers herdam os pesos por
+    copy-on-write (e, vindo de safetensors via mmap, pelas mesmas páginas do
+    page cache), então N workers não significam N cópias do modelo na RAM.
+
+    O processo principal não deve rodar inferência antes do fork: o pool de
+    threads do OpenMP não sobrevive ao fork e o filho pode travar. Por isso o
+    aquecimento é feito dentro de cada worker, em `preparar(threads)`.
+    """
+
+    def __init__(self, workers, threads_por_worker=1, preparar=None):
+        self.workers = workers
+        self.threads_por_worker = threads_por_worker
+        self.preparar = preparar
+        self._pool = None
+
+    def start(self, timeout=600):
+        ctx = multiprocessing.get_context("fork")
+        prontos = ctx.Queue()
+        # com fork os argumentos do initializer são herdados, não serializados
+        self._pool = ctx.Pool(
+            self.workers, initializer=_inicializar, initargs=(self.preparar, self.threads_por_worker, prontos)
+        )
+        for _ in range(self.workers):
+            try:
+                erro = prontos.get(timeout=timeout)
+            except queue.Empty:
+                self.stop()
+                raise TimeoutError("workers de inferência não ficaram prontos a tempo")
+            if erro is not None:
+                # sem isso o Pool recriaria o worker com falha indefinidamente
+                self.stop()
+                raise RuntimeError(f"falha ao preparar worker de inferência: {erro}")
+
+    def executar(self, fn, *args):
+        """Roda `fn(*args)` em um worker livre e devolve o resultado (bloqueante)."""
+        return self._pool.apply(fn, args)
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
@@ -3,4 +3,4 @@ sudo apt-get update
 
 pip3 install --upgrade pip
 
-pip3 install transformers torch google-cloud-storage google-cloud-bigquery
+pip3 install transformers torch google-cloud-storage google-cloud-bigquery aiohttp pandas pyarrow
@@ -1,131 +1,435 @@
 from pyspark.sql.types import StructType, StructField, StringType
 import os
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from google.cloud import storage, bigquery
 from pyspark.sql import SparkSession
-from pyspark.sql.functions import udf, col, current_timestamp
-from pyspark.sql.types import StringType, ArrayType, FloatType
-import requests
+from pyspark.sql.functions import col, current_timestamp, broadcast, max_by
+from pyspark.sql.functions import max as spark_max
+from pyspark.sql.types import ArrayType, FloatType, IntegerType
+import aiohttp
+import pandas as pd
 import json
 
-GEMINI_MODEL = "gemini-2.5-flash"  
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent"
-GEMINI_EMBEDDING_URL = "https://generativelanguage.googleapis.com/v1beta/models/text-embedding-004:embedContent"
+# Endpoints configuráveis para testar contra um servidor local (ex.: GEMINI_BASE_URL=http://127.0.0.1:8080/v1beta)
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_EMBEDDING_MODEL = os.getenv("GEMINI_EMBEDDING_MODEL", "text-embedding-004")
+GEMINI_API_URL = os.getenv("GEMINI_API_URL", f"{GEMINI_BASE_URL}/models/{GEMINI_MODEL}:generateContent")
+GEMINI_EMBEDDING_URL = os.getenv(
+    "GEMINI_EMBEDDING_URL", f"{GEMINI_BASE_URL}/models/{GEMINI_EMBEDDING_MODEL}:batchEmbedContents"
+)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+EMBEDDING_DIM = 768
 
+# textos por chamada do batchEmbedContents (a API aceita até 100)
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+# requisições em voo por partição, para classificação e para lotes de embeddings
+CLASSIFY_CONCURRENCY = int(os.getenv("CLASSIFY_CONCURRENCY", "8"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "5"))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "60"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "1"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))
+# threads por partição para ler .txt/.chunks.jsonl do GCS
+READ_WORKERS = int(os.getenv("READ_WORKERS", "16"))
 
-def get_gemini_embedding(text: str) -> list:
+# área de staging onde a saída do enriquecimento é materializada uma vez por execução;
+# vazio usa gs://<bucket>/staging/embeddings
+STAGING_PATH = os.getenv("STAGING_PATH", "")
+
+# Controle de processados: tabela Parquet com uma linha por (file_name, source_hash);
+# vazio usa gs://<bucket>/silver/processed_control_parquet. O CSV antigo é migrado na primeira leitura
+CONTROL_PATH = os.getenv("CONTROL_PATH", "")
+CONTROL_CSV_PATH = os.getenv("CONTROL_CSV_PATH", "")
+# controle com até tantas linhas vai em broadcast nos joins de seleção
+CONTROL_BROADCAST_ROWS = int(os.getenv("CONTROL_BROADCAST_ROWS", "500000"))
+# cada execução acrescenta arquivos pequenos; acima de tantos arquivos o controle é compactado
+CONTROL_COMPACT_FILES = int(os.getenv("CONTROL_COMPACT_FILES", "64"))
+CONTROL_ROWS_PER_FILE = int(os.getenv("CONTROL_ROWS_PER_FILE", "1000000"))
+
+SCHEMA_CONTROLE = StructType([
+    StructField("file_name", StringType(), True),
+    StructField("classification", StringType(), True),
+    StructField("processed_at", StringType(), True),
+    StructField("source_hash", StringType(), True),
+])
+
+# contadores de chamadas à API, somados das partições via accumulators
+CONTADORES_API = [
+    "documentos", "passagens",
+    "classificacao", "classificacao_retentativas", "classificacao_falhas",
+    "embedding", "embedding_textos", "embedding_retentativas", "embedding_falhas",
+]
+
+# respostas que valem nova tentativa; os demais 4xx são definitivos
+STATUS_RETENTAVEIS = {408, 429, 500, 502, 503, 504}
+
+# Saída do estágio de enriquecimento: uma linha por passagem, já com rótulo e embedding
+SCHEMA_PASSAGENS = StructType([
+    StructField("file_name", StringType(), True),
+    StructField("blob_path", StringType(), True),
+    StructField("source_hash", StringType(), True),
+    StructField("classification", StringType(), True),
+    StructField("id_passagem", StringType(), False),
+    StructField("indice", IntegerType(), False),
+    StructField("inicio", IntegerType(), False),
+    StructField("fim", IntegerType(), False),
+    StructField("text", StringType(), True),
+    StructField("embedding", ArrayType(FloatType()), True),
+])
+
+
+def espera_backoff(tentativa, retry_after=None):
+    """Backoff exponencial com jitter completo; respeita o Retry-After do servidor quando vier."""
+    espera = random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** tentativa))
+    if retry_after is not None:
+        try:
+            espera = max(espera, float(retry_after))
+        except ValueError:
+            pass
+    return espera
+
+
+async def post_json(session, url, body, limite, contagem, tipo):
     """
-    Usa a API Gemini para gerar embeddings do texto.
-    Retorna lista de floats.
+    POST com retentativas. `limite` (semáforo) conta só as requisições em voo,
+    não o tempo de espera do backoff. Cada tentativa soma em `contagem[tipo]`.
+    Devolve o JSON da resposta ou levanta a última falha quando as tentativas
+    se esgotam.
     """
-    body = {
-        "model": "models/text-embedding-004",
-        "content": {
-            "parts": [
-                {"text": text}
-            ]
-        }
-    }
-    
-    params = {"key": GEMINI_API_KEY}
-    headers = {"Content-Type": "application/json"}
-    
+    erro = None
+    for tentativa in range(HTTP_MAX_RETRIES):
+        retry_after = None
+        contagem[tipo] += 1
+        if tentativa:
+            contagem[f"{tipo}_retentativas"] += 1
+        try:
+            async with limite:
+                async with session.post(url, params={"key": GEMINI_API_KEY}, json=body) as resp:
+                    if resp.status == 200:
+                        return await resp.json()
+                    erro = RuntimeError(f"HTTP {resp.status}: {(await resp.text())[:200]}")
+                    if resp.status not in STATUS_RETENTAVEIS:
+                        raise erro
+                    retry_after = resp.headers.get("Retry-After")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            erro = e
+        if tentativa + 1 < HTTP_MAX_RETRIES:
+            await asyncio.sleep(espera_backoff(tentativa, retry_after))
+    contagem[f"{tipo}_falhas"] += 1
+    raise erro
+
+
+async def get_gemini_embeddings(session, texts, limite, contagem):
+    """
+    Usa a API Gemini (batchEmbedContents) para gerar os embeddings de até
+    EMBED_BATCH_SIZE textos em uma chamada. Retorna uma lista de floats por texto.
+    """
+    modelo = f"models/{GEMINI_EMBEDDING_MODEL}"
+    body = {"requests": [{"model": modelo, "content": {"parts": [{"text": t}]}} for t in texts]}
     try:
-        resp = requests.post(GEMINI_EMBEDDING_URL, params=params, json=body, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        # Extrair embedding da resposta
-        embedding = data.get("embedding", {}).get("values", [])
-        
-        if not embedding:
-            print(f"Embedding vazio retornado para texto: {text[:100]}...")
-            return [0.0] * 768  # fallback com dimensão padrão
-            
-        return embedding
-        
-    except requests.exceptions.RequestException as e:
-        print(f"Erro ao obter embedding do Gemini: {e}")
-        return [0.0] * 768
+        contagem["embedding_textos"] += len(texts)
+        data = await post_json(session, GEMINI_EMBEDDING_URL, body, limite, contagem, "embedding")
+        embeddings = [e.get("values", []) for e in data.get("embeddings", [])]
+        if len(embeddings) != len(texts):
+            print(f"Lote de embeddings com {len(embeddings)} respostas para {len(texts)} textos")
+            return [[0.0] * EMBEDDING_DIM for _ in texts]  # fallback com dimensão padrão
+        return [emb or [0.0] * EMBEDDING_DIM for emb in embeddings]
     except Exception as e:
-        print(f"Erro inesperado ao obter embedding: {e}")
-        return [0.0] * 768
+        print(f"Erro ao obter embeddings do Gemini: {e}")
+        return [[0.0] * EMBEDDING_DIM for _ in texts]
+
+
+def normalize_label(label: str) -> str:
+    label = label.strip().lower()
+    if "legisla" in label:
+        return "legislacao"
+    elif "sistema" in label:
+        return "sistema"
+    print(f"Resposta inesperada do Gemini: {label}")
+    return "sistema"
 
 
-def classify_text(text: str) -> str:
+async def classify_text(session, text, limite, contagem):
     """
     Usa Gemini para classificar o texto entre 'legislacao' ou 'sistema'.
     Retorna o rótulo como string.
     """
+    if not text or len(text.strip()) == 0:
+        return "sistema"
     prompt = (
         "Você é um classificador. Classifique o texto abaixo como 'legislacao' ou 'sistema'. "
         "Responda somente com o rótulo, sem explicações adicionais.\n\n"
         f"Texto: {text[:1000]}"  # Limitar tamanho para evitar tokens excessivos
     )
+    body = {"contents": [{"parts": [{"text": prompt}]}]}
+    try:
+        data = await post_json(session, GEMINI_API_URL, body, limite, contagem, "classificacao")
+        parts = data.get("candidates", [{}])[0].get("content", {}).get("parts", [])
+        return normalize_label(parts[0].get("text", "") if parts else "")
+    except Exception as e:
+        print(f"Erro na chamada Gemini para classificação: {e}")
+        return "sistema"
+
+
+def parse_passages(file_name, text, chunks):
+    """Passagens do .chunks.jsonl; artigos sem o arquivo viram uma passagem só."""
+    passagens = [json.loads(linha) for linha in (chunks or "").splitlines() if linha.strip()]
+    if not passagens:
+        passagens = [{"id_passagem": f"{file_name}#0", "indice": 0, "inicio": 0, "fim": len(text or ""), "texto": text or ""}]
+    return passagens
+
+
+async def enrich_batch(session, pdf, limite_cls, limite_emb, contagem):
+    """
+    Classifica os documentos de um lote (um rótulo por artigo) e gera o
+    embedding de cada passagem; as chamadas de classificação e os lotes de
+    embeddings correm em paralelo, limitados pelos semáforos.
+    """
+    linhas = []
+    for doc in pdf.itertuples(index=False):
+        for p in parse_passages(doc.file_name, doc.text, doc.chunks):
+            linhas.append({
+                "file_name": doc.file_name, "blob_path": doc.blob_path, "source_hash": doc.source_hash,
+                "id_passagem": p["id_passagem"], "indice": p["indice"], "inicio": p["inicio"], "fim": p["fim"],
+                "text": p["texto"],
+            })
+
+    # passagens vazias não vão para a API
+    com_texto = [i for i, linha in enumerate(linhas) if linha["text"] and linha["text"].strip()]
+    lotes = [com_texto[i:i + EMBED_BATCH_SIZE] for i in range(0, len(com_texto), EMBED_BATCH_SIZE)]
+    rotulos, embeddings = await asyncio.gather(
+        asyncio.gather(*(classify_text(session, t, limite_cls, contagem) for t in pdf["text"])),
+        asyncio.gather(*(
+            get_gemini_embeddings(session, [linhas[i]["text"] for i in lote], limite_emb, contagem) for lote in lotes
+        )),
+    )
+    contagem["documentos"] += len(pdf)
+    contagem["passagens"] += len(linhas)
 
-    body = {
-        "contents": [
-            {
-                "parts": [
-                    {"text": prompt}
-                ]
-            }
-        ]
-    }
+    por_documento = dict(zip(pdf["file_name"], rotulos))
+    for linha in linhas:
+        linha["classification"] = por_documento[linha["file_name"]]
+        linha["embedding"] = [0.0] * EMBEDDING_DIM
+    for lote, embs in zip(lotes, embeddings):
+        for i, emb in zip(lote, embs):
+            linhas[i]["embedding"] = emb
+    print(f"Lote: {len(pdf)} documentos, {len(linhas)} passagens, {len(lotes)} chamadas de embedding")
+    return pd.DataFrame(linhas, columns=SCHEMA_PASSAGENS.fieldNames())
 
-    params = {"key": GEMINI_API_KEY}
-    headers = {"Content-Type": "application/json"}
 
+def enrich_partition(lotes, ler_texto, contadores=None):
+    """
+    Função do mapInPandas: recebe lotes de documentos (file_name, blob_path,
+    chunks_path, source_hash) e devolve uma linha por passagem com
+    classificação e embedding. Cada partição abre uma só sessão HTTP (pool de
+    conexões reaproveitado por todos os lotes) e um só event loop.
+    `ler_texto(blob_path)` lê o conteúdo do storage; `contadores` (nome ->
+    accumulator, ver CONTADORES_API) recebe as chamadas feitas pela partição.
+    """
+    contagem = Counter()
+    loop = asyncio.new_event_loop()
+
+    async def abrir_sessao():
+        conector = aiohttp.TCPConnector(limit=CLASSIFY_CONCURRENCY + EMBED_CONCURRENCY)
+        return aiohttp.ClientSession(connector=conector, timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT))
+
+    session = loop.run_until_complete(abrir_sessao())
+    limite_cls = asyncio.Semaphore(CLASSIFY_CONCURRENCY)
+    limite_emb = asyncio.Semaphore(EMBED_CONCURRENCY)
+    leitura = ThreadPoolExecutor(max_workers=READ_WORKERS)
     try:
-        resp = requests.post(GEMINI_API_URL, params=params, json=body, headers=headers)
-        resp.raise_for_status()
-        data = resp.json()
-        
-        # Extrair texto da resposta
-        candidate = data.get("candidates", [{}])[0]
-        content = candidate.get("content", {})
-        parts = content.get("parts", [])
-        
-        if parts:
-            label = parts[0].get("text", "").strip().lower()
-        else:
-            label = ""
-        
-        # Normalizar resposta
-        if "legisla" in label:
-            return "legislacao"
-        elif "sistema" in label:
-            return "sistema"
-        else:
-            print(f"Resposta inesperada do Gemini: {label}")
-            return "sistema"
-            
-    except requests.exceptions.RequestException as e:
-        print(f"Erro na chamada Gemini para classificação: {e}")
-        return "sistema"
-    except Exception as e:
-        print(f"Erro inesperado ao classificar via Gemini: {e}")
-        return "sistema"
+        for pdf in lotes:
+            pdf = pdf.assign(
+                text=list(leitura.map(ler_texto, pdf["blob_path"])),
+                chunks=list(leitura.map(ler_texto, pdf["chunks_path"])),
+            )
+            yield loop.run_until_complete(enrich_batch(session, pdf, limite_cls, limite_emb, contagem))
+    finally:
+        if contadores is not None:
+            for nome, valor in contagem.items():
+                contadores[nome].add(valor)
+        leitura.shutdown()
+        loop.run_until_complete(session.close())
+        loop.close()
+
+
+def gcs_reader(bucket):
+    """Leitor de blobs com um só cliente do GCS, criado no executor."""
+    from google.cloud import storage as gcs_storage
+    bucket_obj = gcs_storage.Client().bucket(bucket)
+
+    def ler_texto(blob_path):
+        try:
+            text = bucket_obj.blob(blob_path).download_as_text(encoding="utf-8")
+            print(f"Lido com sucesso: {blob_path} ({len(text)} chars)")
+            return text
+        except Exception as e:
+            print(f"Erro ao ler {blob_path}: {e}")
+            return ""
+
+    return ler_texto
+
+
+class Cronometro:
+    """Tempo de parede de cada etapa do pipeline; `marcar` fecha a etapa corrente."""
+
+    def __init__(self):
+        self.tempos = {}
+        self._ultimo = time.perf_counter()
+
+    def marcar(self, nome):
+        agora = time.perf_counter()
+        self.tempos[nome] = agora - self._ultimo
+        self._ultimo = agora
+        print(f"[etapa] {nome}: {self.tempos[nome]:.1f}s")
+
+
+def print_summary(cronometro, contadores):
+    print("Resumo da execução:")
+    for nome, segundos in cronometro.tempos.items():
+        print(f"  {nome:<28} {segundos:8.1f}s")
+    print(f"  {'total':<28} {sum(cronometro.tempos.values()):8.1f}s")
+    for nome in CONTADORES_API:
+        print(f"  {nome:<28} {contadores[nome].value:8d}")
+
+
+def _hadoop_path(spark, path):
+    """FileSystem do Hadoop (local ou gs://) e Path de `path`."""
+    caminho = spark.sparkContext._jvm.org.apache.hadoop.fs.Path(path)
+    return caminho.getFileSystem(spark.sparkContext._jsc.hadoopConfiguration()), caminho
+
+
+def path_exists(spark, path):
+    fs, caminho = _hadoop_path(spark, path)
+    return fs.exists(caminho)
+
+
+def remove_path(spark, path):
+    fs, caminho = _hadoop_path(spark, path)
+    fs.delete(caminho, True)
+
+
+def rename_path(spark, origem, destino):
+    fs, caminho = _hadoop_path(spark, origem)
+    if not fs.rename(caminho, _hadoop_path(spark, destino)[1]):
+        raise RuntimeError(f"Falha ao renomear {origem} para {destino}")
+
+
+def count_data_files(spark, path):
+    fs, caminho = _hadoop_path(spark, path)
+    if not fs.exists(caminho):
+        return 0
+    return sum(1 for status in fs.listStatus(caminho) if status.getPath().getName().endswith(".parquet"))
+
+
+def compact_control(spark, path_control, origem=None):
+    """
+    Reescreve o controle com uma linha por (file_name, source_hash), a do
+    processamento mais recente, em poucos arquivos ordenados por file_name.
+    Grava em um diretório ao lado e só então troca os dois, para não ler e
+    sobrescrever o mesmo caminho; read_control conclui uma troca interrompida.
+    `origem` (ex.: o CSV antigo) substitui a leitura do próprio controle.
+    """
+    temporario = path_control + "_compacting"
+    if origem is None:
+        origem = spark.read.schema(SCHEMA_CONTROLE).parquet(path_control)
+    df = origem.groupBy("file_name", "source_hash").agg(
+        max_by("classification", "processed_at").alias("classification"),
+        spark_max("processed_at").alias("processed_at"),
+    ).select(*SCHEMA_CONTROLE.fieldNames())
+    linhas = df.count()
+    arquivos = max(1, -(-linhas // CONTROL_ROWS_PER_FILE))
+    df.repartitionByRange(arquivos, "file_name").sortWithinPartitions("file_name") \
+        .write.mode("overwrite").parquet(temporario)
+    if path_exists(spark, path_control):
+        remove_path(spark, path_control)
+    rename_path(spark, temporario, path_control)
+    print(f"Controle compactado: {linhas} registros em {arquivos} arquivo(s)")
+
+
+def read_control(spark, path_control, path_csv):
+    """
+    Lê o controle em Parquet. Sem ele, conclui uma compactação interrompida
+    ou migra o CSV antigo (schema posicional: arquivos sem a coluna
+    source_hash são lidos com ela nula).
+    """
+    temporario = path_control + "_compacting"
+    if not path_exists(spark, path_control) and path_exists(spark, temporario):
+        rename_path(spark, temporario, path_control)
+    if not path_exists(spark, path_control) and path_csv and path_exists(spark, path_csv):
+        print(f"Migrando controle CSV {path_csv} para Parquet em {path_control}...")
+        compact_control(spark, path_control, spark.read.option("header", "true").schema(SCHEMA_CONTROLE).csv(path_csv))
+    if not path_exists(spark, path_control):
+        return spark.createDataFrame([], SCHEMA_CONTROLE)
+    return spark.read.schema(SCHEMA_CONTROLE).parquet(path_control)
+
+
+def append_control(spark, df, path_control):
+    """Acrescenta linhas ao controle e compacta quando os arquivos pequenos se acumulam."""
+    df.select(*SCHEMA_CONTROLE.fieldNames()).write.mode("append").parquet(path_control)
+    arquivos = count_data_files(spark, path_control)
+    if arquivos > CONTROL_COMPACT_FILES:
+        print(f"Controle com {arquivos} arquivos, compactando...")
+        compact_control(spark, path_control)
+
+
+def select_pending(df_files, df_ctrl, broadcast_ctrl):
+    """
+    Separa os arquivos listados em (a processar, adotados) só com joins, sem
+    levar o controle para o driver:
+    - sem nenhuma linha no controle, ou cuja versão atual (source_hash) não está
+      no controle -> processar;
+    - sem hash na listagem mas já processados alguma vez -> ignorados;
+    - conhecidos só por linhas antigas, sem hash -> adotados com a versão atual,
+      sem reprocessar.
+    """
+    chaves = df_ctrl.where(col("source_hash").isNotNull()).select("file_name", "source_hash").distinct()
+    por_nome = df_ctrl.groupBy("file_name").agg(
+        spark_max(col("source_hash").isNotNull()).alias("tem_hash"),
+        max_by("classification", "processed_at").alias("classification"),
+    )
+    if broadcast_ctrl:
+        chaves, por_nome = broadcast(chaves), broadcast(por_nome)
+
+    # hash nulo nunca casa no join, então esses arquivos seguem para a checagem por nome
+    candidatos = df_files.join(chaves, ["file_name", "source_hash"], "left_anti").join(por_nome, "file_name", "left")
+    df_pendentes = candidatos.where(
+        col("tem_hash").isNull() | (col("source_hash").isNotNull() & col("tem_hash"))
+    ).select(*df_files.columns)
+    df_adotados = candidatos.where(
+        col("source_hash").isNotNull() & ~col("tem_hash")
+    ).select("file_name", "classification", "source_hash")
+    return df_pendentes, df_adotados
 
 
 # --- Pipeline com Spark ---
-def main():
+def main(compact_only=False):
     spark = SparkSession.builder \
       .appName("EmbeddingsPipeline") \
       .config("spark.rpc.message.maxSize", "2047") \
       .getOrCreate()
 
     bucket = os.getenv("BUCKET_NAME", "pdm-2025-knowledge-base")
+    cronometro = Cronometro()
+    contadores = {nome: spark.sparkContext.accumulator(0) for nome in CONTADORES_API}
     
-    # Leitura do CSV de controle (se existir)
-    path_control = f"gs://{bucket}/silver/processed_control"
-    try:
-        df_ctrl = spark.read.option("header", "true").csv(path_control)
-        processed = [r["file_name"] for r in df_ctrl.select("file_name").collect()]
-        print(f"Arquivos já processados: {len(processed)}")
-    except Exception as e:
-        print(f"Controle não encontrado ou erro: {e}")
-        processed = []
+    path_control = CONTROL_PATH or f"gs://{bucket}/silver/processed_control_parquet"
+    path_csv = CONTROL_CSV_PATH or f"gs://{bucket}/silver/processed_control"
+    df_ctrl = read_control(spark, path_control, path_csv)
+    if compact_only:
+        if path_exists(spark, path_control):
+            compact_control(spark, path_control)
+        spark.stop()
+        return
+    linhas_ctrl = df_ctrl.count()
+    print(f"Registros no controle: {linhas_ctrl}")
+    cronometro.marcar("leitura do controle")
 
     # Listagem dos arquivos .txt no bucket
     client = storage.Client()
@@ -133,25 +437,36 @@ def main():
     prefix = "knowledge_base"
     print(f"Listando arquivos no bucket gs://{bucket}/{prefix}...")
     
+    # Hash do HTML de origem de cada .txt, gravado pelo silver; muda quando o artigo muda
+    estado_silver = bucket_obj.blob("silver/_silver_state.json")
+    source_hashes = {}
+    if estado_silver.exists():
+        source_hashes = {k: v["sha256"] for k, v in json.loads(estado_silver.download_as_text()).items()}
+
     blobs = client.list_blobs(bucket, prefix=prefix)
     files = []
     for blob in blobs:
         name = blob.name
         if name.lower().endswith(".txt"):
             fname = os.path.basename(name)
-            files.append((fname, name))
+            # passagens geradas pelo silver ao lado do .txt
+            files.append((fname, name, name[:-4] + ".chunks.jsonl", source_hashes.get(fname)))
     
     print(f"Total de arquivos .txt encontrados: {len(files)}")
+    cronometro.marcar("listagem")
     
     if not files:
         print("AVISO: Nenhum arquivo .txt encontrado no bucket!")
+        print_summary(cronometro, contadores)
         spark.stop()
         return
     
     # Criar DataFrame com os dados
     schema = StructType([
         StructField("file_name", StringType(), True),
-        StructField("blob_path", StringType(), True)
+        StructField("blob_path", StringType(), True),
+        StructField("chunks_path", StringType(), True),
+        StructField("source_hash", StringType(), True)
     ])
     
     df_files = spark.createDataFrame(files, schema)
@@ -161,90 +476,45 @@ def main():
     print("Exemplos de arquivos:")
     df_files.show(5, truncate=False)
     
-    # Filtrar arquivos já processados
-    if processed:
-        df_to_process = df_files.filter(~col("file_name").isin(processed))
-    else:
-        df_to_process = df_files
+    # Filtrar arquivos já processados com o mesmo conteúdo de origem (anti-join no controle)
+    df_to_process, df_adotados = select_pending(df_files, df_ctrl, linhas_ctrl <= CONTROL_BROADCAST_ROWS)
+    df_to_process = df_to_process.cache()
+    # Linhas de controle para os adotados, gravadas mesmo sem nada para processar
+    df_adotados = df_adotados.select(
+        "file_name", "classification", current_timestamp().cast("string").alias("processed_at"), "source_hash"
+    ).cache()
     
     count_to_process = df_to_process.count()
-    print(f"Arquivos a processar: {count_to_process}")
-    
+    count_adotados = df_adotados.count()
+    print(f"Arquivos a processar (novos ou alterados): {count_to_process} | "
+          f"sem hash no controle (adotados): {count_adotados}")
+    cronometro.marcar("seleção")
+
     # Se não há nada para processar, encerra
     if count_to_process == 0:
         print("Nenhum arquivo novo para processar")
+        if count_adotados:
+            append_control(spark, df_adotados, path_control)
+        cronometro.marcar("gravação do controle")
+        print_summary(cronometro, contadores)
         spark.stop()
         return
 
-    # UDF para ler texto do GCS
-    def read_text(blob_path: str) -> str:
-        from google.cloud import storage as gcs_storage
-        try:
-            client2 = gcs_storage.Client()
-            bucket2 = client2.bucket(bucket)
-            blob2 = bucket2.blob(blob_path)
-            text = blob2.download_as_text(encoding="utf-8")
-            print(f"Lido com sucesso: {blob_path} ({len(text)} chars)")
-            return text
-        except Exception as e:
-            print(f"Erro ao ler {blob_path}: {e}")
-            return ""
-
-    read_udf = udf(read_text, StringType())
-    df_txt = df_to_process.withColumn("text", read_udf("blob_path"))
-    
-    print("Textos carregados, processando embeddings e classificações...")
-
-    # UDF para processar embedding e classificação
-    def compute_embedding_and_class(text: str) -> str:
-        if not text or len(text.strip()) == 0:
-            return json.dumps({
-                "classification": "sistema",
-                "embedding": [0.0] * 768
-            })
-        
-        print(f"Processando texto de {len(text)} caracteres...")
-        
-        # Obter embedding via Gemini
-        emb = get_gemini_embedding(text)
-        
-        # Classificar via Gemini
-        cls = classify_text(text)
-        
-        result = {
-            "classification": cls,
-            "embedding": emb
-        }
-        
-        print(f"Resultado: classificação={cls}, embedding_dim={len(emb)}")
-        
-        return json.dumps(result)
+    # Leitura, classificação e embeddings em um só estágio por partição: uma
+    # sessão HTTP por partição, embeddings em lote e classificações concorrentes
+    partitions = max(1, min(count_to_process, spark.sparkContext.defaultParallelism))
 
-    udf_emb_class = udf(compute_embedding_and_class, StringType())
-    df_res = df_txt.withColumn("out", udf_emb_class("text"))
+    def enrich(lotes):
+        return enrich_partition(lotes, gcs_reader(bucket), contadores)
 
-    # Separar colunas
-    def extract_cls(s: str) -> str:
-        try:
-            d = json.loads(s)
-            return d.get("classification", "sistema")
-        except:
-            return "sistema"
-    
-    def extract_emb_list(s: str) -> list:
-        try:
-            d = json.loads(s)
-            return d.get("embedding", [])
-        except:
-            return []
-
-    udf_cls = udf(extract_cls, StringType())
-    udf_emb = udf(extract_emb_list, ArrayType(FloatType()))
-
-    df_final = df_res \
-        .withColumn("classification", udf_cls("out")) \
-        .withColumn("embedding", udf_emb("out")) \
-        .select("file_name", "blob_path", "text", "classification", "embedding")
+    # A saída é gravada uma vez em Parquet e relida: as ações seguintes (count, show,
+    # controle, BigQuery) partem do staging e não chamam a API de novo
+    staging = f"{STAGING_PATH or f'gs://{bucket}/staging/embeddings'}/run={time.strftime('%Y%m%dT%H%M%S')}"
+    print(f"Processando embeddings e classificações, staging em {staging}...")
+    df_to_process.repartition(partitions).mapInPandas(enrich, SCHEMA_PASSAGENS) \
+        .write.mode("overwrite").parquet(staging)
+    cronometro.marcar("enriquecimento (API)")
+    df_final = spark.read.parquet(staging)
     
     final_count = df_final.count()
     print(f"DataFrame final: {final_count} linhas")
@@ -253,16 +523,20 @@ def main():
     print("Exemplos de resultados:")
     df_final.select("file_name", "classification").show(5, truncate=False)
     
-    # Gravar controle (file_name + classification + timestamp)
+    # Gravar controle (file_name + classification + timestamp + hash da origem), uma linha por documento;
+    # a ordem das colunas segue SCHEMA_CONTROLE
     df_ctrl_new = df_final.select(
         "file_name", 
         "classification",
-        current_timestamp().alias("processed_at")
-    )
+        "source_hash",
+    ).distinct().select(
+        "file_name", "classification", current_timestamp().cast("string").alias("processed_at"), "source_hash"
+    ).unionByName(df_adotados)
     
     print(f"Salvando controle com {df_ctrl_new.count()} registros...")
-    df_ctrl_new.write.mode("append").option("header", "true").csv(path_control)
+    append_control(spark, df_ctrl_new, path_control)
     print("Controle salvo!")
+    cronometro.marcar("gravação do controle")
 
     # Preparar dados para BigQuery
     # Converter embedding para string JSON
@@ -271,6 +545,11 @@ def main():
     df_to_bq = df_final.select(
         "file_name",
         "blob_path", 
+        "source_hash",
+        "id_passagem",
+        "indice",
+        "inicio",
+        "fim",
         "classification",
         to_json(col("embedding")).alias("embedding_json"),
         col("text").substr(1, 500).alias("text_preview")  # Preview dos primeiros 500 chars
@@ -294,12 +573,19 @@ def main():
             .save()
         
         print(f"✓ Dados gravados no BigQuery com sucesso!")
+        remove_path(spark, staging)
     except Exception as e:
         print(f"✗ Erro ao gravar no BigQuery: {e}")
+        # o staging fica para recarregar sem chamar a API de novo
+        print(f"Saída do enriquecimento mantida em {staging}")
+    cronometro.marcar("gravação no BigQuery")
 
+    print_summary(cronometro, contadores)
     spark.stop()
     print("Pipeline finalizado!")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--compact-control", action="store_true", help="só compacta a tabela de controle e sai")
+    main(compact_only=parser.parse_args().compact_control)
\ No newline at end of file
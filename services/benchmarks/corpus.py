@@ -0,0 +1,95 @@
+"""
+Corpus sintético para os benchmarks: artigos HTML no formato das páginas da
+base de conhecimento (conteúdo dentro de #kb-article) e tickets no formato
+das respostas do batch da OpenAI gravadas em /silverII/ (os campos do ticket
+vêm como JSON em tool_calls[0].function.arguments).
+"""
+import json
+import os
+import random
+
+PALAVRAS = (
+    "nota fiscal boleto cliente cadastro empresa imposto alíquota relatório financeiro pagamento "
+    "usuário sistema configuração emissão cancelamento produto estoque venda compra contrato "
+    "serviço legislação prazo arquivo xml certificado digital senha acesso tela erro módulo"
+).split()
+
+
+def frase(rng, minimo, maximo):
+    return " ".join(rng.choice(PALAVRAS) for _ in range(rng.randint(minimo, maximo)))
+
+
+def gerar_artigo(rng, i):
+    secoes = []
+    for s in range(rng.randint(2, 6)):
+        paragrafos = "".join(
+            "<p>" + " ".join(f"palavra{rng.randint(0, 5000)}" for _ in range(rng.randint(20, 120))) + "</p>\n"
+            for _ in range(rng.randint(1, 5))
+        )
+        itens = "".join(f"<li><p>passo {k} do procedimento {i}</p></li>" for k in range(rng.randint(0, 4)))
+        secoes.append(f"<h2>Seção {s} do artigo {i}</h2>\n{paragrafos}<ul>{itens}</ul>")
+    return (
+        f"<html><head><title>Artigo {i}</title></head><body><nav>menu</nav>"
+        f"<article id=\"kb-article\"><h1>Artigo {i}</h1>{''.join(secoes)}"
+        f"<div class=\"rating-box-form\">Este artigo foi útil?</div></article></body></html>"
+    )
+
+
+def gerar_ticket(rng, i):
+    argumentos = {
+        "pergunta_principal": f"Ticket {i}: " + frase(rng, 8, 25) + "?",
+        "analise_pergunta": frase(rng, 20, 80),
+        "orientacao_fornecida": frase(rng, 20, 120),
+        "status_resolucao": rng.choice(["resolvido", "parcialmente resolvido", "não resolvido"]),
+        "roteiro_resolucao": " ".join(f"{k}. {frase(rng, 5, 20)}." for k in range(1, rng.randint(2, 8))),
+    }
+    return {
+        "id": f"batch_req_{i}",
+        "custom_id": f"ticket-{i}",
+        "response": {
+            "status_code": 200,
+            "body": {
+                "model": "gpt-4o-mini",
+                "choices": [{
+                    "index": 0,
+                    "message": {
+                        "role": "assistant",
+                        "content": None,
+                        "tool_calls": [{
+                            "id": f"call_{i}",
+                            "type": "function",
+                            "function": {"name": "estruturar_ticket", "arguments": json.dumps(argumentos, ensure_ascii=False)},
+                        }],
+                    },
+                    "finish_reason": "tool_calls",
+                }],
+                "usage": {"prompt_tokens": rng.randint(300, 3000), "completion_tokens": rng.randint(100, 600)},
+            },
+        },
+        "error": None,
+    }
+
+
+def gerar_corpus(store, n, semente=42, prefixo="bronze/knowledge_base"):
+    """Grava `n` artigos em `store` (blob_store), um por pasta, como o bronze."""
+    rng = random.Random(semente)
+    for i in range(n):
+        store.gravar_texto(f"{prefixo}/artigo{i}/artigo{i}.html", gerar_artigo(rng, i))
+
+
+def gravar_artigos(pasta, n, semente=42):
+    """Grava `n` artigos como arquivos soltos em `pasta` (artigo{i}.html), para servir por HTTP."""
+    os.makedirs(pasta, exist_ok=True)
+    rng = random.Random(semente)
+    for i in range(n):
+        with open(os.path.join(pasta, f"artigo{i}.html"), "w", encoding="utf-8") as f:
+            f.write(gerar_artigo(rng, i))
+
+
+def gravar_tickets(pasta, n, semente=7):
+    """Grava `n` tickets em `pasta`, um JSON por arquivo, como em /silverII/."""
+    os.makedirs(pasta, exist_ok=True)
+    rng = random.Random(semente)
+    for i in range(n):
+        with open(os.path.join(pasta, f"ticket{i:06d}.json"), "w", encoding="utf-8") as f:
+            json.dump(gerar_ticket(rng, i), f, ensure_ascii=False)
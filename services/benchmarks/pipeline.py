@@ -0,0 +1,254 @@
+"""
+Benchmark de ponta a ponta do pipeline medalhão sobre um corpus sintético,
+com backends locais: a base de conhecimento é servida por um servidor HTTP
+local, o "bucket" é uma pasta (LocalStore), o Qdrant roda em memória e os
+embeddings saem do modelo mínimo (EMBEDDING_BACKEND=hash).
+
+Cada etapa roda em um processo novo (spawn), então o pico de RSS medido é só
+dela (incluindo os processos filhos que ela criar). O relatório JSON traz,
+por etapa, documentos, tempo de parede, documentos/s e pico de RSS, e pode
+ser comparado com o de outro commit via --comparar.
+
+Uso (a partir de services/):
+    python -m benchmarks.pipeline --artigos 500 --tickets 2000 --saida relatorio.json
+    python -m benchmarks.pipeline --artigos 500 --tickets 2000 --comparar relatorio_anterior.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+SERVICES = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _pico_rss_mb():
+    # ru_maxrss vem em KB no Linux; RUSAGE_CHILDREN cobre os pools de processos da etapa
+    proprio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(proprio, filhos) / 1024
+
+
+def _rodar_no_filho(etapa, pasta, parametros, ambiente, fila):
+    os.environ.update(ambiente)
+    inicio = time.perf_counter()
+    try:
+        documentos = ETAPAS[etapa](pasta, parametros)
+        erro = None
+    except Exception:
+        documentos, erro = 0, traceback.format_exc()
+    segundos = time.perf_counter() - inicio
+    fila.put({
+        "documentos": documentos,
+        "segundos": segundos,
+        "documentos_por_segundo": documentos / segundos if segundos else 0.0,
+        "pico_rss_mb": _pico_rss_mb(),
+        "erro": erro,
+    })
+
+
+def _servidor_kb(pasta_artigos, porta):
+    """Serve os artigos sintéticos como /kb/article/<id>/artigo<id>, com ETag fixo por arquivo."""
+    from aiohttp import web
+
+    async def artigo(request):
+        caminho = os.path.join(pasta_artigos, f"artigo{request.match_info['id']}.html")
+        if not os.path.exists(caminho):
+            return web.Response(status=404)
+        etag = f"\"{os.stat(caminho).st_mtime_ns}\""
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304)
+        with open(caminho, encoding="utf-8") as f:
+            return web.Response(text=f.read(), content_type="text/html", headers={"ETag": etag})
+
+    app = web.Application()
+    app.router.add_get("/kb/article/{id}/{titulo}", artigo)
+    web.run_app(app, host="127.0.0.1", port=porta, print=None)
+
+
+def etapa_bronze(pasta, parametros):
+    sys.path.insert(0, os.path.join(SERVICES, "bronze"))
+    import pandas as pd
+    import main as bronze
+    from common.blob_store import abrir_store
+
+    base = f"http://127.0.0.1:{parametros['porta']}/kb/article"
+    links = [f"{base}/{i}/artigo{i}" for i in range(parametros["artigos"])]
+    resumo = asyncio.run(bronze.get_html_pages(pd.DataFrame({"link": links}), abrir_store(bronze.BRONZE_STORAGE)))
+    return resumo["paginas"]
+
+
+def etapa_silver(pasta, parametros):
+    sys.path.insert(0, os.path.join(SERVICES, "silver"))
+    import main as silver
+    from common.blob_store import abrir_store
+
+    return silver.convert_html_blobs_to_txt(abrir_store(os.environ["SILVER_STORAGE"]), "bronze")["arquivos"]
+
+
+def etapa_gold_tickets(pasta, parametros):
+    sys.path.insert(0, os.path.join(SERVICES, "gold", "tickets"))
+    import tickets
+
+    return tickets.processar()
+
+
+def etapa_gold_snapshots(pasta, parametros):
+    sys.path.insert(0, os.path.join(SERVICES, "gold", "snapshots"))
+    import create_collection
+
+    return create_collection.main()["enviados"]
+
+
+ETAPAS = {
+    "bronze": etapa_bronze,
+    "silver": etapa_silver,
+    "gold_tickets": etapa_gold_tickets,
+    "gold_snapshots": etapa_gold_snapshots,
+}
+# o que cada etapa conta como "documento"
+UNIDADES = {"bronze": "páginas", "silver": "artigos", "gold_tickets": "tickets", "gold_snapshots": "pontos"}
+
+
+def ambiente_local(pasta, args):
+    """Variáveis que apontam cada etapa para os backends locais dentro de `pasta`."""
+    store = os.path.join(pasta, "bucket")
+    return {
+        "PYTHONUNBUFFERED": "1",
+        "BRONZE_STORAGE": store,
+        "SILVER_STORAGE": store,
+        "MAX_DOWNLOADS": "0",
+        "BRONZE_RATE_PER_HOST": "0",
+        "CHUNK_TOKENIZER": args.tokenizer,
+        "SILVER_PARSE_WORKERS": str(args.parse_workers),
+        "SILVER_HTML_PARSER": args.html_parser,
+        "SILVER_TICKETS_PATH": os.path.join(pasta, "silverII"),
+        "GOLD_PATH": os.path.join(pasta, "gold"),
+        "GOLD_REPORT_PATH": os.path.join(pasta, "goldII"),
+        "GOLD_MANIFEST_PATH": os.path.join(pasta, "gold", "manifest.json"),
+        "EMBEDDING_CACHE_PATH": os.path.join(pasta, "cache", "embeddings.sqlite"),
+        "EMBEDDING_BACKEND": "hash",
+        "QDRANT_URL": ":memory:",
+    }
+
+
+def rodar_etapa(etapa, pasta, parametros, ambiente, log):
+    contexto = multiprocessing.get_context("spawn")
+    fila = contexto.Queue()
+    # a saída da etapa vai para o log, para o relatório no terminal ficar legível
+    with open(log, "a", encoding="utf-8") as saida:
+        stdout, stderr = os.dup(1), os.dup(2)
+        os.dup2(saida.fileno(), 1)
+        os.dup2(saida.fileno(), 2)
+        try:
+            processo = contexto.Process(target=_rodar_no_filho, args=(etapa, pasta, parametros, ambiente, fila))
+            processo.start()
+            resultado = fila.get()
+            processo.join()
+        finally:
+            os.dup2(stdout, 1)
+            os.dup2(stderr, 2)
+            os.close(stdout)
+            os.close(stderr)
+    return resultado
+
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=SERVICES, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual, anterior):
+    """Imprime a variação de documentos/s e de pico de RSS por etapa em relação a outro relatório."""
+    print(f"\ncomparação com {anterior.get('commit')} ({anterior.get('gerado_em')}):")
+    for etapa, medida in atual["etapas"].items():
+        antes = anterior.get("etapas", {}).get(etapa)
+        if not antes or not antes["documentos_por_segundo"]:
+            print(f"  {etapa:<16} sem referência")
+            continue
+        vazao = medida["documentos_por_segundo"] / antes["documentos_por_segundo"] - 1
+        rss = medida["pico_rss_mb"] / antes["pico_rss_mb"] - 1
+        print(f"  {etapa:<16} docs/s {vazao:+7.1%} | pico RSS {rss:+7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--artigos", type=int, default=200)
+    parser.add_argument("--tickets", type=int, default=1000)
+    parser.add_argument("--etapas", default=",".join(ETAPAS), help="etapas a rodar, em ordem")
+    parser.add_argument("--tokenizer", default="", help="tokenizer do chunking do silver; vazio conta por palavras")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--html-parser", default="html.parser")
+    parser.add_argument("--porta", type=int, default=8766)
+    parser.add_argument("--pasta", help="pasta de trabalho, mantida no fim; rodar de novo na mesma pasta "
+                                        "mede a execução incremental. Padrão: temporária")
+    parser.add_argument("--saida", default="benchmark_pipeline.json")
+    parser.add_argument("--comparar", help="relatório JSON anterior para comparação")
+    args = parser.parse_args()
+
+    from benchmarks.corpus import gravar_artigos, gravar_tickets
+
+    temporaria = None if args.pasta else tempfile.TemporaryDirectory()
+    pasta = args.pasta or temporaria.name
+    log = os.path.join(pasta, "etapas.log")
+    parametros = {"artigos": args.artigos, "tickets": args.tickets, "porta": args.porta}
+    ambiente = ambiente_local(pasta, args)
+
+    print(f"gerando corpus: {args.artigos} artigos, {args.tickets} tickets em {pasta}")
+    gravar_artigos(os.path.join(pasta, "kb"), args.artigos)
+    gravar_tickets(ambiente["SILVER_TICKETS_PATH"], args.tickets)
+    os.makedirs(ambiente["GOLD_PATH"], exist_ok=True)
+    os.makedirs(os.path.dirname(ambiente["EMBEDDING_CACHE_PATH"]), exist_ok=True)
+
+    servidor = multiprocessing.get_context("spawn").Process(
+        target=_servidor_kb, args=(os.path.join(pasta, "kb"), args.porta), daemon=True,
+    )
+    servidor.start()
+    time.sleep(1)
+
+    relatorio = {
+        "gerado_em": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "commit": commit_atual(),
+        "parametros": vars(args),
+        "cpus": os.cpu_count(),
+        "etapas": {},
+    }
+    try:
+        for etapa in args.etapas.split(","):
+            resultado = rodar_etapa(etapa, pasta, parametros, ambiente, log)
+            resultado["unidade"] = UNIDADES[etapa]
+            relatorio["etapas"][etapa] = resultado
+            situacao = "ERRO (ver log)" if resultado["erro"] else "ok"
+            print(f"[{etapa}] {resultado['documentos']} {resultado['unidade']} em {resultado['segundos']:.2f}s "
+                  f"({resultado['documentos_por_segundo']:.1f} docs/s) | pico RSS {resultado['pico_rss_mb']:.0f} MB | "
+                  f"{situacao}")
+    finally:
+        servidor.terminate()
+    relatorio["total_segundos"] = sum(r["segundos"] for r in relatorio["etapas"].values())
+    print(f"total: {relatorio['total_segundos']:.2f}s | log das etapas: {log}")
+
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"relatório salvo em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(relatorio, json.load(f))
+    if temporaria is not None:
+        temporaria.cleanup()
+    sys.exit(1 if any(r["erro"] for r in relatorio["etapas"].values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
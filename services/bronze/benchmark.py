@@ -0,0 +1,128 @@
+"""
+Testa e mede o crawler do bronze contra um servidor aiohttp local que simula
+a base de conhecimento: latência por página, respostas 503/429 aleatórias e
+upload lento (bloqueante) para o bucket. Compara com o esquema antigo (sessão
+por URL, ondas de 50, retentativa imediata, upload no event loop) e confere
+que todas as páginas chegaram ao destino.
+
+Uso:
+    python bronze/benchmark.py --paginas 300 --latencia-ms 50 --taxa-erro 0.1
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import aiohttp
+from aiohttp import web
+
+from common.blob_store import LocalStore
+from crawler import Crawler
+
+
+class UploadLento:
+    """Store local que dorme em cada gravação, como o upload_from_string do GCS."""
+
+    def __init__(self, store, latencia_ms):
+        self.store = store
+        self.latencia = latencia_ms / 1000
+
+    def gravar_texto(self, nome, texto, content_type=None):
+        time.sleep(self.latencia)
+        self.store.gravar_texto(nome, texto, content_type)
+
+    def listar(self, prefixo):
+        return self.store.listar(prefixo)
+
+
+def criar_servidor(latencia_ms, taxa_erro, semente=7):
+    rng = random.Random(semente)
+
+    async def artigo(request):
+        await asyncio.sleep(latencia_ms / 1000)
+        sorteio = rng.random()
+        if sorteio < taxa_erro / 2:
+            return web.Response(status=503)
+        if sorteio < taxa_erro:
+            return web.Response(status=429, headers={"Retry-After": "0"})
+        id_artigo = request.match_info["id"]
+        corpo = f"<article id=\"kb-article\"><h1>Artigo {id_artigo}</h1>" + "<p>texto</p>" * 200 + "</article>"
+        return web.Response(text=corpo, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/kb/article/{id}", artigo)
+    return app
+
+
+async def ondas_antigas(itens, store):
+    """Reprodução do fluxo anterior, para comparação."""
+    async def um(url, blob_name):
+        async with aiohttp.ClientSession() as session:
+            erros = 0
+            while erros < 5:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        store.gravar_texto(blob_name, await response.text(), "text/html")
+                        return True
+                    erros += 1
+        return False
+
+    inicio = time.perf_counter()
+    ok = 0
+    for i in range(0, len(itens), 50):
+        ok += sum(await asyncio.gather(*(um(url, blob_name) for url, blob_name in itens[i:i + 50])))
+    return {"paginas": ok, "segundos": time.perf_counter() - inicio}
+
+
+async def rodar(args):
+    runner = web.AppRunner(criar_servidor(args.latencia_ms, args.taxa_erro))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.porta)
+    await site.start()
+    base = f"http://127.0.0.1:{args.porta}/kb/article"
+    itens = [(f"{base}/{i}", f"bronze/artigo{i}/artigo{i}.html") for i in range(args.paginas)]
+
+    try:
+        with tempfile.TemporaryDirectory() as pasta:
+            antigo = await ondas_antigas(itens, UploadLento(LocalStore(os.path.join(pasta, "antigo")), args.upload_ms))
+            print(f"[ondas de 50] {antigo['paginas']} páginas em {antigo['segundos']:.2f}s "
+                  f"({antigo['paginas'] / antigo['segundos']:.1f} páginas/s)")
+
+            destino = LocalStore(os.path.join(pasta, "novo"))
+            crawler = Crawler(
+                UploadLento(destino, args.upload_ms), concorrencia=args.concorrencia, por_host=args.por_host,
+                backoff_base=0.05, backoff_max=1,
+            )
+            resumo = await crawler.executar(itens)
+            print(f"[crawler] {resumo['paginas']} páginas em {resumo['segundos']:.2f}s "
+                  f"({resumo['paginas_por_segundo']:.1f} páginas/s) | retentativas: {resumo['retentativas']} | "
+                  f"status: {resumo['status']} | p50: {resumo['latencia_p50_ms']:.0f} ms | "
+                  f"p99: {resumo['latencia_p99_ms']:.0f} ms")
+
+            gravadas = len(destino.listar("bronze/"))
+            print(f"[conferência] {gravadas} de {len(itens)} páginas gravadas pelo crawler")
+            return gravadas == len(itens)
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paginas", type=int, default=300)
+    parser.add_argument("--latencia-ms", type=float, default=50)
+    parser.add_argument("--taxa-erro", type=float, default=0.1)
+    parser.add_argument("--upload-ms", type=float, default=20)
+    parser.add_argument("--concorrencia", type=int, default=32)
+    parser.add_argument("--por-host", type=float, default=0, help="requisições/s no host; 0 sem limite")
+    parser.add_argument("--porta", type=int, default=8765)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(rodar(args)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import aiohttp
+import numpy as np
+
+from common.crawl_state import hash_texto
+
+# respostas que valem nova tentativa; os demais 4xx são definitivos
+STATUS_RETENTAVEIS = {408, 425, 429, 500, 502, 503, 504}
+# a página saiu da base de conhecimento
+STATUS_REMOVIDOS = {404, 410}
+
+
+class LimitadorPorHost:
+    """Espaça o início das requisições a um mesmo host em pelo menos 1/`por_segundo` segundos."""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1 / por_segundo if por_segundo > 0 else 0
+        self._proximo = {}
+
+    async def aguardar(self, host):
+        if not self.intervalo:
+            return
+        agora = time.monotonic()
+        # reserva o próximo horário livre antes de dormir; sem await no meio, não há corrida
+        horario = max(agora, self._proximo.get(host, agora))
+        self._proximo[host] = horario + self.intervalo
+        if horario > agora:
+            await asyncio.sleep(horario - agora)
+
+
+class Metricas:
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.status = {}
+        self.tentativas = 0
+        self.retentativas = 0
+        # 304 do GET condicional e 200 com o mesmo hash já gravado
+        self.nao_modificadas = 0
+        self.inalteradas = 0
+        # 404/410 de páginas que o estado conhecia
+        self.removidas = 0
+        self.bytes = 0
+        self.latencias = []
+
+    def registrar(self, status, tamanho, latencia):
+        self.status[status] = self.status.get(status, 0) + 1
+        self.tentativas += 1
+        self.bytes += tamanho
+        self.latencias.append(latencia)
+
+    def resumo(self, paginas):
+        segundos = time.perf_counter() - self.inicio
+        latencias = np.array(self.latencias or [0.0]) * 1000
+        return {
+            "paginas": paginas,
+            "segundos": segundos,
+            "paginas_por_segundo": paginas / segundos if segundos else 0.0,
+            "mb_por_segundo": self.bytes / 1e6 / segundos if segundos else 0.0,
+            "tentativas": self.tentativas,
+            "retentativas": self.retentativas,
+            "nao_modificadas": self.nao_modificadas,
+            "inalteradas": self.inalteradas,
+            "removidas": self.removidas,
+            "status": self.status,
+            "latencia_p50_ms": float(np.percentile(latencias, 50)),
+            "latencia_p99_ms": float(np.percentile(latencias, 99)),
+        }
+
+
+def espera_backoff(tentativa, base, maximo, retry_after=None):
+    """Backoff exponencial com jitter completo; respeita o Retry-After do servidor quando vier."""
+    espera = random.uniform(0, min(maximo, base * 2 ** tentativa))
+    if retry_after is not None:
+        try:
+            espera = max(espera, float(retry_after))
+        except ValueError:
+            pass
+    return espera
+
+
+class Crawler:
+    """
+    Baixa páginas com uma única sessão HTTP (conexões reaproveitadas), no
+    máximo `concorrencia` downloads em voo, limite de taxa por host e
+    retentativas com backoff. O upload é bloqueante (cliente do GCS), então
+    roda em um pool de threads para não travar o event loop.
+
+    Com um `estado` (CrawlState), as requisições são condicionais e só é
+    gravado o que mudou de conteúdo; o estado é atualizado após cada upload.
+    Um 404/410 tira o link do estado, e os estágios seguintes removem a página.
+
+    `ao_concluir(blob_name, sha)`, se informado, é chamado para cada página
+    resolvida (gravada, inalterada ou 304) no pool de upload; se ele bloquear
+    (fila cheia adiante), os downloads param junto.
+    """
+
+    def __init__(self, store, concorrencia=32, por_host=10, max_tentativas=5, upload_workers=8,
+                 timeout=30, backoff_base=0.5, backoff_max=30, headers=None, estado=None, ao_concluir=None):
+        self.store = store
+        self.estado = estado
+        self.ao_concluir = ao_concluir
+        self.concorrencia = concorrencia
+        self.limitador = LimitadorPorHost(por_host)
+        self.max_tentativas = max_tentativas
+        self.upload_workers = upload_workers
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.headers = headers or {}
+        self.metricas = Metricas()
+
+    async def baixar(self, session, url, headers=None):
+        """
+        GET com retentativas. Devolve (status, html, headers da resposta); html é
+        None quando a página não veio (status definitivo ou tentativas esgotadas).
+        """
+        host = urlsplit(url).netloc
+        status, resposta_headers = None, {}
+        for tentativa in range(self.max_tentativas):
+            await self.limitador.aguardar(host)
+            t0 = time.perf_counter()
+            retry_after = None
+            try:
+                async with session.get(url, headers=headers) as response:
+                    status, resposta_headers = response.status, response.headers
+                    corpo = await response.read() if status == 200 else b""
+                    self.metricas.registrar(status, len(corpo), time.perf_counter() - t0)
+                    if status == 200:
+                        return status, corpo.decode(response.charset or "utf-8", errors="replace"), resposta_headers
+                    if status not in STATUS_RETENTAVEIS:
+                        # inclui o 304 do GET condicional
+                        return status, None, resposta_headers
+                    retry_after = response.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = type(e).__name__
+                self.metricas.registrar(status, 0, time.perf_counter() - t0)
+
+            if tentativa + 1 < self.max_tentativas:
+                self.metricas.retentativas += 1
+                await asyncio.sleep(espera_backoff(tentativa, self.backoff_base, self.backoff_max, retry_after))
+        print(f"Error: {status} - {url} (desistindo após {self.max_tentativas} tentativas)")
+        return status, None, resposta_headers
+
+    async def _processar(self, session, janela, executor, url, blob_name):
+        condicionais = self.estado.cabecalhos_condicionais(url) if self.estado is not None else None
+        async with janela:
+            status, html, headers = await self.baixar(session, url, condicionais)
+        loop = asyncio.get_running_loop()
+        if status == 304:
+            self.metricas.nao_modificadas += 1
+            await self._concluir(loop, executor, blob_name, self.estado.links[url]["sha256"])
+            return False
+        if html is None:
+            if status in STATUS_REMOVIDOS and self.estado is not None and url in self.estado.links:
+                self.estado.esquecer(url)
+                self.metricas.removidas += 1
+            return False
+
+        sha = hash_texto(html)
+        if self.estado is not None and not self.estado.alterado(url, sha):
+            # mesmo conteúdo (ex.: servidor sem validadores); só renova ETag/Last-Modified
+            self.estado.registrar(url, blob_name, sha, headers)
+            self.metricas.inalteradas += 1
+            await self._concluir(loop, executor, blob_name, sha)
+            return False
+
+        await loop.run_in_executor(executor, self.store.gravar_texto, blob_name, html, "text/html")
+        # o estado só muda depois do upload, para uma falha não esconder a página na próxima execução
+        if self.estado is not None:
+            self.estado.registrar(url, blob_name, sha, headers)
+        print(f"[OK] Upload concluído: {blob_name}")
+        await self._concluir(loop, executor, blob_name, sha)
+        return True
+
+    async def _concluir(self, loop, executor, blob_name, sha):
+        if self.ao_concluir is not None:
+            await loop.run_in_executor(executor, self.ao_concluir, blob_name, sha)
+
+    async def executar(self, itens):
+        """Baixa e grava cada (url, blob_name); devolve o resumo das métricas."""
+        conector = aiohttp.TCPConnector(limit=self.concorrencia)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        # janela deslizante: um download termina, o próximo entra, sem esperar a "onda" inteira
+        janela = asyncio.Semaphore(self.concorrencia)
+        self.metricas = Metricas()
+        with ThreadPoolExecutor(max_workers=self.upload_workers) as executor:
+            async with aiohttp.ClientSession(connector=conector, timeout=timeout, headers=self.headers) as session:
+                resultados = await asyncio.gather(
+                    *(self._processar(session, janela, executor, url, blob_name) for url, blob_name in itens),
+                    return_exceptions=True,
+                )
+        for (url, _), resultado in zip(itens, resultados):
+            if isinstance(resultado, Exception):
+                print(f"Error: {url} - {resultado}")
+        return self.metricas.resumo(sum(1 for r in resultados if r is True))
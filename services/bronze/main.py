@@ -1,18 +1,27 @@
-import requests, tqdm, os
+import requests, os
 from bs4 import BeautifulSoup
 import pandas as pd
 import asyncio
-import aiohttp
 import nest_asyncio
-from google.cloud import storage
+from common.blob_store import abrir_store
+from common.crawl_state import CrawlState
+from crawler import Crawler
 
 get_headers = { "User-Agent": "Mozilla/5.0" }
 
-storage_client = storage.Client()
 bucket_name = os.getenv("BUCKET_NAME", "pdm-2025-knowledge-base")
-bucket = storage_client.bucket(bucket_name)
+# gs://bucket ou uma pasta local com a mesma estrutura
+BRONZE_STORAGE = os.getenv("BRONZE_STORAGE", f"gs://{bucket_name}")
 
 MAX_DOWNLOADS = int(os.getenv("MAX_DOWNLOADS", "10")) 
+# downloads simultâneos, requisições por segundo em um mesmo host e tentativas por página
+BRONZE_CONCURRENCY = int(os.getenv("BRONZE_CONCURRENCY", "32"))
+BRONZE_RATE_PER_HOST = float(os.getenv("BRONZE_RATE_PER_HOST", "10"))
+BRONZE_MAX_RETRIES = int(os.getenv("BRONZE_MAX_RETRIES", "5"))
+BRONZE_UPLOAD_WORKERS = int(os.getenv("BRONZE_UPLOAD_WORKERS", "8"))
+BRONZE_TIMEOUT = float(os.getenv("BRONZE_TIMEOUT", "30"))
+# revalida as páginas já baixadas; "false" volta a pular tudo que já está no bucket
+BRONZE_RECRAWL = os.getenv("BRONZE_RECRAWL", "true").lower() == "true"
 
 get_headers = { "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"}
 
@@ -52,49 +61,66 @@ def get_all_links_from_knowledge_base():
     )
 
 
-async def fetch_and_upload_html(url, blob_name):
-    """Baixa HTML e envia para o bucket, se ainda não existir"""
-    blob = bucket.blob(blob_name)
-
-    if blob.exists(): 
-        print(f"[SKIP] Já existe no bucket: {blob_name}")
-        return
-
-    async with aiohttp.ClientSession() as session:
-        erros = 0
-        while erros < 5:
-            async with session.get(url, headers=get_headers) as response:
-                if response.status == 200:
-                    html = await response.text()
-                    blob.upload_from_string(html, content_type="text/html")
-                    print(f"[OK] Upload concluído: {blob_name}")
-                    return
-                else:
-                    erros += 1
-                    print(f"Error: {response.status} - {url}")
-
-
-async def get_html_pages(df, bucket_folder="bronze"):
-    tasks = []
-    total_downloads = 0
-
-    for title, link in zip(df["title"], df["link"]):
-        file_name = "".join([c for c in link if c.isalnum() or c in ['-', '_']])
-        blob_name = f"bronze/{file_name}/{file_name}.html"
-
-        if MAX_DOWNLOADS > 0 and total_downloads >= MAX_DOWNLOADS:
+def nome_do_blob(link):
+    file_name = "".join([c for c in link if c.isalnum() or c in ['-', '_']])
+    return f"bronze/{file_name}/{file_name}.html"
+
+
+async def get_html_pages(df, store, bucket_folder="bronze", ao_concluir=None):
+    """
+    Baixa as páginas novas e, com BRONZE_RECRAWL, revalida as que já estão no
+    bucket com GETs condicionais (ETag/Last-Modified), regravando só as que
+    mudaram de conteúdo. A listagem do bronze é feita uma vez só, em vez de um
+    exists() por página. `ao_concluir(blob_name, sha)` recebe cada página
+    resolvida (ver Crawler). Links que saíram da lista (ou deram 404/410)
+    saem do estado do crawl.
+    """
+    existentes = set(store.listar(f"{bucket_folder}/"))
+    estado = CrawlState(store)
+    links_atuais = set(df["link"])
+    # lista vazia é mais provável ser falha na listagem do que a base inteira removida
+    fora_da_lista = [link for link in estado.links if link not in links_atuais] if links_atuais else []
+    for link in fora_da_lista:
+        estado.esquecer(link)
+    itens = []
+    for link in df["link"]:
+        blob_name = nome_do_blob(link)
+        if blob_name in existentes and not BRONZE_RECRAWL:
+            continue
+        if blob_name not in existentes:
+            # sem o blob, os validadores antigos levariam a um 304 e a página nunca voltaria
+            estado.esquecer(link)
+        if MAX_DOWNLOADS > 0 and len(itens) >= MAX_DOWNLOADS:
             print(f"[INFO] Limite de {MAX_DOWNLOADS} downloads atingido.")
             break
-
-        tasks.append(fetch_and_upload_html(link, blob_name))
-        total_downloads += 1
-
-        if len(tasks) >= 50:
-            await asyncio.gather(*tasks)
-            tasks = []
-
-    if tasks:
-        await asyncio.gather(*tasks)
+        itens.append((link, blob_name))
+    revalidar = sum(blob_name in existentes for _, blob_name in itens)
+    print(f"[INFO] {revalidar} páginas para revalidar, {len(itens) - revalidar} novas, "
+          f"{len(fora_da_lista)} fora da lista de links")
+
+    crawler = Crawler(
+        store,
+        concorrencia=BRONZE_CONCURRENCY,
+        por_host=BRONZE_RATE_PER_HOST,
+        max_tentativas=BRONZE_MAX_RETRIES,
+        upload_workers=BRONZE_UPLOAD_WORKERS,
+        timeout=BRONZE_TIMEOUT,
+        headers=get_headers,
+        estado=estado,
+        ao_concluir=ao_concluir,
+    )
+    try:
+        resumo = await crawler.executar(itens)
+    finally:
+        # silver e gold leem os hashes daqui para saber o que mudou
+        estado.save()
+    print(f"[INFO] {resumo['paginas']} páginas em {resumo['segundos']:.2f}s "
+          f"({resumo['paginas_por_segundo']:.1f} páginas/s, {resumo['mb_por_segundo']:.2f} MB/s) | "
+          f"tentativas: {resumo['tentativas']} | retentativas: {resumo['retentativas']} | "
+          f"não modificadas: {resumo['nao_modificadas']} | inalteradas: {resumo['inalteradas']} | "
+          f"removidas: {resumo['removidas']} | "
+          f"status: {resumo['status']} | p50: {resumo['latencia_p50_ms']:.0f} ms | p99: {resumo['latencia_p99_ms']:.0f} ms")
+    return resumo
 
 
 if __name__ == "__main__":
@@ -102,4 +128,4 @@ if __name__ == "__main__":
     knowledge_df = get_all_links_from_knowledge_base()
     print("[bronze knowledge_base] - Total de documentos encontrados: ", len(knowledge_df))
     nest_asyncio.apply()
-    asyncio.run(get_html_pages(df=knowledge_df, bucket_folder="bronze"))
+    asyncio.run(get_html_pages(df=knowledge_df, store=abrir_store(BRONZE_STORAGE), bucket_folder="bronze"))
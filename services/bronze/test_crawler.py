@@ -0,0 +1,138 @@
+"""
+Testes do Crawler contra um servidor aiohttp local (aiohttp.test_utils):
+Retry-After no 429, GET condicional com 304 e o limite de downloads em voo.
+
+Uso (a partir de services/):
+    PYTHONPATH=. python -m pytest bronze
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from common.blob_store import LocalStore
+from common.crawl_state import CrawlState, hash_texto
+from crawler import Crawler
+
+HTML = "<html><body><article id='kb-article'>conteúdo</article></body></html>"
+
+
+def rodar(app, crawler, caminhos, rodadas=1, entre=None):
+    """
+    Sobe o servidor e roda o crawler `rodadas` vezes sobre (caminho, blob);
+    devolve os resumos. `entre()` roda entre uma rodada e a seguinte.
+    """
+    async def cenario():
+        async with TestServer(app) as servidor:
+            itens = [(str(servidor.make_url(caminho)), blob) for caminho, blob in caminhos]
+            resumos = []
+            for rodada in range(rodadas):
+                if rodada and entre is not None:
+                    entre()
+                resumos.append(await crawler.executar(itens))
+            return resumos
+    return asyncio.run(cenario())
+
+
+def test_429_espera_o_retry_after(tmp_path):
+    pedidos = []
+
+    async def pagina(request):
+        pedidos.append(time.monotonic())
+        if len(pedidos) == 1:
+            return web.Response(status=429, headers={"Retry-After": "0.3"})
+        return web.Response(text=HTML, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/artigo", pagina)
+    store = LocalStore(str(tmp_path))
+    # sem o Retry-After o backoff seria de no máximo 1 ms
+    crawler = Crawler(store, por_host=0, backoff_base=0.001, backoff_max=0.001)
+
+    resumo, = rodar(app, crawler, [("/artigo", "bronze/artigo.html")])
+
+    assert len(pedidos) == 2
+    assert pedidos[1] - pedidos[0] >= 0.3
+    assert resumo["paginas"] == 1
+    assert resumo["retentativas"] == 1
+    assert resumo["status"] == {429: 1, 200: 1}
+    assert store.ler_texto("bronze/artigo.html") == HTML
+
+
+def test_recrawl_condicional_recebe_304(tmp_path):
+    condicionais = []
+
+    async def pagina(request):
+        condicionais.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return web.Response(status=304)
+        return web.Response(text=HTML, content_type="text/html", headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/artigo", pagina)
+    store = LocalStore(str(tmp_path))
+    estado = CrawlState(store)
+    concluidos = []
+    crawler = Crawler(store, por_host=0, estado=estado, ao_concluir=lambda blob, sha: concluidos.append((blob, sha)))
+
+    primeiro, segundo = rodar(app, crawler, [("/artigo", "bronze/artigo.html")], rodadas=2)
+
+    assert condicionais == [None, '"v1"']
+    assert primeiro["paginas"] == 1
+    assert segundo["paginas"] == 0
+    assert segundo["nao_modificadas"] == 1
+    assert segundo["status"] == {304: 1}
+    # a página não modificada segue adiante com o hash já conhecido
+    assert concluidos == [("bronze/artigo.html", hash_texto(HTML))] * 2
+
+
+def test_limite_de_downloads_em_voo(tmp_path):
+    em_voo = {"atual": 0, "maximo": 0}
+
+    async def pagina(request):
+        em_voo["atual"] += 1
+        em_voo["maximo"] = max(em_voo["maximo"], em_voo["atual"])
+        await asyncio.sleep(0.05)
+        em_voo["atual"] -= 1
+        return web.Response(text=HTML, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_get("/artigo/{id}", pagina)
+    store = LocalStore(str(tmp_path))
+    crawler = Crawler(store, concorrencia=3, por_host=0)
+
+    resumo, = rodar(app, crawler, [(f"/artigo/{i}", f"bronze/artigo{i}.html") for i in range(20)])
+
+    assert resumo["paginas"] == 20
+    assert em_voo["maximo"] == 3
+
+
+def test_404_tira_a_pagina_do_estado(tmp_path):
+    removida = {"valor": False}
+
+    async def pagina(request):
+        if removida["valor"]:
+            return web.Response(status=404)
+        return web.Response(text=HTML, content_type="text/html", headers={"ETag": '"v1"'})
+
+    app = web.Application()
+    app.router.add_get("/artigo", pagina)
+    store = LocalStore(str(tmp_path))
+    estado = CrawlState(store)
+    crawler = Crawler(store, por_host=0, estado=estado)
+
+    def remover():
+        assert len(estado.links) == 1
+        removida["valor"] = True
+
+    # o link é revalidado depois de a página sair da base
+    _, segundo = rodar(app, crawler, [("/artigo", "bronze/artigo.html")], rodadas=2, entre=remover)
+
+    assert segundo["removidas"] == 1
+    assert segundo["status"] == {404: 1}
+    assert estado.links == {}
@@ -0,0 +1,76 @@
+"""
+Compara o backend ONNX com o PyTorch: verifica a paridade dos embeddings
+densos (similaridade de cosseno mínima entre as duas saídas) e mede o
+throughput de cada um. Sai com código 1 se a paridade ficar abaixo do limite.
+
+Uso:
+    python -m common.benchmark_backends --limite-cosseno 0.99 --int8
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from common import embedding_backend
+from common.embedding_backend import OnnxBGEM3, carregar_modelo
+
+MODEL_NAME = "davidoneil/bge-m3-ft-corpus-pt"
+
+TEXTOS = [
+    "Como emitir uma nota fiscal de serviço?",
+    "Erro ao gerar boleto: cliente sem endereço cadastrado.",
+    "Qual a alíquota de ICMS para venda interestadual de mercadorias?",
+    "O relatório financeiro não mostra os pagamentos do mês anterior.",
+    "Para cadastrar um novo usuário acesse Configurações > Usuários e clique em Novo.",
+    "A legislação exige que o XML da NF-e seja guardado por cinco anos.",
+]
+
+
+def medir(nome, modelo, textos, batch_size, max_length, repeticoes):
+    modelo.encode(textos[:batch_size], batch_size=batch_size, max_length=max_length)
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        modelo.encode(textos, batch_size=batch_size, max_length=max_length)
+    duracao = time.perf_counter() - inicio
+    print(f"[{nome}] {len(textos) * repeticoes / duracao:.1f} textos/s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limite-cosseno", type=float, default=0.99)
+    parser.add_argument("--int8", action="store_true", help="compara também o modelo int8")
+    parser.add_argument("--cache-dir", default="/cache/flag_model")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--n-textos", type=int, default=64)
+    args = parser.parse_args()
+
+    # em CPU o fp16 não acelera, então a referência roda em fp32
+    referencia = carregar_modelo(MODEL_NAME, args.cache_dir, backend="torch", use_fp16=False)
+    candidatos = {"onnx": OnnxBGEM3(embedding_backend.ONNX_MODEL_DIR)}
+    if args.int8:
+        candidatos["onnx int8"] = OnnxBGEM3(embedding_backend.ONNX_MODEL_DIR, quantizado=True)
+
+    esperado = referencia.encode(TEXTOS, max_length=args.max_length)["dense_vecs"]
+    ok = True
+    for nome, modelo in candidatos.items():
+        obtido = modelo.encode(TEXTOS, max_length=args.max_length)["dense_vecs"]
+        # os dois já saem normalizados
+        cossenos = np.sum(esperado * obtido, axis=1)
+        passou = cossenos.min() >= args.limite_cosseno
+        ok = ok and passou
+        print(f"[{nome}] cosseno mínimo: {cossenos.min():.5f} | médio: {cossenos.mean():.5f} | "
+              f"{'OK' if passou else 'ABAIXO DO LIMITE'}")
+
+    textos = [TEXTOS[i % len(TEXTOS)] + f" ({i})" for i in range(args.n_textos)]
+    medir("torch", referencia, textos, args.batch_size, args.max_length, args.repeticoes)
+    for nome, modelo in candidatos.items():
+        medir(nome, modelo, textos, args.batch_size, args.max_length, args.repeticoes)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import os
+
+# conexões HTTP mantidas pelo cliente do GCS; deve acompanhar o número de threads de I/O
+GCS_POOL_SIZE = int(os.getenv("GCS_POOL_SIZE", "32"))
+
+
+class GCSStore:
+    """Acesso ao bucket do GCS pelas operações que os estágios usam."""
+
+    def __init__(self, bucket_name, pool_size=GCS_POOL_SIZE):
+        from google.cloud import storage
+        from requests.adapters import HTTPAdapter
+
+        self.client = storage.Client()
+        # o padrão do requests é 10 conexões, pouco para um pool de threads maior
+        self.client._http.mount("https://", HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size))
+        self.bucket_name = bucket_name
+        self.bucket = self.client.bucket(bucket_name)
+
+    def listar(self, prefixo):
+        return [blob.name for blob in self.client.list_blobs(self.bucket_name, prefix=prefixo)]
+
+    def ler_texto(self, nome):
+        return self.bucket.blob(nome).download_as_text(encoding="utf-8")
+
+    def gravar_texto(self, nome, texto, content_type="text/plain; charset=utf-8"):
+        self.bucket.blob(nome).upload_from_string(texto, content_type=content_type)
+
+    def existe(self, nome):
+        return self.bucket.blob(nome).exists()
+
+    def __str__(self):
+        return f"gs://{self.bucket_name}"
+
+
+class LocalStore:
+    """Mesma interface do GCSStore sobre uma pasta local, para rodar e medir offline."""
+
+    def __init__(self, raiz):
+        self.raiz = raiz
+
+    def _path(self, nome):
+        return os.path.join(self.raiz, nome)
+
+    def listar(self, prefixo):
+        nomes = []
+        for pasta, _, arquivos in os.walk(self.raiz):
+            for arquivo in arquivos:
+                nome = os.path.relpath(os.path.join(pasta, arquivo), self.raiz).replace(os.sep, "/")
+                if nome.startswith(prefixo) and not nome.endswith(".tmp"):
+                    nomes.append(nome)
+        return sorted(nomes)
+
+    def ler_texto(self, nome):
+        with open(self._path(nome), "r", encoding="utf-8") as f:
+            return f.read()
+
+    def gravar_texto(self, nome, texto, content_type=None):
+        path = self._path(nome)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(texto)
+        os.replace(path + ".tmp", path)
+
+    def existe(self, nome):
+        return os.path.exists(self._path(nome))
+
+    def __str__(self):
+        return self.raiz
+
+
+def abrir_store(destino):
+    """`gs://bucket` abre o bucket no GCS; qualquer outro valor é uma pasta local."""
+    if destino.startswith("gs://"):
+        return GCSStore(destino[len("gs://"):].strip("/"))
+    return LocalStore(destino)
@@ -0,0 +1,172 @@
+import re
+
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+
+TAGS_TITULO = ("h1", "h2", "h3", "h4", "h5", "h6")
+TAGS_BLOCO = TAGS_TITULO + ("p", "li", "pre", "blockquote", "tr")
+# tags que não são blocos mas separam o texto solto em volta (o que não está aqui é inline: a, span, strong...)
+TAGS_QUEBRA = (
+    "div", "section", "article", "header", "footer", "aside", "nav", "main", "figure", "figcaption", "form",
+    "ul", "ol", "dl", "dt", "dd", "table", "thead", "tbody", "tfoot", "caption", "td", "th", "br", "hr",
+)
+SEPARADOR_BLOCOS = "\n\n"
+
+
+def _normalizar(texto):
+    return " ".join(texto.split())
+
+
+def _percorrer(no, blocos, solto):
+    """Blocos de `no` em ordem; o texto fora de blocos se acumula em `solto` até a próxima quebra."""
+    for filho in no.children:
+        if isinstance(filho, Tag):
+            if filho.name in TAGS_BLOCO:
+                _fechar_solto(blocos, solto)
+                # um <p> dentro de um <li> já entra no texto do <li>
+                texto = _normalizar(filho.get_text(" ", strip=True))
+                if texto:
+                    blocos.append((filho.name in TAGS_TITULO, texto))
+            elif filho.name in TAGS_QUEBRA:
+                _fechar_solto(blocos, solto)
+                _percorrer(filho, blocos, solto)
+                _fechar_solto(blocos, solto)
+            else:
+                _percorrer(filho, blocos, solto)
+        elif type(filho) in (NavigableString, CData):
+            # comentários, scripts e estilos ficam de fora, como no get_text()
+            solto.append(str(filho))
+
+
+def _fechar_solto(blocos, solto):
+    texto = _normalizar("".join(solto))
+    if texto:
+        blocos.append((False, texto))
+    solto.clear()
+
+
+def extrair_blocos(html_content, parser="html.parser"):
+    """
+    Extrai do artigo (`article#kb-article`) a sequência de blocos
+    [(eh_titulo, texto)] na ordem do documento: títulos e parágrafos, itens de
+    lista, linhas de tabela etc., com o espaço em branco normalizado. O texto
+    fora dessas tags (solto em <div>, <span>, <td> sem <tr>, ao lado de um
+    <p>...) vira um bloco próprio, então nada do get_text() do artigo se perde.
+    `parser="lxml"` é bem mais rápido e, com o espaço normalizado por bloco,
+    chega ao mesmo texto em HTML bem formado.
+    """
+    soup = BeautifulSoup(html_content, parser)
+    artigo = soup.find('article', {'id': 'kb-article'})
+    if artigo is None:
+        return []
+    for sub in artigo.find_all('div', {'class': 'rating-box-form'}):
+        sub.decompose()
+
+    if artigo.find(TAGS_BLOCO) is None:
+        # artigo sem marcação de blocos: cai nos parágrafos separados por linha em branco
+        return blocos_do_texto(artigo.get_text())
+
+    blocos = []
+    solto = []
+    _percorrer(artigo, blocos, solto)
+    _fechar_solto(blocos, solto)
+    return blocos
+
+
+def blocos_do_texto(texto):
+    """Blocos de um texto simples: um por linha não vazia, sem títulos."""
+    return [(False, " ".join(linha.split())) for linha in texto.splitlines() if linha.strip()]
+
+
+def texto_do_documento(blocos):
+    """Texto corrido do documento; os offsets das passagens apontam para ele."""
+    return SEPARADOR_BLOCOS.join(texto for _, texto in blocos)
+
+
+def tokens_por_palavra(texto):
+    """Tokenização aproximada por palavras: devolve os spans (inicio, fim) de cada token."""
+    return [m.span() for m in re.finditer(r"\S+", texto)]
+
+
+def tokenizador_hf(tokenizer):
+    """Adapta um tokenizer rápido do transformers para devolver spans de caracteres."""
+    def tokenizar(texto):
+        saida = tokenizer(texto, add_special_tokens=False, return_offsets_mapping=True, truncation=False)
+        return [span for span in saida["offset_mapping"] if span[1] > span[0]]
+    return tokenizar
+
+
+def _secoes(blocos):
+    """Agrupa os blocos em seções: cada título abre uma seção nova."""
+    secoes = []
+    titulo = None
+    atual = []
+    for indice, (eh_titulo, texto) in enumerate(blocos):
+        if eh_titulo and atual:
+            secoes.append((titulo, atual))
+            atual = []
+        if eh_titulo:
+            titulo = texto
+        atual.append(indice)
+    if atual:
+        secoes.append((titulo, atual))
+    return secoes
+
+
+def _janelas(n_tokens, fronteiras, tamanho, sobreposicao):
+    """
+    Janelas [inicio, fim) de até `tamanho` tokens. Sempre que possível a janela
+    termina numa fronteira de bloco (desde que não fique com menos da metade do
+    tamanho); a próxima começa `sobreposicao` tokens antes do fim da anterior.
+    """
+    inicio = 0
+    while inicio < n_tokens:
+        fim = min(inicio + tamanho, n_tokens)
+        if fim < n_tokens:
+            candidatas = [f for f in fronteiras if inicio + tamanho // 2 <= f <= fim]
+            if candidatas:
+                fim = candidatas[-1]
+        yield inicio, fim
+        if fim >= n_tokens:
+            return
+        inicio = max(fim - sobreposicao, inicio + 1)
+
+
+def dividir_em_passagens(blocos, id_documento, tamanho=256, sobreposicao=32, tokenizar=tokens_por_palavra):
+    """
+    Divide o documento em passagens de até `tamanho` tokens, com `sobreposicao`
+    tokens repetidos entre passagens vizinhas da mesma seção. Uma passagem nunca
+    atravessa um título. Cada passagem traz o id do documento de origem e os
+    offsets [inicio, fim) no texto de `texto_do_documento(blocos)`.
+    """
+    if sobreposicao >= tamanho:
+        raise ValueError("a sobreposição precisa ser menor que o tamanho da passagem")
+
+    documento = texto_do_documento(blocos)
+    # offset de cada bloco no texto do documento
+    offsets = []
+    posicao = 0
+    for _, texto in blocos:
+        offsets.append(posicao)
+        posicao += len(texto) + len(SEPARADOR_BLOCOS)
+
+    passagens = []
+    for titulo, indices in _secoes(blocos):
+        spans = []
+        fronteiras = []
+        for i in indices:
+            fronteiras.append(len(spans))
+            spans.extend((offsets[i] + a, offsets[i] + b) for a, b in tokenizar(blocos[i][1]))
+        for inicio, fim in _janelas(len(spans), fronteiras[1:], tamanho, sobreposicao):
+            char_inicio, char_fim = spans[inicio][0], spans[fim - 1][1]
+            indice = len(passagens)
+            passagens.append({
+                "id_passagem": f"{id_documento}#{indice}",
+                "id_documento": id_documento,
+                "indice": indice,
+                "titulo": titulo,
+                "inicio": char_inicio,
+                "fim": char_fim,
+                "tokens": fim - inicio,
+                "texto": documento[char_inicio:char_fim],
+            })
+    return passagens
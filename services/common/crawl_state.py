@@ -0,0 +1,72 @@
+import datetime
+import hashlib
+import json
+
+# estados gravados no próprio bucket, ao lado dos dados de cada estágio
+ESTADO_BRONZE = "bronze/_crawl_state.json"
+ESTADO_SILVER = "silver/_silver_state.json"
+
+
+def hash_texto(texto):
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def ler_json(store, nome, padrao):
+    if not store.existe(nome):
+        return padrao
+    return json.loads(store.ler_texto(nome))
+
+
+def gravar_json(store, nome, dados):
+    store.gravar_texto(nome, json.dumps(dados, ensure_ascii=False), content_type="application/json")
+
+
+class CrawlState:
+    """
+    Estado do crawler por link: blob de destino, ETag, Last-Modified e hash do
+    conteúdo gravado. Os validadores permitem GETs condicionais; o hash
+    detecta mudança de fato quando o servidor não manda validadores (ou manda
+    um ETag novo para o mesmo conteúdo). Os estágios seguintes leem o hash de
+    cada blob para saber o que mudou.
+    """
+
+    def __init__(self, store, nome=ESTADO_BRONZE):
+        self.store = store
+        self.nome = nome
+        self.links = ler_json(store, nome, {})
+
+    def cabecalhos_condicionais(self, url):
+        registro = self.links.get(url, {})
+        headers = {}
+        if registro.get("etag"):
+            headers["If-None-Match"] = registro["etag"]
+        if registro.get("last_modified"):
+            headers["If-Modified-Since"] = registro["last_modified"]
+        return headers
+
+    def alterado(self, url, sha):
+        return self.links.get(url, {}).get("sha256") != sha
+
+    def registrar(self, url, blob_name, sha, headers):
+        """Atualiza os validadores do link; marca `alterado_em` quando o conteúdo mudou."""
+        agora = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        registro = self.links.get(url, {})
+        if registro.get("sha256") != sha:
+            registro["alterado_em"] = agora
+        registro.update({
+            "blob": blob_name,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "sha256": sha,
+            "verificado_em": agora,
+        })
+        self.links[url] = registro
+
+    def esquecer(self, url):
+        self.links.pop(url, None)
+
+    def hashes_por_blob(self):
+        return {registro["blob"]: registro["sha256"] for registro in self.links.values()}
+
+    def save(self):
+        gravar_json(self.store, self.nome, self.links)
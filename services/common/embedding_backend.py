@@ -0,0 +1,205 @@
+import os
+import re
+import zlib
+
+import numpy as np
+
+# "torch" usa o BGEM3FlagModel; "onnx" usa o modelo exportado por common/export_onnx.py;
+# "hash" é um modelo mínimo, sem download, para benchmarks e testes do pipeline
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "/cache/onnx/bge-m3")
+# usa model_int8.onnx (quantização dinâmica) em vez de model.onnx
+ONNX_QUANTIZED = os.getenv("ONNX_QUANTIZED", "false").lower() == "true"
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))
+# em máquinas só com CPU o fp16 não acelera o PyTorch
+EMBEDDING_USE_FP16 = os.getenv("EMBEDDING_USE_FP16", "true").lower() == "true"
+HASH_EMBEDDING_DIM = int(os.getenv("HASH_EMBEDDING_DIM", "384"))
+
+
+def _normalizar(x, eixo=-1):
+    return x / np.linalg.norm(x, axis=eixo, keepdims=True).clip(min=1e-12)
+
+
+class OnnxBGEM3:
+    """
+    BGE-M3 rodando no ONNX Runtime em CPU, com a mesma interface de encode do
+    BGEM3FlagModel. O grafo ONNX devolve só o last_hidden_state; as cabeças
+    esparsa e ColBERT são duas camadas lineares aplicadas aqui em numpy.
+    """
+
+    def __init__(self, model_dir, quantizado=False, intra_op_threads=0):
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        arquivo = "model_int8.onnx" if quantizado else "model.onnx"
+        self.model_path = os.path.join(model_dir, arquivo)
+        self.session = self._criar_sessao(intra_op_threads)
+
+        self.sparse_w = np.load(os.path.join(model_dir, "sparse_linear_weight.npy"))
+        self.sparse_b = np.load(os.path.join(model_dir, "sparse_linear_bias.npy"))
+        self.colbert_w = np.load(os.path.join(model_dir, "colbert_linear_weight.npy"))
+        self.colbert_b = np.load(os.path.join(model_dir, "colbert_linear_bias.npy"))
+        self.ids_especiais = {
+            self.tokenizer.cls_token_id, self.tokenizer.eos_token_id,
+            self.tokenizer.pad_token_id, self.tokenizer.unk_token_id,
+        }
+
+    def _criar_sessao(self, intra_op_threads):
+        import onnxruntime as ort
+
+        opcoes = ort.SessionOptions()
+        opcoes.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra_op_threads > 0:
+            opcoes.intra_op_num_threads = intra_op_threads
+        return ort.InferenceSession(self.model_path, sess_options=opcoes, providers=["CPUExecutionProvider"])
+
+    def reabrir_sessao(self, intra_op_threads=0):
+        """
+        Recria a sessão do ONNX Runtime. Necessário em processos filhos criados
+        por fork: as threads da sessão herdada não existem no filho.
+        """
+        self.session = self._criar_sessao(intra_op_threads)
+
+    def _forward(self, textos, max_length):
+        tokens = self.tokenizer(
+            textos, padding=True, truncation=True, max_length=max_length, return_tensors="np"
+        )
+        input_ids = tokens["input_ids"].astype(np.int64)
+        mascara = tokens["attention_mask"].astype(np.int64)
+        hidden = self.session.run(None, {"input_ids": input_ids, "attention_mask": mascara})[0]
+        return input_ids, mascara, hidden
+
+    def _pesos_lexicos(self, input_ids, mascara, hidden):
+        pesos_token = np.maximum(hidden @ self.sparse_w.T + self.sparse_b, 0)[..., 0]
+        resultado = []
+        for ids, m, pesos in zip(input_ids, mascara, pesos_token):
+            lexicos = {}
+            for token, peso in zip(ids[m == 1], pesos[m == 1]):
+                if token in self.ids_especiais or peso <= 0:
+                    continue
+                chave = str(token)
+                if peso > lexicos.get(chave, 0):
+                    lexicos[chave] = float(peso)
+            resultado.append(lexicos)
+        return resultado
+
+    def _colbert(self, mascara, hidden):
+        vetores = hidden[:, 1:] @ self.colbert_w.T + self.colbert_b
+        vetores = vetores * mascara[:, 1:, None]
+        return [_normalizar(v[:int(m.sum()) - 1]) for v, m in zip(vetores, mascara)]
+
+    def encode(self, sentences, batch_size=256, max_length=512, return_dense=True,
+               return_sparse=False, return_colbert_vecs=False, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        # ordena por tamanho para reduzir o padding dentro de cada lote
+        ordem = np.argsort([-len(s) for s in sentences], kind="stable")
+        densos, lexicos, colbert = [None] * len(sentences), [None] * len(sentences), [None] * len(sentences)
+
+        for inicio in range(0, len(sentences), batch_size):
+            indices = ordem[inicio:inicio + batch_size]
+            input_ids, mascara, hidden = self._forward([sentences[i] for i in indices], max_length)
+            if return_dense:
+                for i, v in zip(indices, _normalizar(hidden[:, 0])):
+                    densos[i] = v
+            if return_sparse:
+                for i, p in zip(indices, self._pesos_lexicos(input_ids, mascara, hidden)):
+                    lexicos[i] = p
+            if return_colbert_vecs:
+                for i, c in zip(indices, self._colbert(mascara, hidden)):
+                    colbert[i] = c
+
+        saida = {"dense_vecs": None, "lexical_weights": None, "colbert_vecs": None}
+        if return_dense:
+            saida["dense_vecs"] = np.stack(densos).astype(np.float32) if densos else np.empty((0, 0), np.float32)
+        if return_sparse:
+            saida["lexical_weights"] = lexicos
+        if return_colbert_vecs:
+            saida["colbert_vecs"] = colbert
+        return saida
+
+
+class TokenizadorPalavras:
+    """Tokenizer por palavras e pontuação com a parte da interface do transformers usada no pipeline."""
+
+    def __init__(self, vocabulario=250002):
+        self.vocabulario = vocabulario
+
+    def __call__(self, texto, add_special_tokens=False, return_offsets_mapping=False, truncation=False, **kwargs):
+        if not isinstance(texto, str):
+            # lote: uma lista por campo, como no tokenizer do transformers
+            saidas = [self(t, return_offsets_mapping=return_offsets_mapping) for t in texto]
+            return {campo: [saida[campo] for saida in saidas] for campo in (saidas[0] if saidas else ["input_ids"])}
+        spans = [m.span() for m in re.finditer(r"\w+|[^\w\s]", texto)]
+        saida = {"input_ids": [zlib.crc32(texto[a:b].lower().encode("utf-8")) % self.vocabulario for a, b in spans]}
+        if return_offsets_mapping:
+            saida["offset_mapping"] = spans
+        return saida
+
+
+class HashBGEM3:
+    """
+    Modelo mínimo com a interface de encode do BGEM3FlagModel: cada token cai
+    em uma linha fixa de uma tabela pseudoaleatória e o vetor denso é a soma
+    normalizada das linhas. Determinístico, sem download e rápido; mede o
+    custo do pipeline em volta do modelo, não a qualidade da busca.
+    """
+
+    def __init__(self, dim=HASH_EMBEDDING_DIM, linhas=8192, semente=0):
+        self.tokenizer = TokenizadorPalavras()
+        self.tabela = np.random.default_rng(semente).standard_normal((linhas, dim)).astype(np.float32)
+
+    def encode(self, sentences, batch_size=256, max_length=512, return_dense=True,
+               return_sparse=False, return_colbert_vecs=False, **kwargs):
+        if isinstance(sentences, str):
+            sentences = [sentences]
+        ids = [self.tokenizer(s)["input_ids"][:max_length] for s in sentences]
+        saida = {"dense_vecs": None, "lexical_weights": None, "colbert_vecs": None}
+        if return_dense:
+            densos = np.zeros((len(sentences), self.tabela.shape[1]), np.float32)
+            for i, tokens in enumerate(ids):
+                if tokens:
+                    densos[i] = self.tabela[np.array(tokens) % len(self.tabela)].sum(axis=0)
+            saida["dense_vecs"] = _normalizar(densos)
+        if return_sparse:
+            # peso léxico = frequência relativa do token no texto
+            saida["lexical_weights"] = [
+                {str(t): tokens.count(t) / len(tokens) for t in set(tokens)} for tokens in ids
+            ]
+        if return_colbert_vecs:
+            saida["colbert_vecs"] = [_normalizar(self.tabela[np.array(t, dtype=np.int64) % len(self.tabela)]) for t in ids]
+        return saida
+
+
+def identidade_do_modelo(model_name, backend=None):
+    """
+    Nome do modelo para a chave do EmbeddingCache: o mesmo modelo em outro
+    backend ou precisão (ONNX int8, fp16, hash) gera vetores diferentes, que
+    não podem ser servidos no lugar dos outros.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "onnx":
+        precisao = "int8" if ONNX_QUANTIZED else "fp32"
+    elif backend == "torch":
+        precisao = "fp16" if EMBEDDING_USE_FP16 else "fp32"
+    else:
+        precisao = f"dim{HASH_EMBEDDING_DIM}"
+    return f"{model_name}|{backend}|{precisao}"
+
+
+def carregar_modelo(model_name, cache_dir, backend=None, use_fp16=None, **kwargs):
+    """
+    Carrega o modelo de embeddings no backend configurado. Os dois backends
+    expõem `encode(...)` devolvendo o dict do BGE-M3 e `tokenizer`.
+    """
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "onnx":
+        return OnnxBGEM3(ONNX_MODEL_DIR, quantizado=ONNX_QUANTIZED, intra_op_threads=ONNX_INTRA_OP_THREADS)
+    if backend == "torch":
+        from FlagEmbedding import BGEM3FlagModel
+        if use_fp16 is None:
+            use_fp16 = EMBEDDING_USE_FP16
+        return BGEM3FlagModel(model_name_or_path=model_name, use_fp16=use_fp16, cache_dir=cache_dir, **kwargs)
+    if backend == "hash":
+        return HashBGEM3()
+    raise ValueError(f"backend de embeddings desconhecido: {backend}")
@@ -0,0 +1,218 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalizar_texto(texto):
+    """Normaliza unicode e espaços para que textos equivalentes gerem a mesma chave."""
+    texto = unicodedata.normalize("NFC", texto)
+    return " ".join(texto.split())
+
+
+class EmbeddingCache:
+    """
+    Cache de embeddings endereçado por conteúdo, com uma camada LRU em memória
+    e uma camada persistente em SQLite. A chave é o hash de
+    (modelo, instrução, max_length, texto normalizado), então reexecuções só
+    pagam pelos textos novos ou alterados. Os pesos léxicos (esparsos) do
+    BGE-M3, quando usados, ficam em outra tabela com a mesma chave.
+    """
+
+    def __init__(self, path, model_name, instruction="", max_length=8192,
+                 memory_items=10000, dtype="float32"):
+        self.model_name = model_name
+        self.instruction = instruction or ""
+        self.max_length = max_length
+        self.memory_items = memory_items
+        self.dtype = np.dtype(dtype)
+        self.hits = 0
+        self.misses = 0
+
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+
+        diretorio = os.path.dirname(path)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "chave TEXT PRIMARY KEY, dim INTEGER NOT NULL, vetor BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS esparsos ("
+            "chave TEXT PRIMARY KEY, indices BLOB NOT NULL, valores BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def chave(self, texto):
+        conteudo = "\x1f".join(
+            [self.model_name, self.instruction, str(self.max_length), normalizar_texto(texto)]
+        )
+        return hashlib.sha256(conteudo.encode("utf-8")).hexdigest()
+
+    def _lembrar(self, chave, vetor):
+        self._memoria[chave] = vetor
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.memory_items:
+            self._memoria.popitem(last=False)
+
+    def get_many(self, textos):
+        """Devolve uma lista com o vetor de cada texto, ou None quando não está em cache."""
+        resultado = self._buscar(textos)
+        with self._lock:
+            self._contar(resultado)
+        return resultado
+
+    def _buscar(self, textos):
+        chaves = [self.chave(t) for t in textos]
+        resultado = [None] * len(textos)
+        faltando = {}
+
+        with self._lock:
+            for i, chave in enumerate(chaves):
+                vetor = self._memoria.get(chave)
+                if vetor is not None:
+                    self._memoria.move_to_end(chave)
+                    resultado[i] = vetor
+                else:
+                    faltando.setdefault(chave, []).append(i)
+
+            lista = list(faltando)
+            # o SQLite limita o número de parâmetros por consulta
+            for inicio in range(0, len(lista), 500):
+                parte = lista[inicio:inicio + 500]
+                marcadores = ",".join("?" * len(parte))
+                linhas = self._conn.execute(
+                    f"SELECT chave, vetor FROM embeddings WHERE chave IN ({marcadores})", parte
+                ).fetchall()
+                for chave, blob in linhas:
+                    vetor = np.frombuffer(blob, dtype=self.dtype)
+                    self._lembrar(chave, vetor)
+                    for i in faltando[chave]:
+                        resultado[i] = vetor
+        return resultado
+
+    def _contar(self, resultado):
+        encontrados = sum(1 for v in resultado if v is not None)
+        self.hits += encontrados
+        self.misses += len(resultado) - encontrados
+
+    def _buscar_esparsos(self, chaves):
+        """{chave: (indices, valores)} das chaves com pesos léxicos gravados."""
+        encontrados = {}
+        lista = list(dict.fromkeys(chaves))
+        for inicio in range(0, len(lista), 500):
+            parte = lista[inicio:inicio + 500]
+            marcadores = ",".join("?" * len(parte))
+            linhas = self._conn.execute(
+                f"SELECT chave, indices, valores FROM esparsos WHERE chave IN ({marcadores})", parte
+            ).fetchall()
+            for chave, indices, valores in linhas:
+                encontrados[chave] = (np.frombuffer(indices, dtype=np.int32), np.frombuffer(valores, dtype=np.float32))
+        return encontrados
+
+    def put_many(self, textos, vetores):
+        vetores = np.asarray(vetores, dtype=self.dtype)
+        linhas = []
+        with self._lock:
+            for texto, vetor in zip(textos, vetores):
+                chave = self.chave(texto)
+                self._lembrar(chave, vetor)
+                linhas.append((chave, len(vetor), vetor.tobytes()))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (chave, dim, vetor) VALUES (?, ?, ?)", linhas
+            )
+            self._conn.commit()
+
+    def put_many_esparsos(self, textos, esparsos):
+        linhas = [
+            (self.chave(texto), np.asarray(indices, dtype=np.int32).tobytes(), np.asarray(valores, dtype=np.float32).tobytes())
+            for texto, (indices, valores) in zip(textos, esparsos)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO esparsos (chave, indices, valores) VALUES (?, ?, ?)", linhas
+            )
+            self._conn.commit()
+
+    def encode(self, textos, encode_fn):
+        """
+        Consulta o cache antes de chamar o modelo: `encode_fn` só recebe os
+        textos ausentes (sem repetição) e o resultado volta na ordem original.
+        """
+        textos = list(textos)
+        if not textos:
+            return np.empty((0, 0), dtype=self.dtype)
+
+        vetores = self.get_many(textos)
+        pendentes = {}
+        for i, vetor in enumerate(vetores):
+            if vetor is None:
+                pendentes.setdefault(textos[i], []).append(i)
+
+        if pendentes:
+            novos_textos = list(pendentes)
+            novos = np.asarray(encode_fn(novos_textos), dtype=self.dtype)
+            self.put_many(novos_textos, novos)
+            for texto, vetor in zip(novos_textos, novos):
+                for i in pendentes[texto]:
+                    vetores[i] = vetor
+
+        return np.stack(vetores)
+
+    def encode_com_esparsos(self, textos, encode_fn):
+        """
+        Como `encode`, mas para o vetor denso junto com os pesos léxicos:
+        `encode_fn(faltando)` devolve (densos, esparsos) de um forward só, e
+        um texto só conta como acerto quando as duas partes estão no cache.
+        Devolve (vetores, [(indices, valores)]) na ordem original.
+        """
+        textos = list(textos)
+        if not textos:
+            return np.empty((0, 0), dtype=self.dtype), []
+
+        chaves = [self.chave(t) for t in textos]
+        vetores = self._buscar(textos)
+        with self._lock:
+            esparsos_cache = self._buscar_esparsos(chaves)
+            esparsos = [esparsos_cache.get(chave) for chave in chaves]
+            # sem os pesos léxicos o texto volta para o modelo, mesmo com o denso no cache
+            vetores = [v if e is not None else None for v, e in zip(vetores, esparsos)]
+            self._contar(vetores)
+
+        pendentes = {}
+        for i, vetor in enumerate(vetores):
+            if vetor is None:
+                pendentes.setdefault(textos[i], []).append(i)
+        if pendentes:
+            novos_textos = list(pendentes)
+            novos_densos, novos_esparsos = encode_fn(novos_textos)
+            novos_densos = np.asarray(novos_densos, dtype=self.dtype)
+            self.put_many(novos_textos, novos_densos)
+            self.put_many_esparsos(novos_textos, novos_esparsos)
+            for texto, vetor, esparso in zip(novos_textos, novos_densos, novos_esparsos):
+                for i in pendentes[texto]:
+                    vetores[i] = vetor
+                    esparsos[i] = esparso
+
+        return np.stack(vetores), esparsos
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "memory_items": len(self._memoria),
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
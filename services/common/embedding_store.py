@@ -0,0 +1,274 @@
+import os
+import struct
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+EXTENSAO_VETORES = ".npy"
+EXTENSAO_METADADOS = ".parquet"
+EXTENSAO_ESPARSOS = ".sparse.parquet"
+
+
+def _caminhos(pasta, nome):
+    base = os.path.join(pasta, nome)
+    return base + EXTENSAO_VETORES, base + EXTENSAO_METADADOS
+
+
+def _caminho_esparsos(pasta, nome):
+    return os.path.join(pasta, nome) + EXTENSAO_ESPARSOS
+
+
+def _gravar_esparsos(path, esparsos):
+    """`esparsos` é uma lista de (indices, valores), um par por linha da partição."""
+    df = pd.DataFrame({
+        "indices": [np.asarray(indices, dtype=np.int32) for indices, _ in esparsos],
+        "valores": [np.asarray(valores, dtype=np.float32) for _, valores in esparsos],
+    })
+    df.to_parquet(path + ".tmp", index=False)
+    os.replace(path + ".tmp", path)
+
+
+def gravar_particao(pasta, nome, metadados, vetores, dtype="float32", esparsos=None):
+    """
+    Grava uma partição como uma matriz .npy contígua e um sidecar Parquet com
+    os metadados, uma linha por vetor e na mesma ordem. Os pesos léxicos
+    (esparsos), quando existem, vão para um terceiro arquivo.
+    """
+    path_vetores, path_metadados = _caminhos(pasta, nome)
+    vetores = np.ascontiguousarray(vetores, dtype=dtype)
+    if len(metadados) != len(vetores):
+        raise ValueError(f"{len(metadados)} linhas de metadados para {len(vetores)} vetores")
+    if esparsos is not None and len(esparsos) != len(vetores):
+        raise ValueError(f"{len(esparsos)} vetores esparsos para {len(vetores)} vetores densos")
+
+    metadados.reset_index(drop=True).to_parquet(path_metadados + ".tmp", index=False)
+    os.replace(path_metadados + ".tmp", path_metadados)
+    if esparsos is not None:
+        _gravar_esparsos(_caminho_esparsos(pasta, nome), esparsos)
+    # a partição só passa a ser listada quando o .npy existe, por isso ele vem por último
+    with open(path_vetores + ".tmp", "wb") as f:
+        np.save(f, vetores)
+    os.replace(path_vetores + ".tmp", path_vetores)
+
+
+def _cabecalho_npy(dtype, linhas, dim, tamanho=128):
+    """
+    Cabeçalho .npy (formato 1.0) com tamanho fixo, completado com espaços como
+    o próprio numpy faz; assim ele pode ser reescrito no lugar com o número
+    final de linhas.
+    """
+    dicionario = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False,
+                       "shape": (linhas, dim)})
+    corpo = dicionario.ljust(tamanho - 11) + "\n"
+    return np.lib.format.MAGIC_PREFIX + b"\x01\x00" + struct.pack("<H", len(corpo)) + corpo.encode("latin1")
+
+
+class EscritorParticao:
+    """
+    Grava uma partição em lotes, sem juntar tudo em memória: os vetores são
+    acrescentados ao .npy (o cabeçalho recebe o total de linhas no fim) e os
+    metadados/esparsos viram row groups do Parquet. O resultado é o mesmo de
+    gravar_particao. Tudo é escrito em .tmp e só vira partição em `fechar`,
+    com o .npy por último; saindo do `with` por exceção, os .tmp são apagados.
+    """
+
+    def __init__(self, pasta, nome, dtype="float32", com_esparsos=False):
+        self.path_vetores, self.path_metadados = _caminhos(pasta, nome)
+        self.path_esparsos = _caminho_esparsos(pasta, nome) if com_esparsos else None
+        self.dtype = np.dtype(dtype)
+        self.linhas = 0
+        self.dim = None
+        self._vetores = None
+        self._metadados = None
+        self._esparsos = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, erro, tb):
+        if tipo is None:
+            self.fechar()
+        else:
+            self.descartar()
+
+    def escrever(self, metadados, vetores, esparsos=None):
+        vetores = np.ascontiguousarray(vetores, dtype=self.dtype)
+        if len(metadados) != len(vetores):
+            raise ValueError(f"{len(metadados)} linhas de metadados para {len(vetores)} vetores")
+        if (self.path_esparsos is not None) != (esparsos is not None):
+            raise ValueError("esparsos devem vir em todos os lotes, ou em nenhum")
+        if esparsos is not None and len(esparsos) != len(vetores):
+            raise ValueError(f"{len(esparsos)} vetores esparsos para {len(vetores)} vetores densos")
+        if not len(vetores):
+            return
+
+        if self._vetores is None:
+            self.dim = vetores.shape[1]
+            self._vetores = open(self.path_vetores + ".tmp", "wb")
+            self._vetores.write(_cabecalho_npy(self.dtype, 0, self.dim))
+        elif vetores.shape[1] != self.dim:
+            raise ValueError(f"dimensão {vetores.shape[1]} diferente da partição ({self.dim})")
+        self._vetores.write(vetores.tobytes())
+
+        tabela = pa.Table.from_pandas(metadados.reset_index(drop=True), preserve_index=False)
+        if self._metadados is None:
+            self._metadados = pq.ParquetWriter(self.path_metadados + ".tmp", tabela.schema)
+        self._metadados.write_table(tabela.cast(self._metadados.schema))
+
+        if esparsos is not None:
+            tabela = pa.table({
+                "indices": pa.array([np.asarray(i, dtype=np.int32) for i, _ in esparsos], type=pa.list_(pa.int32())),
+                "valores": pa.array([np.asarray(v, dtype=np.float32) for _, v in esparsos], type=pa.list_(pa.float32())),
+            })
+            if self._esparsos is None:
+                self._esparsos = pq.ParquetWriter(self.path_esparsos + ".tmp", tabela.schema)
+            self._esparsos.write_table(tabela)
+        self.linhas += len(vetores)
+
+    def fechar(self):
+        """Publica a partição; sem nenhuma linha escrita, não grava nada. Devolve o total de linhas."""
+        if self._vetores is None:
+            return 0
+        for escritor, path in ((self._metadados, self.path_metadados), (self._esparsos, self.path_esparsos)):
+            if escritor is not None:
+                escritor.close()
+                os.replace(path + ".tmp", path)
+        self._vetores.seek(0)
+        self._vetores.write(_cabecalho_npy(self.dtype, self.linhas, self.dim))
+        self._vetores.close()
+        os.replace(self.path_vetores + ".tmp", self.path_vetores)
+        return self.linhas
+
+    def descartar(self):
+        for escritor in (self._vetores, self._metadados, self._esparsos):
+            if escritor is not None:
+                escritor.close()
+        for path in (self.path_vetores, self.path_metadados, self.path_esparsos):
+            if path is not None and os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+
+
+def listar_particoes(pasta):
+    """Nomes das partições em ordem de criação (o nome começa pelo timestamp)."""
+    return sorted(f[:-len(EXTENSAO_VETORES)] for f in os.listdir(pasta) if f.endswith(EXTENSAO_VETORES))
+
+
+def abrir_particao(pasta, nome):
+    """Devolve (metadados, vetores) com os vetores mapeados em memória, sem cópia."""
+    path_vetores, path_metadados = _caminhos(pasta, nome)
+    return pd.read_parquet(path_metadados), np.load(path_vetores, mmap_mode="r")
+
+
+def remover_particao(pasta, nome):
+    for path in (*_caminhos(pasta, nome), _caminho_esparsos(pasta, nome)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def tem_esparsos(pasta, nome):
+    return os.path.exists(_caminho_esparsos(pasta, nome))
+
+
+def _ler_esparsos(pasta, nome, total):
+    """Lê os pares (indices, valores) da partição; sem arquivo, devolve vetores vazios."""
+    if not tem_esparsos(pasta, nome):
+        vazio = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32))
+        return [vazio] * total
+    df = pd.read_parquet(_caminho_esparsos(pasta, nome))
+    return list(zip(df["indices"], df["valores"]))
+
+
+def ler_metadados(pasta, manifest=None):
+    """
+    Junta os metadados de todas as partições, com as colunas `particao` e
+    `posicao` apontando para o vetor correspondente. Com um manifest, fica só
+    a versão mais recente de cada row_id ainda presente na origem; quando o
+    documento foi dividido em passagens, todas as linhas dessa versão ficam.
+    """
+    partes = []
+    for nome in listar_particoes(pasta):
+        metadados = pd.read_parquet(_caminhos(pasta, nome)[1])
+        metadados["particao"] = nome
+        metadados["posicao"] = np.arange(len(metadados))
+        partes.append(metadados)
+    if not partes:
+        return pd.DataFrame(columns=["particao", "posicao"])
+
+    df = pd.concat(partes, ignore_index=True)
+    if manifest is not None and "row_id" in df.columns:
+        df = df[df["row_id"].isin(manifest.vigentes())]
+        # os nomes das partições começam pelo timestamp, então a maior é a mais recente
+        ultima = df.groupby("row_id")["particao"].transform("max")
+        df = df[df["particao"] == ultima].reset_index(drop=True)
+    return df
+
+
+def dimensao(pasta):
+    particoes = listar_particoes(pasta)
+    if not particoes:
+        return None
+    return np.load(_caminhos(pasta, particoes[0])[0], mmap_mode="r").shape[1]
+
+
+def iterar_lotes(pasta, manifest=None, tamanho=1024, metadados=None, com_esparsos=False):
+    """
+    Percorre os vetores vigentes em lotes de até `tamanho` linhas, lendo do
+    mmap só as linhas de cada lote; a memória usada é limitada pelo lote.
+    Com `com_esparsos`, cada lote traz também a lista de (indices, valores).
+    """
+    if metadados is None:
+        metadados = ler_metadados(pasta, manifest)
+    for nome, grupo in metadados.groupby("particao", sort=False):
+        vetores = np.load(_caminhos(pasta, nome)[0], mmap_mode="r")
+        esparsos = _ler_esparsos(pasta, nome, len(vetores)) if com_esparsos else None
+        for inicio in range(0, len(grupo), tamanho):
+            parte = grupo.iloc[inicio:inicio + tamanho]
+            posicoes = parte["posicao"].to_numpy()
+            densos = np.asarray(vetores[posicoes], dtype=np.float32)
+            if com_esparsos:
+                yield parte, densos, [esparsos[i] for i in posicoes]
+            else:
+                yield parte, densos
+
+
+def compactar(pasta, nome, manifest=None, dtype="float32"):
+    """
+    Reescreve as linhas vigentes de todas as partições em uma única partição,
+    copiando os vetores lote a lote para um .npy mapeado em memória.
+    Devolve o número de linhas gravadas.
+    """
+    metadados = ler_metadados(pasta, manifest)
+    dim = dimensao(pasta)
+    path_vetores, _ = _caminhos(pasta, nome)
+
+    com_esparsos = any(tem_esparsos(pasta, p) for p in metadados["particao"].unique())
+
+    saida = np.lib.format.open_memmap(path_vetores + ".tmp", mode="w+", dtype=dtype, shape=(len(metadados), dim))
+    partes = []
+    todos_esparsos = []
+    inicio = 0
+    for lote in iterar_lotes(pasta, metadados=metadados, com_esparsos=com_esparsos):
+        parte, vetores = lote[0], lote[1]
+        saida[inicio:inicio + len(vetores)] = vetores
+        inicio += len(vetores)
+        partes.append(parte.drop(columns=["particao", "posicao"]))
+        if com_esparsos:
+            todos_esparsos.extend(lote[2])
+    saida.flush()
+    del saida
+
+    if com_esparsos:
+        _gravar_esparsos(_caminho_esparsos(pasta, nome), todos_esparsos)
+
+    # metadados na mesma ordem em que os vetores foram copiados
+    _, path_metadados = _caminhos(pasta, nome)
+    if partes:
+        metadados = pd.concat(partes, ignore_index=True)
+    else:
+        metadados = metadados.drop(columns=["particao", "posicao"])
+    metadados.to_parquet(path_metadados + ".tmp", index=False)
+    os.replace(path_metadados + ".tmp", path_metadados)
+    os.replace(path_vetores + ".tmp", path_vetores)
+    return inicio
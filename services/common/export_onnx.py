@@ -0,0 +1,80 @@
+"""
+Exporta o BGE-M3 para ONNX (e opcionalmente uma versão int8 com quantização
+dinâmica) no formato lido por common.embedding_backend.OnnxBGEM3.
+
+Uso:
+    python -m common.export_onnx --saida /cache/onnx/bge-m3 --int8
+"""
+import argparse
+import os
+
+import numpy as np
+import torch
+from huggingface_hub import snapshot_download
+from transformers import AutoModel, AutoTokenizer
+
+MODEL_NAME = "davidoneil/bge-m3-ft-corpus-pt"
+
+
+class _SoHidden(torch.nn.Module):
+    """Encapsula o modelo para o grafo exportado devolver só o last_hidden_state."""
+
+    def __init__(self, modelo):
+        super().__init__()
+        self.modelo = modelo
+
+    def forward(self, input_ids, attention_mask):
+        return self.modelo(input_ids=input_ids, attention_mask=attention_mask).last_hidden_state
+
+
+def salvar_cabeca(path_pt, saida, nome):
+    estado = torch.load(path_pt, map_location="cpu")
+    np.save(os.path.join(saida, f"{nome}_weight.npy"), estado["weight"].float().numpy())
+    np.save(os.path.join(saida, f"{nome}_bias.npy"), estado["bias"].float().numpy())
+
+
+def exportar(model_name, saida, cache_dir=None, int8=False, opset=17):
+    os.makedirs(saida, exist_ok=True)
+    model_dir = snapshot_download(model_name, cache_dir=cache_dir)
+
+    tokenizer = AutoTokenizer.from_pretrained(model_dir)
+    tokenizer.save_pretrained(saida)
+    modelo = _SoHidden(AutoModel.from_pretrained(model_dir).eval())
+
+    exemplo = tokenizer(["exemplo de texto para exportação"], return_tensors="pt")
+    path_onnx = os.path.join(saida, "model.onnx")
+    torch.onnx.export(
+        modelo,
+        (exemplo["input_ids"], exemplo["attention_mask"]),
+        path_onnx,
+        input_names=["input_ids", "attention_mask"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": {0: "batch", 1: "seq"},
+            "attention_mask": {0: "batch", 1: "seq"},
+            "last_hidden_state": {0: "batch", 1: "seq"},
+        },
+        opset_version=opset,
+    )
+    print(f"[OK] modelo exportado em {path_onnx}")
+
+    # as cabeças esparsa e ColBERT ficam fora do grafo, como matrizes numpy
+    salvar_cabeca(os.path.join(model_dir, "sparse_linear.pt"), saida, "sparse_linear")
+    salvar_cabeca(os.path.join(model_dir, "colbert_linear.pt"), saida, "colbert_linear")
+
+    if int8:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        path_int8 = os.path.join(saida, "model_int8.onnx")
+        quantize_dynamic(path_onnx, path_int8, weight_type=QuantType.QInt8)
+        print(f"[OK] modelo int8 salvo em {path_int8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modelo", default=MODEL_NAME)
+    parser.add_argument("--saida", default="/cache/onnx/bge-m3")
+    parser.add_argument("--cache-dir", default="/cache/flag_model")
+    parser.add_argument("--int8", action="store_true")
+    args = parser.parse_args()
+    exportar(args.modelo, args.saida, cache_dir=args.cache_dir, int8=args.int8)
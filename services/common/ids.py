@@ -0,0 +1,14 @@
+import hashlib
+import uuid
+
+# namespace fixo: o mesmo arquivo de origem gera sempre o mesmo id de ponto
+NAMESPACE_PONTOS = uuid.uuid5(uuid.NAMESPACE_URL, "pdm-2025/medallion")
+
+
+def id_ponto(origem):
+    """UUIDv5 derivado do identificador da origem (ex.: nome do arquivo do ticket)."""
+    return str(uuid.uuid5(NAMESPACE_PONTOS, origem))
+
+
+def hash_conteudo(texto):
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+
+# partição registrada para arquivos sem nenhuma passagem (ex.: ticket sem texto):
+# o arquivo conta como processado, mas não tem linhas vigentes no gold
+SEM_PASSAGENS = "_sem_passagens"
+
+
+def hash_arquivo(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    return h.hexdigest()
+
+
+class Manifest:
+    """
+    Registro dos arquivos de origem já processados pelo gold: para cada arquivo
+    guarda mtime, hash do conteúdo, o row_id estável atribuído a ele e a
+    partição em que o embedding mais recente foi gravado.
+    """
+
+    def __init__(self, path, arquivos=None, proximo_id=0):
+        self.path = path
+        self.arquivos = arquivos or {}
+        self.proximo_id = proximo_id
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            dados = json.load(f)
+        return cls(path, dados.get("arquivos", {}), dados.get("proximo_id", 0))
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"arquivos": self.arquivos, "proximo_id": self.proximo_id}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def alterados(self, pasta, nomes):
+        """
+        Devolve [(nome, mtime, sha256)] dos arquivos novos ou com conteúdo
+        diferente do registrado. Quando o mtime não mudou o arquivo nem é lido.
+        """
+        resultado = []
+        for nome in nomes:
+            path = os.path.join(pasta, nome)
+            mtime = os.path.getmtime(path)
+            registro = self.arquivos.get(nome)
+            if registro is not None and registro["mtime"] == mtime:
+                continue
+            sha = hash_arquivo(path)
+            if registro is not None and registro["sha256"] == sha:
+                # só o mtime mudou (ex.: cópia), o embedding continua válido
+                registro["mtime"] = mtime
+                continue
+            resultado.append((nome, mtime, sha))
+        return resultado
+
+    def removidos(self, nomes):
+        presentes = set(nomes)
+        return [nome for nome in self.arquivos if nome not in presentes]
+
+    def reservar(self, nome):
+        """
+        row_id do arquivo, sem registrá-lo: um arquivo novo recebe um id livre,
+        que só entra no manifest quando for passado para `registrar`.
+        """
+        registro = self.arquivos.get(nome)
+        if registro is not None:
+            return registro["row_id"]
+        row_id = self.proximo_id
+        self.proximo_id += 1
+        return row_id
+
+    def registrar(self, nome, mtime, sha, particao, row_id=None, modelo=None):
+        """
+        Atualiza o registro do arquivo, mantendo o row_id se ele já existia.
+        `modelo` é a identidade do modelo que gerou os vetores (identidade_do_modelo).
+        """
+        if row_id is None:
+            row_id = self.reservar(nome)
+        self.arquivos[nome] = {"mtime": mtime, "sha256": sha, "row_id": row_id, "particao": particao,
+                               "modelo": modelo}
+        return row_id
+
+    def invalidar_outro_modelo(self, modelo):
+        """
+        Esquece o hash dos arquivos embedados com outro modelo, backend ou
+        precisão, para que `alterados` os devolva de novo. Devolve os nomes invalidados.
+        """
+        outros = [nome for nome, registro in self.arquivos.items() if registro.get("modelo") != modelo]
+        for nome in outros:
+            self.arquivos[nome].update({"mtime": None, "sha256": None})
+        return outros
+
+    def invalidar_sem_particao(self, particoes):
+        """
+        Esquece o hash dos arquivos cuja partição não está em `particoes` (ex.:
+        as .pkl gravadas antes do formato .npy), para que `alterados` os
+        devolva de novo; o row_id é mantido. Devolve os nomes invalidados.
+        """
+        orfaos = [nome for nome, registro in self.arquivos.items()
+                  if registro["particao"] != SEM_PASSAGENS and registro["particao"] not in particoes]
+        for nome in orfaos:
+            self.arquivos[nome].update({"mtime": None, "sha256": None})
+        return orfaos
+
+    def remover(self, nome):
+        self.arquivos.pop(nome, None)
+
+    def particoes(self):
+        return {registro["particao"] for registro in self.arquivos.values() if registro["particao"] != SEM_PASSAGENS}
+
+    def vigentes(self):
+        """row_ids com linhas no gold; os arquivos sem passagens ficam de fora."""
+        return {registro["row_id"] for registro in self.arquivos.values() if registro["particao"] != SEM_PASSAGENS}
+
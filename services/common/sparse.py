@@ -0,0 +1,18 @@
+import numpy as np
+
+# nomes dos vetores na coleção híbrida do Qdrant, usados pelo gold e pela bge-api
+VETOR_DENSO = "dense"
+VETOR_ESPARSO = "sparse"
+
+
+def pesos_para_esparso(pesos):
+    """
+    Converte os pesos léxicos do BGE-M3 ({token_id: peso}) em (indices, valores)
+    ordenados pelo índice, o formato usado pelo Qdrant e pelo gold.
+    """
+    if not pesos:
+        return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+    indices = np.fromiter((int(k) for k in pesos), dtype=np.int32, count=len(pesos))
+    valores = np.fromiter((float(v) for v in pesos.values()), dtype=np.float32, count=len(pesos))
+    ordem = np.argsort(indices)
+    return indices[ordem], valores[ordem]
@@ -0,0 +1,84 @@
+"""
+Paridade do backend ONNX (fp32 e int8) com o BGEM3FlagModel em PyTorch nas
+três saídas do BGE-M3: denso, pesos léxicos e ColBERT. Pula quando faltam o
+onnxruntime, o FlagEmbedding ou o modelo exportado em ONNX_MODEL_DIR
+(python -m common.export_onnx --saida $ONNX_MODEL_DIR --int8).
+
+Uso (a partir de services/):
+    ONNX_MODEL_DIR=/cache/onnx/bge-m3 PYTHONPATH=. python -m pytest common
+"""
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("FlagEmbedding")
+
+from common import embedding_backend
+from common.benchmark_backends import MODEL_NAME, TEXTOS
+from common.embedding_backend import OnnxBGEM3, carregar_modelo
+
+MAX_LENGTH = 512
+# pasta com os pesos já baixados (como a MODEL_LOCAL_DIR do bge-api); sem ela, o cache do hub
+MODELO_REFERENCIA = os.getenv("MODEL_LOCAL_DIR", MODEL_NAME)
+CACHE_DIR = os.getenv("EMBEDDING_MODEL_CACHE", "/cache/flag_model")
+
+# limites por exportação: a quantização int8 dos pesos afasta as saídas um pouco mais
+LIMITES = {
+    "fp32": {"cosseno_denso": 0.999, "cosseno_lexico": 0.999, "peso_lexico": 0.01, "cosseno_colbert": 0.999},
+    "int8": {"cosseno_denso": 0.98, "cosseno_lexico": 0.97, "peso_lexico": 0.05, "cosseno_colbert": 0.95},
+}
+
+
+@pytest.fixture(scope="module")
+def referencia():
+    try:
+        modelo = carregar_modelo(MODELO_REFERENCIA, CACHE_DIR, backend="torch", use_fp16=False)
+    except OSError as e:
+        pytest.skip(f"modelo de referência indisponível: {e}")
+    return modelo.encode(TEXTOS, max_length=MAX_LENGTH, return_dense=True, return_sparse=True,
+                         return_colbert_vecs=True)
+
+
+@pytest.fixture(scope="module", params=["fp32", "int8"])
+def candidato(request):
+    quantizado = request.param == "int8"
+    arquivo = "model_int8.onnx" if quantizado else "model.onnx"
+    if not os.path.exists(os.path.join(embedding_backend.ONNX_MODEL_DIR, arquivo)):
+        pytest.skip(f"{arquivo} não exportado em {embedding_backend.ONNX_MODEL_DIR}")
+    modelo = OnnxBGEM3(embedding_backend.ONNX_MODEL_DIR, quantizado=quantizado)
+    saida = modelo.encode(TEXTOS, max_length=MAX_LENGTH, return_dense=True, return_sparse=True,
+                          return_colbert_vecs=True)
+    return LIMITES[request.param], saida
+
+
+def cosseno(a, b):
+    return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+
+def test_denso(candidato, referencia):
+    limites, saida = candidato
+    # as duas saídas já vêm normalizadas
+    cossenos = np.sum(np.asarray(referencia["dense_vecs"], np.float32) * saida["dense_vecs"], axis=1)
+    assert cossenos.min() >= limites["cosseno_denso"]
+
+
+def test_pesos_lexicos(candidato, referencia):
+    limites, saida = candidato
+    for esperado, obtido in zip(referencia["lexical_weights"], saida["lexical_weights"]):
+        # tokens com peso perto de zero podem ficar de um lado só; contam como zero do outro
+        tokens = sorted(set(esperado) | set(obtido), key=int)
+        a = np.array([float(esperado.get(t, 0)) for t in tokens])
+        b = np.array([float(obtido.get(t, 0)) for t in tokens])
+        assert cosseno(a, b) >= limites["cosseno_lexico"]
+        assert np.abs(a - b).max() <= limites["peso_lexico"]
+
+
+def test_colbert(candidato, referencia):
+    limites, saida = candidato
+    for esperado, obtido in zip(referencia["colbert_vecs"], saida["colbert_vecs"]):
+        esperado = np.asarray(esperado, np.float32)
+        assert esperado.shape == obtido.shape
+        # um vetor normalizado por token
+        assert np.sum(esperado * obtido, axis=1).min() >= limites["cosseno_colbert"]
@@ -0,0 +1,134 @@
+"""
+Mede recall@k e latência de busca para diferentes configurações de
+quantização / armazenamento da coleção, usando os vetores do gold.
+
+As consultas são um conjunto separado: um .npy com embeddings de perguntas
+reais (--consultas) ou, por padrão, vetores do gold retirados do índice.
+O gabarito é a busca exata por cosseno feita em numpy.
+
+Uso:
+    python benchmark_quantization.py --quantizacoes none,scalar,binary --hnsw-ef 64,128
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from common.embedding_store import ler_metadados, iterar_lotes
+from common.manifest import Manifest
+from blue_green import aguardar_indexacao
+from collection_config import ConfigColecao
+from create_collection import criar_cliente, workers_upload, gold_path
+from loader import upload_streaming
+
+
+def carregar_vetores(limite=None):
+    manifest = Manifest.load(os.getenv("GOLD_MANIFEST_PATH", os.path.join(gold_path, "manifest.json")))
+    metadados = ler_metadados(gold_path, manifest)
+    if limite:
+        metadados = metadados.iloc[:limite]
+    return np.concatenate([vetores for _, vetores in iterar_lotes(gold_path, metadados=metadados)])
+
+
+def normalizar(x):
+    return x / np.linalg.norm(x, axis=1, keepdims=True).clip(min=1e-12)
+
+
+def gabarito(corpus, consultas, k):
+    """Top-k exato por cosseno, em blocos para não estourar a memória."""
+    corpus = normalizar(corpus)
+    consultas = normalizar(consultas)
+    resultado = []
+    for inicio in range(0, len(consultas), 256):
+        scores = consultas[inicio:inicio + 256] @ corpus.T
+        top = np.argpartition(-scores, k, axis=1)[:, :k]
+        resultado.extend(set(linha) for linha in top)
+    return resultado
+
+
+def avaliar(client, nome, config, consultas, esperado, k, hnsw_ef):
+    latencias = []
+    acertos = 0
+    for consulta, ids_esperados in zip(consultas, esperado):
+        t0 = time.perf_counter()
+        resposta = client.query_points(
+            collection_name=nome, query=consulta.tolist(), limit=k, search_params=config.busca(hnsw_ef=hnsw_ef)
+        )
+        latencias.append((time.perf_counter() - t0) * 1000)
+        acertos += len({p.id for p in resposta.points} & ids_esperados)
+    return {
+        "recall": acertos / (len(consultas) * k),
+        "p50_ms": float(np.percentile(latencias, 50)),
+        "p99_ms": float(np.percentile(latencias, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quantizacoes", default="none,scalar,binary")
+    parser.add_argument("--hnsw-ef", default="64,128,256")
+    parser.add_argument("--vetores-em-disco", action="store_true")
+    parser.add_argument("--hnsw-m", type=int, default=16)
+    parser.add_argument("--hnsw-ef-construct", type=int, default=100)
+    parser.add_argument("--consultas", help=".npy com embeddings de consultas reservadas")
+    parser.add_argument("--n-consultas", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--limite", type=int, help="usa só os primeiros N vetores do gold")
+    parser.add_argument("--saida", default="/goldII/benchmark_quantization.json")
+    args = parser.parse_args()
+
+    corpus = carregar_vetores(args.limite)
+    rng = np.random.default_rng(42)
+    if args.consultas:
+        consultas = np.load(args.consultas).astype(np.float32)
+    else:
+        # as consultas saem do corpus, para não se acharem no índice
+        reservados = rng.choice(len(corpus), size=min(args.n_consultas, len(corpus) // 10), replace=False)
+        mascara = np.ones(len(corpus), dtype=bool)
+        mascara[reservados] = False
+        consultas, corpus = corpus[reservados], corpus[mascara]
+    print(f"corpus: {corpus.shape} | consultas: {consultas.shape}")
+
+    esperado = gabarito(corpus, consultas, args.k)
+    client = criar_cliente()
+    resultados = []
+
+    for quantizacao in args.quantizacoes.split(","):
+        config = ConfigColecao(
+            quantizacao=quantizacao,
+            vetores_em_disco=args.vetores_em_disco,
+            hnsw_m=args.hnsw_m,
+            hnsw_ef_construct=args.hnsw_ef_construct,
+        )
+        nome = f"benchmark_{quantizacao}_{int(time.time())}"
+        client.create_collection(
+            collection_name=nome,
+            vectors_config=config.vetores(corpus.shape[1]),
+            hnsw_config=config.hnsw(),
+            quantization_config=config.quantizacao_config(),
+        )
+        lotes = (
+            (list(range(i, i + 1000)), corpus[i:i + 1000], [{}] * len(corpus[i:i + 1000]))
+            for i in range(0, len(corpus), 1000)
+        )
+        upload_streaming(client, nome, lotes, workers=workers_upload())
+        aguardar_indexacao(client, nome)
+
+        for ef in [int(x) for x in args.hnsw_ef.split(",")]:
+            metricas = avaliar(client, nome, config, consultas, esperado, args.k, ef)
+            metricas.update({"config": config.descricao(), "hnsw_ef": ef})
+            resultados.append(metricas)
+            print(f"[{config.descricao()} ef={ef}] recall@{args.k}: {metricas['recall']:.3f} | "
+                  f"p50: {metricas['p50_ms']:.2f} ms | p99: {metricas['p99_ms']:.2f} ms")
+        client.delete_collection(nome)
+
+    os.makedirs(os.path.dirname(args.saida), exist_ok=True)
+    with open(args.saida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, indent=2)
+    print(f"resultados salvos em '{args.saida}'")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import time
+
+from qdrant_client.models import (
+    CollectionStatus,
+    CreateAlias,
+    CreateAliasOperation,
+    DeleteAlias,
+    DeleteAliasOperation,
+)
+
+
+def nome_versionado(alias, timestamp):
+    return f"{alias}_{timestamp}"
+
+
+def versoes(client, alias):
+    """Coleções versionadas do alias, da mais antiga para a mais nova."""
+    prefixo = f"{alias}_"
+    nomes = [c.name for c in client.get_collections().collections]
+    return sorted(n for n in nomes if n.startswith(prefixo) and n[len(prefixo):].isdigit())
+
+
+def alvo_do_alias(client, alias):
+    for a in client.get_aliases().aliases:
+        if a.alias_name == alias:
+            return a.collection_name
+    return None
+
+
+def reativar_indice(client, collection_name, hnsw_config):
+    """Religa o HNSW depois de uma carga feita com m=0."""
+    client.update_collection(collection_name=collection_name, hnsw_config=hnsw_config)
+
+
+def aguardar_indexacao(client, collection_name, timeout=600, intervalo=2):
+    """
+    Espera a coleção ficar verde, ou seja, com a otimização/indexação concluída.
+    Exige duas leituras verdes seguidas porque logo após religar o índice o
+    otimizador ainda pode não ter começado.
+    """
+    limite = time.monotonic() + timeout
+    verdes = 0
+    while True:
+        status = client.get_collection(collection_name).status
+        if status == CollectionStatus.RED:
+            raise RuntimeError(f"Coleção '{collection_name}' ficou com status RED durante a indexação")
+        verdes = verdes + 1 if status == CollectionStatus.GREEN else 0
+        if verdes >= 2:
+            return
+        if time.monotonic() > limite:
+            raise TimeoutError(f"Coleção '{collection_name}' não terminou de indexar em {timeout}s")
+        time.sleep(intervalo)
+
+
+def trocar_alias(client, alias, nova_colecao):
+    """
+    Aponta o alias para a nova coleção em uma única operação atômica, de modo
+    que as buscas nunca veem uma coleção vazia ou parcial.
+    """
+    nomes = {c.name for c in client.get_collections().collections}
+    if alias in nomes:
+        # migração do esquema antigo, em que o alias era uma coleção de verdade
+        print(f"[WARN] removendo a coleção '{alias}' para que o nome vire um alias")
+        client.delete_collection(alias)
+
+    operacoes = []
+    anterior = alvo_do_alias(client, alias)
+    if anterior is not None:
+        operacoes.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias)))
+    operacoes.append(
+        CreateAliasOperation(create_alias=CreateAlias(collection_name=nova_colecao, alias_name=alias))
+    )
+    client.update_collection_aliases(change_aliases_operations=operacoes)
+    return anterior
+
+
+def limpar_versoes(client, alias, manter=2):
+    """Apaga as versões antigas, mantendo as `manter` mais novas e sempre a que está no alias."""
+    atual = alvo_do_alias(client, alias)
+    antigas = versoes(client, alias)[:-manter] if manter > 0 else versoes(client, alias)
+    removidas = []
+    for nome in antigas:
+        if nome == atual:
+            continue
+        client.delete_collection(nome)
+        removidas.append(nome)
+    return removidas
@@ -0,0 +1,91 @@
+import os
+
+from qdrant_client.models import (
+    BinaryQuantization,
+    BinaryQuantizationConfig,
+    HnswConfigDiff,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    SparseVectorParams,
+    VectorParams,
+)
+
+from common.sparse import VETOR_DENSO, VETOR_ESPARSO
+
+
+class ConfigColecao:
+    """
+    Parâmetros de armazenamento e indexação da coleção de tickets. Os valores
+    padrão vêm das variáveis de ambiente QDRANT_*, mas o benchmark cria
+    instâncias diretamente para comparar combinações.
+    """
+
+    def __init__(self, quantizacao="none", quantizacao_ram=True, vetores_em_disco=False,
+                 payload_em_disco=False, hnsw_m=16, hnsw_ef_construct=100, hnsw_em_disco=False,
+                 hibrido=False):
+        if quantizacao not in ("none", "scalar", "binary"):
+            raise ValueError(f"quantização desconhecida: {quantizacao}")
+        self.quantizacao = quantizacao
+        self.quantizacao_ram = quantizacao_ram
+        self.vetores_em_disco = vetores_em_disco
+        self.payload_em_disco = payload_em_disco
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construct = hnsw_ef_construct
+        self.hnsw_em_disco = hnsw_em_disco
+        self.hibrido = hibrido
+
+    @classmethod
+    def from_env(cls):
+        def flag(nome, padrao):
+            return os.getenv(nome, padrao).lower() == "true"
+
+        return cls(
+            quantizacao=os.getenv("QDRANT_QUANTIZATION", "none"),
+            quantizacao_ram=flag("QDRANT_QUANTIZATION_ALWAYS_RAM", "true"),
+            vetores_em_disco=flag("QDRANT_VECTORS_ON_DISK", "false"),
+            payload_em_disco=flag("QDRANT_PAYLOAD_ON_DISK", "false"),
+            hnsw_m=int(os.getenv("QDRANT_HNSW_M", "16")),
+            hnsw_ef_construct=int(os.getenv("QDRANT_HNSW_EF_CONSTRUCT", "100")),
+            hnsw_em_disco=flag("QDRANT_HNSW_ON_DISK", "false"),
+            hibrido=flag("QDRANT_HYBRID", "false"),
+        )
+
+    def vetores(self, dim):
+        params = VectorParams(size=dim, distance="Cosine", on_disk=self.vetores_em_disco)
+        if self.hibrido:
+            # vetores nomeados: denso + esparso na mesma coleção
+            return {VETOR_DENSO: params}
+        return params
+
+    def vetores_esparsos(self):
+        if not self.hibrido:
+            return None
+        return {VETOR_ESPARSO: SparseVectorParams()}
+
+    def quantizacao_config(self):
+        if self.quantizacao == "scalar":
+            return ScalarQuantization(
+                scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=self.quantizacao_ram)
+            )
+        if self.quantizacao == "binary":
+            return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=self.quantizacao_ram))
+        return None
+
+    def hnsw(self, carga_em_massa=False):
+        # com m=0 o grafo não é construído durante a carga; ele é criado ao religar
+        m = 0 if carga_em_massa else self.hnsw_m
+        return HnswConfigDiff(m=m, ef_construct=self.hnsw_ef_construct, on_disk=self.hnsw_em_disco)
+
+    def busca(self, hnsw_ef=None, oversampling=2.0):
+        """Parâmetros de busca; com quantização, reordena os candidatos pelos vetores originais."""
+        quantizacao = None
+        if self.quantizacao != "none":
+            quantizacao = QuantizationSearchParams(rescore=True, oversampling=oversampling)
+        return SearchParams(hnsw_ef=hnsw_ef, quantization=quantizacao)
+
+    def descricao(self):
+        return (f"quant={self.quantizacao} vetores_disco={self.vetores_em_disco} "
+                f"m={self.hnsw_m} ef_construct={self.hnsw_ef_construct} hibrido={self.hibrido}")
@@ -1,51 +1,210 @@
-import pandas as pd
 from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, PointStruct
-from pathlib import Path
+from qdrant_client.models import SparseVector
 import os
+import json
 import datetime
+import pandas as pd
+from common.embedding_store import ler_metadados, iterar_lotes, dimensao
+from common.ids import id_ponto, hash_conteudo
+from common.manifest import Manifest
+from common.sparse import VETOR_DENSO, VETOR_ESPARSO
+from loader import upload_streaming
+from blue_green import (
+    nome_versionado, reativar_indice, aguardar_indexacao, trocar_alias, limpar_versoes,
+    alvo_do_alias,
+)
+from sync import ids_existentes, calcular_diff, remover_pontos
+from collection_config import ConfigColecao
 
-OUTPUT_PATH = "/goldII/"
-input_paths = []
+OUTPUT_PATH = os.getenv("GOLD_REPORT_PATH", "/goldII/")
 timestamp = int(datetime.datetime.now().timestamp())
 
-gold_path = "/gold/"
-input_paths = [
-    Path(gold_path, file) for file in os.listdir(gold_path) if file.endswith(".pkl")
-]
+gold_path = os.getenv("GOLD_PATH", "/gold/")
+# as buscas usam sempre o alias; cada carga vai para uma coleção versionada nova
+collection_name = f"tickets_homolog"
 
-dataframes = [pd.read_pickle(path) for path in input_paths]
-df_concat = pd.concat(dataframes, ignore_index=True)
+# ":memory:" usa o modo em memória do qdrant_client, útil para testes locais
+QDRANT_URL = os.getenv("QDRANT_URL", "host.docker.internal:6333")
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "true").lower() == "true"
+UPLOAD_BATCH_SIZE = int(os.getenv("QDRANT_UPLOAD_BATCH_SIZE", "256"))
+UPLOAD_WORKERS = int(os.getenv("QDRANT_UPLOAD_WORKERS", "4"))
+UPLOAD_MAX_RETRIES = int(os.getenv("QDRANT_UPLOAD_MAX_RETRIES", "5"))
+# linhas lidas do mmap por vez
+LEITURA_BATCH_SIZE = int(os.getenv("GOLD_READ_BATCH_SIZE", "4096"))
+# desliga o HNSW durante a carga em massa e religa no final
+BULK_DISABLE_INDEX = os.getenv("QDRANT_BULK_DISABLE_INDEX", "true").lower() == "true"
+INDEX_TIMEOUT = int(os.getenv("QDRANT_INDEX_TIMEOUT", "1800"))
+KEEP_VERSIONS = int(os.getenv("QDRANT_KEEP_VERSIONS", "2"))
+# "rebuild" recria a coleção inteira; "incremental" só envia o diff para a coleção do alias
+SYNC_MODE = os.getenv("QDRANT_SYNC_MODE", "rebuild")
+# campo do payload com o documento de origem de cada passagem, usado para agrupar resultados
+CAMPO_PARENT = "parent_id"
 
 
-collection_name = f"tickets_homolog"
+def criar_cliente():
+    if QDRANT_URL == ":memory:":
+        return QdrantClient(":memory:")
+    return QdrantClient(url=QDRANT_URL, prefer_grpc=QDRANT_PREFER_GRPC)
 
 
-print(df_concat.columns)
-print(df_concat.head())
+def workers_upload():
+    # o modo em memória não aceita escritas concorrentes
+    return 1 if QDRANT_URL == ":memory:" else UPLOAD_WORKERS
 
 
-qdrant_client = QdrantClient(url="host.docker.internal:6333", prefer_grpc=False)
-print("eval", len(df_concat["embeddings"].tolist()[0]))
-qdrant_client.recreate_collection(
-    collection_name=collection_name,
-    vectors_config=VectorParams(
-        size=len(df_concat["embeddings"].tolist()[0]), distance="Cosine"
-    ),
-)
+def gerar_pontos(df_metadados, hibrido=False, gold=gold_path):
+    """
+    Gera lotes (ids, vetores, payloads) lendo os vetores do gold em pedaços.
+    Na coleção híbrida cada ponto leva o vetor denso e o esparso nomeados.
+    Cada passagem vira um ponto, com o ticket de origem em `parent_id`.
+    """
+    for lote in iterar_lotes(gold, metadados=df_metadados, tamanho=LEITURA_BATCH_SIZE, com_esparsos=hibrido):
+        metadados, vetores = lote[0], lote[1]
+        if hibrido:
+            vetores = [
+                {
+                    VETOR_DENSO: denso,
+                    VETOR_ESPARSO: SparseVector(indices=indices.tolist(), values=valores.tolist()),
+                }
+                for denso, (indices, valores) in zip(vetores, lote[2])
+            ]
+        payloads = [
+            {"Conteúdo": texto, "file_name": file_name, "hash": h, "modelo": modelo, CAMPO_PARENT: file_name}
+            for texto, file_name, h, modelo in zip(
+                metadados["texto"], metadados["file_name"], metadados["hash"], metadados["modelo"],
+            )
+        ]
+        if "id_passagem" in metadados.columns:
+            for payload, indice, inicio, fim in zip(payloads, metadados["indice"], metadados["inicio"], metadados["fim"]):
+                if pd.notna(indice):
+                    payload.update({"indice": int(indice), "inicio": int(inicio), "fim": int(fim)})
+        yield metadados["point_id"].tolist(), vetores, payloads
+
 
-points = []
-for idx, row in df_concat.iterrows():
-    points.append(
-        PointStruct(
-            id=idx,
-            vector=row["embeddings"], 
-            payload={
-                "Conteúdo": row["texto"],
-            },
-        )
+def enviar(qdrant_client, destino, df_metadados, config, gold=gold_path):
+    resumo = upload_streaming(
+        qdrant_client,
+        destino,
+        gerar_pontos(df_metadados, hibrido=config.hibrido, gold=gold),
+        batch_size=UPLOAD_BATCH_SIZE,
+        workers=workers_upload(),
+        max_retries=UPLOAD_MAX_RETRIES,
     )
+    print(f"{resumo['pontos']} pontos enviados em {resumo['segundos']:.2f}s ({resumo['pontos_por_segundo']:.0f} pontos/s)")
+    return resumo
+
+
+def reconstruir(qdrant_client, df_metadados, gold=gold_path, colecao=collection_name):
+    """Carrega tudo em uma coleção versionada nova e troca o alias no final."""
+    dim = dimensao(gold)
+    print("eval", dim)
+    config = ConfigColecao.from_env()
+    print(f"configuração: {config.descricao()}")
+    versao = nome_versionado(colecao, timestamp)
+    qdrant_client.create_collection(
+        collection_name=versao,
+        vectors_config=config.vetores(dim),
+        sparse_vectors_config=config.vetores_esparsos(),
+        hnsw_config=config.hnsw(carga_em_massa=BULK_DISABLE_INDEX),
+        quantization_config=config.quantizacao_config(),
+        on_disk_payload=config.payload_em_disco,
+    )
+    # índice no campo de agrupamento, usado pelo group_by das buscas
+    qdrant_client.create_payload_index(versao, field_name=CAMPO_PARENT, field_schema="keyword")
+
+    resumo = enviar(qdrant_client, versao, df_metadados, config, gold=gold)
+
+    if BULK_DISABLE_INDEX:
+        reativar_indice(qdrant_client, versao, config.hnsw())
+    aguardar_indexacao(qdrant_client, versao, timeout=INDEX_TIMEOUT)
+
+    anterior = trocar_alias(qdrant_client, colecao, versao)
+    print(f"alias '{colecao}': {anterior} -> {versao}")
+    removidas = limpar_versoes(qdrant_client, colecao, manter=KEEP_VERSIONS)
+    if removidas:
+        print(f"versões antigas removidas: {removidas}")
+
+    print(f"Collection '{versao}' criada e publicada como '{colecao}' com sucesso!")
+    return {"modo": "rebuild", "colecao": versao, "enviados": resumo["pontos"]}
+
+
+def sincronizar(qdrant_client, df_metadados, gold=gold_path, colecao=collection_name):
+    """Envia só os pontos novos ou alterados e apaga os que saíram do gold."""
+    existentes = ids_existentes(qdrant_client, colecao)
+    # o ponto é reenviado quando o texto ou o modelo que gerou o vetor mudam
+    desejados = dict(zip(df_metadados["point_id"], zip(df_metadados["hash"], df_metadados["modelo"])))
+    novos, alterados, removidos = calcular_diff(desejados, existentes)
+    print(f"diff: {len(novos)} novos | {len(alterados)} alterados | {len(removidos)} removidos | "
+          f"{len(desejados) - len(novos) - len(alterados)} inalterados")
+
+    envio = set(novos) | set(alterados)
+    if envio:
+        config = ConfigColecao.from_env()
+        enviar(qdrant_client, colecao, df_metadados[df_metadados["point_id"].isin(envio)], config, gold=gold)
+    remover_pontos(qdrant_client, colecao, removidos)
+
+    print(f"Collection '{colecao}' sincronizada com sucesso!")
+    return {
+        "modo": "incremental",
+        "colecao": alvo_do_alias(qdrant_client, colecao),
+        "enviados": len(envio),
+        "novos": novos,
+        "alterados": alterados,
+        "removidos": removidos,
+    }
+
+
+def salvar_relatorio(relatorio, colecao=collection_name):
+    os.makedirs(OUTPUT_PATH, exist_ok=True)
+    # o relatório da coleção de tickets mantém o nome de sempre
+    sufixo = "sync_report.json" if colecao == collection_name else f"{colecao}_sync_report.json"
+    path = os.path.join(OUTPUT_PATH, f"{timestamp}_{sufixo}")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    print(f"relatório salvo em '{path}'")
+
+
+def main(qdrant_client=None, gold=None, colecao=collection_name, manifest_path=None):
+    """
+    Carrega as partições de `gold` (GOLD_PATH) na coleção `colecao`, atrás
+    do alias de mesmo nome. O orquestrador usa os parâmetros para carregar
+    também o gold da base de conhecimento, em outra coleção.
+    """
+    gold = gold or gold_path
+    manifest_path = manifest_path or os.getenv("GOLD_MANIFEST_PATH", os.path.join(gold, "manifest.json"))
+    manifest = Manifest.load(manifest_path)
+
+    # só os metadados vão para a memória; os vetores ficam mapeados nos .npy
+    # e, entre as partições delta, fica só a versão mais recente de cada ticket
+    df_metadados = ler_metadados(gold, manifest)
+    if df_metadados.empty:
+        print(f"nenhuma partição em '{gold}'; a coleção '{colecao}' fica como está")
+        return {"modo": "vazio", "colecao": colecao, "enviados": 0}
+    # ids estáveis: a mesma passagem do mesmo ticket cai sempre no mesmo ponto
+    # (partições anteriores à divisão em passagens têm um ponto por ticket)
+    origem = df_metadados["file_name"]
+    if "id_passagem" in df_metadados.columns:
+        origem = df_metadados["id_passagem"].fillna(origem)
+    df_metadados["point_id"] = origem.map(id_ponto)
+    df_metadados["hash"] = df_metadados["texto"].map(lambda texto: hash_conteudo(texto or ""))
+    # identidade do modelo que gerou cada vetor; partições antigas não têm a coluna
+    if "modelo" not in df_metadados.columns:
+        df_metadados["modelo"] = None
+    df_metadados["modelo"] = df_metadados["modelo"].astype(object).where(df_metadados["modelo"].notna(), None)
+
+    print(df_metadados.columns)
+    print(df_metadados.head())
+
+    if qdrant_client is None:
+        qdrant_client = criar_cliente()
+
+    if SYNC_MODE == "incremental" and alvo_do_alias(qdrant_client, colecao) is not None:
+        relatorio = sincronizar(qdrant_client, df_metadados, gold=gold, colecao=colecao)
+    else:
+        relatorio = reconstruir(qdrant_client, df_metadados, gold=gold, colecao=colecao)
+    salvar_relatorio(relatorio, colecao)
+    return relatorio
 
-qdrant_client.upsert(collection_name=collection_name, points=points)
 
-print(f"Collection '{collection_name}' criada e preenchida com sucesso!")
+if __name__ == "__main__":
+    main()
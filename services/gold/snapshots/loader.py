@@ -0,0 +1,87 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+from qdrant_client.models import Batch
+
+
+def rechunk(lotes, batch_size):
+    """Reagrupa lotes (ids, vetores, payloads) de tamanhos quaisquer em lotes de `batch_size`."""
+    ids, vetores, payloads = [], [], []
+    for lote_ids, lote_vetores, lote_payloads in lotes:
+        for item in zip(lote_ids, lote_vetores, lote_payloads):
+            ids.append(item[0])
+            vetores.append(item[1])
+            payloads.append(item[2])
+            if len(ids) >= batch_size:
+                yield ids, vetores, payloads
+                ids, vetores, payloads = [], [], []
+    if ids:
+        yield ids, vetores, payloads
+
+
+def montar_vetores(vetores):
+    """
+    Aceita uma lista de vetores densos ou uma lista de dicts de vetores
+    nomeados ({"dense": array, "sparse": SparseVector}) e monta o formato do Batch.
+    """
+    if vetores and isinstance(vetores[0], dict):
+        nomeados = {}
+        for nome in vetores[0]:
+            valores = [v[nome] for v in vetores]
+            if isinstance(valores[0], np.ndarray):
+                valores = np.asarray(valores, dtype=np.float32).tolist()
+            nomeados[nome] = valores
+        return nomeados
+    return np.asarray(vetores, dtype=np.float32).tolist()
+
+
+def enviar_lote(client, collection_name, ids, vetores, payloads, max_retries=5, espera_base=0.5):
+    """Faz o upsert de um lote, tentando de novo com backoff exponencial em caso de erro."""
+    batch = Batch(ids=list(ids), vectors=montar_vetores(vetores), payloads=list(payloads))
+    for tentativa in range(max_retries + 1):
+        try:
+            client.upsert(collection_name=collection_name, points=batch, wait=True)
+            return len(ids)
+        except Exception as e:
+            if tentativa == max_retries:
+                raise
+            espera = espera_base * (2 ** tentativa) * (0.5 + random.random())
+            print(f"[RETRY] lote de {len(ids)} pontos falhou ({e}), nova tentativa em {espera:.1f}s")
+            time.sleep(espera)
+
+
+def upload_streaming(client, collection_name, lotes, batch_size=256, workers=4, max_retries=5):
+    """
+    Envia os pontos para o Qdrant à medida que os lotes são lidos, com até
+    `workers` requisições em paralelo. No máximo 2 * workers lotes ficam em
+    memória ao mesmo tempo. Devolve um resumo com pontos enviados e pontos/s.
+    """
+    inicio = time.perf_counter()
+    enviados = 0
+    em_andamento = set()
+
+    def coletar(concluidos):
+        nonlocal enviados
+        for future in concluidos:
+            enviados += future.result()
+        print(f"[upload] {enviados} pontos ({enviados / (time.perf_counter() - inicio):.0f} pontos/s)")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for ids, vetores, payloads in rechunk(lotes, batch_size):
+            if len(em_andamento) >= 2 * workers:
+                concluidos, em_andamento = wait(em_andamento, return_when=FIRST_COMPLETED)
+                coletar(concluidos)
+            em_andamento.add(
+                executor.submit(enviar_lote, client, collection_name, ids, vetores, payloads, max_retries)
+            )
+        concluidos, _ = wait(em_andamento)
+        coletar(concluidos)
+
+    duracao = time.perf_counter() - inicio
+    return {
+        "pontos": enviados,
+        "segundos": duracao,
+        "pontos_por_segundo": enviados / duracao if duracao else 0.0,
+    }
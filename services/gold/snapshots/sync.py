@@ -0,0 +1,43 @@
+from qdrant_client.models import PointIdsList
+
+
+def ids_existentes(client, collection_name, campos=("hash", "modelo"), limite=1000):
+    """
+    Lê {id: (hash, modelo)} de todos os pontos da coleção, sem trazer os
+    vetores; um ponto muda quando o texto ou o modelo que gerou o vetor mudam.
+    """
+    existentes = {}
+    offset = None
+    while True:
+        pontos, offset = client.scroll(
+            collection_name=collection_name,
+            limit=limite,
+            offset=offset,
+            with_payload=list(campos),
+            with_vectors=False,
+        )
+        for ponto in pontos:
+            payload = ponto.payload or {}
+            existentes[str(ponto.id)] = tuple(payload.get(campo) for campo in campos)
+        if offset is None:
+            return existentes
+
+
+def calcular_diff(desejados, existentes):
+    """
+    Compara {id: versão} do gold com o que está na coleção e devolve
+    (novos, alterados, removidos) como listas de ids.
+    """
+    novos = [i for i in desejados if i not in existentes]
+    alterados = [i for i, h in desejados.items() if i in existentes and existentes[i] != h]
+    removidos = [i for i in existentes if i not in desejados]
+    return novos, alterados, removidos
+
+
+def remover_pontos(client, collection_name, ids, lote=1000):
+    for inicio in range(0, len(ids), lote):
+        client.delete(
+            collection_name=collection_name,
+            points_selector=PointIdsList(points=ids[inicio:inicio + lote]),
+            wait=True,
+        )
@@ -0,0 +1,165 @@
+"""
+Testes da carga do gold no Qdrant (reconstrução com troca de alias e
+sincronização incremental), com o qdrant_client em memória.
+
+Uso (a partir de services/):
+    PYTHONPATH=. python -m pytest gold/snapshots
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+import pandas as pd
+import pytest
+from qdrant_client import QdrantClient
+
+import create_collection
+from blue_green import alvo_do_alias, versoes
+from common.embedding_store import gravar_particao
+from common.ids import id_ponto, hash_conteudo
+from common.manifest import Manifest
+
+COLECAO = "tickets_teste"
+DIM = 8
+
+
+def vetor(texto):
+    return np.random.default_rng(int(hash_conteudo(texto)[:8], 16)).random(DIM)
+
+
+def gravar(gold, particao, documentos, modelo=None):
+    """
+    Grava uma partição com as passagens de cada documento e registra os
+    documentos no manifest; com `modelo`, as linhas levam a coluna do modelo.
+    """
+    manifest = Manifest.load(os.path.join(gold, "manifest.json"))
+    linhas = []
+    for documento, passagens in documentos.items():
+        row_id = manifest.reservar(documento)
+        for indice, texto in enumerate(passagens):
+            linhas.append({
+                "row_id": row_id, "file_name": documento, "id_passagem": f"{documento}#{indice}",
+                "indice": indice, "inicio": 0, "fim": len(texto), "texto": texto,
+            })
+        manifest.registrar(documento, None, hash_conteudo("".join(passagens)), particao, row_id=row_id, modelo=modelo)
+    df = pd.DataFrame(linhas)
+    if modelo is not None:
+        df["modelo"] = modelo
+    gravar_particao(gold, particao, df, np.stack([vetor(texto) for texto in df["texto"]]))
+    manifest.save()
+    return manifest
+
+
+def pontos(client):
+    registros, _ = client.scroll(COLECAO, limit=100, with_payload=True)
+    return {str(ponto.id): ponto.payload for ponto in registros}
+
+
+def carregar(client, gold):
+    return create_collection.main(qdrant_client=client, gold=gold, colecao=COLECAO)
+
+
+@pytest.fixture
+def gold(tmp_path, monkeypatch):
+    pasta = tmp_path / "gold"
+    pasta.mkdir()
+    monkeypatch.setattr(create_collection, "OUTPUT_PATH", str(tmp_path / "relatorios"))
+    monkeypatch.setattr(create_collection, "SYNC_MODE", "rebuild")
+    monkeypatch.setattr(create_collection, "timestamp", 1000)
+    return str(pasta)
+
+
+@pytest.fixture
+def client():
+    return QdrantClient(":memory:")
+
+
+def test_reconstrucao_publica_o_alias_com_ids_estaveis(gold, client):
+    gravar(gold, "0001_tickets_embeddings", {"a.json": ["primeira", "segunda"], "b.json": ["única"]})
+
+    relatorio = carregar(client, gold)
+
+    assert relatorio == {"modo": "rebuild", "colecao": f"{COLECAO}_1000", "enviados": 3}
+    assert alvo_do_alias(client, COLECAO) == f"{COLECAO}_1000"
+    esperados = {id_ponto(f"{documento}#{indice}"): texto
+                 for documento, indice, texto in [("a.json", 0, "primeira"), ("a.json", 1, "segunda"),
+                                                  ("b.json", 0, "única")]}
+    carregados = pontos(client)
+    assert {i: payload["Conteúdo"] for i, payload in carregados.items()} == esperados
+    assert all(payload["hash"] == hash_conteudo(payload["Conteúdo"]) for payload in carregados.values())
+    assert carregados[id_ponto("a.json#1")]["parent_id"] == "a.json"
+
+
+def test_nova_reconstrucao_troca_o_alias_e_mantem_os_ids(gold, client, monkeypatch):
+    gravar(gold, "0001_tickets_embeddings", {"a.json": ["primeira"], "b.json": ["única"]})
+    carregar(client, gold)
+    antes = pontos(client)
+
+    monkeypatch.setattr(create_collection, "timestamp", 2000)
+    relatorio = carregar(client, gold)
+
+    assert relatorio["colecao"] == f"{COLECAO}_2000"
+    assert alvo_do_alias(client, COLECAO) == f"{COLECAO}_2000"
+    # a versão anterior continua lá (QDRANT_KEEP_VERSIONS=2) para voltar o alias se preciso
+    assert versoes(client, COLECAO) == [f"{COLECAO}_1000", f"{COLECAO}_2000"]
+    assert pontos(client) == antes
+
+
+def test_sincronizacao_envia_so_o_diff(gold, client, monkeypatch):
+    gravar(gold, "0001_tickets_embeddings", {
+        "a.json": ["igual", "antiga"], "b.json": ["vai sair"], "c.json": ["fica"],
+    })
+    carregar(client, gold)
+
+    # a.json muda a segunda passagem, b.json sai da origem e d.json é novo
+    manifest = gravar(gold, "0002_tickets_embeddings", {"a.json": ["igual", "nova"], "d.json": ["chegou"]})
+    manifest.remover("b.json")
+    manifest.save()
+    monkeypatch.setattr(create_collection, "SYNC_MODE", "incremental")
+    monkeypatch.setattr(create_collection, "timestamp", 2000)
+
+    relatorio = carregar(client, gold)
+
+    assert relatorio["modo"] == "incremental"
+    # a sincronização escreve na coleção do alias, sem criar versão nova
+    assert relatorio["colecao"] == f"{COLECAO}_1000"
+    assert versoes(client, COLECAO) == [f"{COLECAO}_1000"]
+    assert relatorio["novos"] == [id_ponto("d.json#0")]
+    assert relatorio["alterados"] == [id_ponto("a.json#1")]
+    assert relatorio["removidos"] == [id_ponto("b.json#0")]
+    assert relatorio["enviados"] == 2
+    assert {i: payload["Conteúdo"] for i, payload in pontos(client).items()} == {
+        id_ponto("a.json#0"): "igual",
+        id_ponto("a.json#1"): "nova",
+        id_ponto("c.json#0"): "fica",
+        id_ponto("d.json#0"): "chegou",
+    }
+
+
+def test_passagem_removida_de_um_documento_sai_da_colecao(gold, client, monkeypatch):
+    gravar(gold, "0001_tickets_embeddings", {"a.json": ["um", "dois", "três"]})
+    carregar(client, gold)
+
+    gravar(gold, "0002_tickets_embeddings", {"a.json": ["um", "dois"]})
+    monkeypatch.setattr(create_collection, "SYNC_MODE", "incremental")
+    relatorio = carregar(client, gold)
+
+    assert relatorio["removidos"] == [id_ponto("a.json#2")]
+    assert relatorio["enviados"] == 0
+    assert set(pontos(client)) == {id_ponto("a.json#0"), id_ponto("a.json#1")}
+
+
+def test_troca_de_modelo_reenvia_pontos_com_o_mesmo_texto(gold, client, monkeypatch):
+    gravar(gold, "0001_tickets_embeddings", {"a.json": ["um", "dois"]}, modelo="bge|torch|fp32")
+    carregar(client, gold)
+
+    # mesmo texto, vetores novos de outro backend
+    gravar(gold, "0002_tickets_embeddings", {"a.json": ["um", "dois"]}, modelo="bge|onnx|int8")
+    monkeypatch.setattr(create_collection, "SYNC_MODE", "incremental")
+    relatorio = carregar(client, gold)
+
+    assert sorted(relatorio["alterados"]) == sorted([id_ponto("a.json#0"), id_ponto("a.json#1")])
+    assert relatorio["enviados"] == 2
+    assert {payload["modelo"] for payload in pontos(client).values()} == {"bge|onnx|int8"}
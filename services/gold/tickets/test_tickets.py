@@ -0,0 +1,122 @@
+"""
+Testes do gold incremental de tickets com o backend hash (sem baixar modelo).
+
+Uso (a partir de services/):
+    PYTHONPATH=. python -m pytest gold/tickets
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+import tickets
+from common.embedding_backend import HashBGEM3
+from common.embedding_store import ler_metadados
+from common.manifest import Manifest, SEM_PASSAGENS
+
+CAMPOS = {
+    "pergunta_principal": "Como emitir a nota fiscal?",
+    "analise_pergunta": "O cliente não encontra o menu de notas.",
+    "orientacao_fornecida": "Indicamos o menu Fiscal.",
+    "status_resolucao": "resolvido",
+    "roteiro_resolucao": "Abrir Fiscal, depois Emitir nota.",
+}
+
+
+def gravar_ticket(pasta, nome, argumentos):
+    """Grava uma resposta do batch como a que o silver deixa em /silverII/."""
+    resposta = {"response": {"body": {"choices": [
+        {"message": {"tool_calls": [{"function": {"arguments": json.dumps(argumentos)}}]}}
+    ]}}}
+    path = os.path.join(pasta, nome)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(resposta, f)
+    # mtime sempre novo, mesmo com duas gravações no mesmo instante
+    mtime = os.path.getmtime(path) + len(os.listdir(pasta))
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def pastas(tmp_path, monkeypatch):
+    silver, gold = tmp_path / "silver", tmp_path / "gold"
+    silver.mkdir()
+    monkeypatch.setattr(tickets, "PASTA_TICKETS_PROCESSADOS", str(silver))
+    monkeypatch.setattr(tickets, "PASTA_GOLD", str(gold))
+    monkeypatch.setattr(tickets, "MANIFEST_PATH", str(gold / "manifest.json"))
+    monkeypatch.setattr(tickets, "EMBEDDING_CACHE_PATH", str(tmp_path / "cache.sqlite"))
+    return str(silver), str(gold)
+
+
+class Carregador:
+    """Conta quantas vezes o modelo foi pedido."""
+
+    def __init__(self):
+        self.chamadas = 0
+
+    def __call__(self):
+        self.chamadas += 1
+        return HashBGEM3()
+
+
+def vigentes(gold):
+    df = ler_metadados(gold, Manifest.load(os.path.join(gold, "manifest.json")))
+    return set(df["file_name"]) if "file_name" in df.columns else set()
+
+
+def test_ticket_sem_texto_nao_volta_na_execucao_seguinte(pastas):
+    silver, gold = pastas
+    gravar_ticket(silver, "a.json", CAMPOS)
+    gravar_ticket(silver, "b.json", {**CAMPOS, "roteiro_resolucao": None})
+    carregar = Carregador()
+
+    assert tickets.processar(carregar=carregar) == 2
+    assert tickets.processar(carregar=carregar) == 0
+
+    # a segunda execução não tinha nada para embedar, nem carregou o modelo
+    assert carregar.chamadas == 1
+    manifest = Manifest.load(tickets.MANIFEST_PATH)
+    assert manifest.arquivos["b.json"]["particao"] == SEM_PASSAGENS
+    assert vigentes(gold) == {"a.json"}
+
+
+def test_so_com_tickets_sem_texto_tambem_fica_estavel(pastas):
+    silver, gold = pastas
+    gravar_ticket(silver, "a.json", {**CAMPOS, "pergunta_principal": ""})
+    carregar = Carregador()
+
+    tickets.processar(carregar=carregar)
+    assert tickets.processar(carregar=carregar) == 0
+    assert carregar.chamadas == 1
+    assert vigentes(gold) == set()
+
+
+def test_ticket_que_perde_o_texto_sai_do_gold(pastas):
+    silver, gold = pastas
+    gravar_ticket(silver, "a.json", CAMPOS)
+    gravar_ticket(silver, "b.json", CAMPOS)
+    tickets.processar(carregar=Carregador())
+    assert vigentes(gold) == {"a.json", "b.json"}
+
+    gravar_ticket(silver, "b.json", {**CAMPOS, "analise_pergunta": None})
+    # nenhum ticket embedado, mas a nova versão sem texto fica registrada
+    assert tickets.processar(carregar=Carregador()) == 0
+    assert tickets.processar(carregar=Carregador()) == 0
+
+    # as linhas antigas de b.json continuam na partição, mas não valem mais
+    assert vigentes(gold) == {"a.json"}
+
+
+def test_outro_modelo_reembeda_os_tickets(pastas, monkeypatch):
+    silver, gold = pastas
+    gravar_ticket(silver, "a.json", CAMPOS)
+    tickets.processar(carregar=Carregador())
+
+    monkeypatch.setattr(tickets, "identidade_do_modelo", lambda nome: f"{nome}|onnx|int8")
+    assert tickets.processar(carregar=Carregador()) == 1
+    assert tickets.processar(carregar=Carregador()) == 0
+
+    df = ler_metadados(gold, Manifest.load(tickets.MANIFEST_PATH))
+    assert set(df["modelo"]) == {f"{tickets.MODEL_NAME}|onnx|int8"}
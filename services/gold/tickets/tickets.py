@@ -1,37 +1,59 @@
 import pandas as pd
-from FlagEmbedding import FlagModel
 import time
 import os
+import sys
 import json
 import datetime
-
-PASTA_TICKETS_PROCESSADOS = '/silverII/'
-
-# Carregar todos os arquivos JSON da pasta
-tickets_files = [f for f in os.listdir(PASTA_TICKETS_PROCESSADOS) if f.endswith('.json')]
-
-# Inicializar uma lista para armazenar os tickets
-tickets_data = []
-
-for ticket_file in tickets_files:
-    file_path = os.path.join(PASTA_TICKETS_PROCESSADOS, ticket_file)
-    with open(file_path, 'r', encoding='utf-8') as file:
-        ticket = json.load(file)
-        tickets_data.append(ticket)
-
-# Criar o DataFrame com os tickets carregados
-df_tickets = pd.DataFrame(tickets_data)
-
-def juntar_texto(row):
-    res = json.loads(row["response"]["body"]["choices"][0]["message"]["tool_calls"][0]["function"]["arguments"])
-    print(res)
-
+from common.embedding_backend import carregar_modelo as carregar_backend, identidade_do_modelo
+from common.embedding_cache import EmbeddingCache
+from common.embedding_store import EscritorParticao, listar_particoes, remover_particao, compactar as compactar_particoes
+from common.manifest import Manifest, SEM_PASSAGENS
+from common.sparse import pesos_para_esparso
+from common.chunking import blocos_do_texto, dividir_em_passagens, tokenizador_hf
+
+try:
+    # parser em C, bem mais rápido que o json da stdlib para as respostas grandes do batch
+    import orjson
+    carregar_json = orjson.loads
+except ImportError:
+    carregar_json = json.loads
+
+PASTA_TICKETS_PROCESSADOS = os.getenv("SILVER_TICKETS_PATH", '/silverII/')
+PASTA_GOLD = os.getenv("GOLD_PATH", '/gold/')
+MODEL_NAME = "davidoneil/bge-m3-ft-corpus-pt"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "/cache/embeddings.sqlite")
+MANIFEST_PATH = os.getenv("GOLD_MANIFEST_PATH", os.path.join(PASTA_GOLD, "manifest.json"))
+# float16 reduz pela metade o espaço em disco dos vetores
+EMBEDDING_DTYPE = os.getenv("GOLD_EMBEDDING_DTYPE", "float32")
+# colunas de cada passagem que seguem para o gold junto com os vetores; `texto` é o da passagem
+COLUNAS_METADADOS = ["row_id", "file_name", "id_passagem", "indice", "inicio", "fim", "texto"]
+# guarda também os pesos léxicos (esparsos) do BGE-M3, calculados no mesmo forward
+GOLD_SPARSE = os.getenv("GOLD_SPARSE", "true").lower() == "true"
+# mesmo max_length que o encode_corpus usava para passagens
+MAX_LENGTH = 512
+# tickets maiores que isso são divididos em passagens (tokens do modelo, sem os especiais)
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "32"))
+# passagens por lote enviado ao modelo e gravado na partição; limita a memória do processo
+GOLD_BATCH_SIZE = int(os.getenv("GOLD_BATCH_SIZE", "256"))
+
+
+def ler_argumentos(bruto):
+    """
+    Argumentos da tool call de uma resposta do batch, o único trecho usado;
+    o resto da resposta é descartado assim que o arquivo é lido.
+    """
+    resposta = carregar_json(bruto)
+    return carregar_json(resposta["response"]["body"]["choices"][0]["message"]["tool_calls"][0]["function"]["arguments"])
+
+
+def juntar_texto(res):
     campos = [
-        res['pergunta_principal'],
-        res['analise_pergunta'],
-        res['orientacao_fornecida'],
-        res['status_resolucao'],
-        res['roteiro_resolucao']
+        res.get('pergunta_principal'),
+        res.get('analise_pergunta'),
+        res.get('orientacao_fornecida'),
+        res.get('status_resolucao'),
+        res.get('roteiro_resolucao')
     ]
     if any(not campo for campo in campos):
         return None
@@ -43,62 +65,182 @@ def juntar_texto(row):
         f"E como status da resolução temos: {res['status_resolucao']}"
     )
 
-df_tickets["texto"] = df_tickets.apply(juntar_texto, axis=1)
-print(df_tickets[["texto"]].head())
-
-print("iniciando processo de criação de embeddings...")
-
-print("carregando modelo nosso...")
-start_time = time.time()
-# Definir o diretório de cache
-cache_dir = "/cache/"
-os.makedirs(cache_dir, exist_ok=True)
-
-# Caminho do modelo no cache
-modelo_cache_path = os.path.join(cache_dir, "flag_model")
-
-# Verificar se o modelo já está na pasta de cache
-
-start_time = time.time()
-model = FlagModel(
-    model_name_or_path="davidoneil/bge-m3-ft-corpus-pt",
-    query_instruction_for_retrieval="Represent this sentence for searching relevant passages:",
-    use_fp16=True,
-    cache_dir=modelo_cache_path
-)
-print(f"Modelo carregado e salvo em {modelo_cache_path} em {time.time() - start_time:.2f} segundos")
-
-
-print("preparando textos para embeddings...")
-textos = df_tickets['texto'].tolist()
-print(f"total de textos: {len(textos)}")
-print(f"tamanho médio dos textos: {sum(len(texto) for texto in textos) / len(textos):.0f} caracteres")
-
-print("\primeiro 3 textos:")
-for i, texto in enumerate(textos[:3]):
-    print(f"  {i+1}. {texto[:100]}...")
-
-print("\ncreate embeddings...")
-start_time = time.time()
-response = model.encode_corpus(textos)
-print("textos", len(textos))
-print("response", len(response))
-embeddings = response
-print(f"embeddigns criados em {time.time() - start_time:.2f} segundos")
-print(f"format dos embeddings: {embeddings.shape}")
-
-print("add embeddings ao DataFrame...")
-df_tickets['embeddings'] = embeddings.tolist()
-print(f" Colunas do DataFrame: {list(df_tickets.columns)}")
-print(f" Forma final do DataFrame: {df_tickets.shape}")
-
-
-timestamp = int(datetime.datetime.now().timestamp())
-print(" salalvando dados...")
-df_tickets.to_pickle(f'/gold/{timestamp}_tickets_embeddings.pkl')
-print(f" daddos salvos em '/gold/{timestamp}_tickets_embeddings.pkl'")
-
-print("\nverificando:")
-print(f"registros salvos: {len(df_tickets)}")
-print(f"primeira embedding shape: {len(df_tickets.iloc[0]['embeddings'])}")
-print("processo concluído")
\ No newline at end of file
+
+def iterar_tickets(alterados):
+    """Gera (nome, mtime, sha, texto) lendo um arquivo de /silverII/ por vez."""
+    for nome, mtime, sha in alterados:
+        with open(os.path.join(PASTA_TICKETS_PROCESSADOS, nome), 'rb') as file:
+            bruto = file.read()
+        yield nome, mtime, sha, juntar_texto(ler_argumentos(bruto))
+
+
+def carregar_modelo():
+    print("carregando modelo nosso...")
+    # Definir o diretório de cache
+    cache_dir = "/cache/"
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # Caminho do modelo no cache
+    modelo_cache_path = os.path.join(cache_dir, "flag_model")
+
+    start_time = time.time()
+    # backend (torch ou onnx) escolhido por EMBEDDING_BACKEND
+    model = carregar_backend(
+        MODEL_NAME,
+        cache_dir=modelo_cache_path,
+        query_instruction_for_retrieval="Represent this sentence for searching relevant passages:",
+    )
+    print(f"Modelo carregado e salvo em {modelo_cache_path} em {time.time() - start_time:.2f} segundos")
+    return model
+
+
+def iterar_passagens(tickets, manifest, particao, tokenizer, modelo=None):
+    """
+    Divide cada ticket em passagens, uma linha por passagem com o row_id e o
+    file_name do ticket de origem. O ticket é registrado no manifest quando
+    passa por aqui, na `particao` se tiver passagens ou em SEM_PASSAGENS se
+    não tiver (as linhas de uma versão anterior deixam de valer); o manifest
+    só é salvo depois da partição gravada.
+    """
+    tokenizar = tokenizador_hf(tokenizer)
+    for nome, mtime, sha, texto in tickets:
+        passagens = dividir_em_passagens(
+            blocos_do_texto(texto or ""), nome,
+            tamanho=CHUNK_TOKENS, sobreposicao=CHUNK_OVERLAP, tokenizar=tokenizar,
+        )
+        row_id = manifest.registrar(nome, mtime, sha, particao if passagens else SEM_PASSAGENS, modelo=modelo)
+        for passagem in passagens:
+            yield {
+                "row_id": row_id,
+                "file_name": nome,
+                "id_passagem": passagem["id_passagem"],
+                "indice": passagem["indice"],
+                "inicio": passagem["inicio"],
+                "fim": passagem["fim"],
+                "texto": passagem["texto"],
+            }
+
+
+def em_lotes(itens, tamanho):
+    lote = []
+    for item in itens:
+        lote.append(item)
+        if len(lote) == tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def criar_embeddings(model, textos, cache):
+    # passagens não levam instrução
+    esparsos = None
+    if GOLD_SPARSE:
+        # denso e pesos léxicos saem do mesmo forward e ficam os dois no cache;
+        # só os textos que faltam em algum deles passam pelo modelo
+        def encode(faltando):
+            output = model.encode(faltando, max_length=MAX_LENGTH, return_dense=True, return_sparse=True)
+            return output['dense_vecs'], [pesos_para_esparso(pesos) for pesos in output['lexical_weights']]
+        embeddings, esparsos = cache.encode_com_esparsos(textos, encode)
+    else:
+        embeddings = cache.encode(textos, lambda faltando: model.encode(faltando, max_length=MAX_LENGTH)['dense_vecs'])
+    return embeddings, esparsos
+
+
+def processar(carregar=carregar_modelo):
+    """
+    Embeda apenas os tickets novos ou alterados desde a última execução e
+    grava o resultado como uma partição delta em /gold/. Devolve quantos
+    tickets foram embedados. `carregar` devolve o modelo, só chamado se
+    houver o que embedar (o orquestrador passa o modelo já carregado).
+    """
+    os.makedirs(PASTA_GOLD, exist_ok=True)
+    manifest = Manifest.load(MANIFEST_PATH)
+    identidade = identidade_do_modelo(MODEL_NAME)
+    # vetores de outro modelo/backend/precisão não valem mais, mesmo com o texto igual
+    outros = manifest.invalidar_outro_modelo(identidade)
+    if outros:
+        print(f"{len(outros)} arquivos embedados com outro modelo; serão embedados de novo com '{identidade}'")
+    # registros que apontam para partições que não existem mais no formato
+    # .npy (as .pkl de versões antigas) voltam a ser embedados
+    orfaos = manifest.invalidar_sem_particao(set(listar_particoes(PASTA_GOLD)))
+    if orfaos:
+        print(f"{len(orfaos)} arquivos do manifest sem partição .npy; serão embedados de novo")
+
+    # Listar todos os arquivos JSON da pasta
+    tickets_files = sorted(f for f in os.listdir(PASTA_TICKETS_PROCESSADOS) if f.endswith('.json'))
+    alterados = manifest.alterados(PASTA_TICKETS_PROCESSADOS, tickets_files)
+    removidos = manifest.removidos(tickets_files)
+    print(f"arquivos: {len(tickets_files)} | novos ou alterados: {len(alterados)} | removidos: {len(removidos)}")
+
+    for nome in removidos:
+        manifest.remover(nome)
+
+    if not alterados:
+        manifest.save()
+        print("nenhum ticket novo para embedar")
+        return 0
+
+    print("iniciando processo de criação de embeddings...")
+    model = carregar()
+
+    timestamp = int(datetime.datetime.now().timestamp())
+    particao = f'{timestamp}_tickets_embeddings'
+
+    # arquivo -> texto -> passagens -> lotes de GOLD_BATCH_SIZE -> modelo -> partição, tudo em
+    # streaming: a memória depende do tamanho do lote, não do número de tickets
+    start_time = time.time()
+    cache = EmbeddingCache(EMBEDDING_CACHE_PATH, model_name=identidade, max_length=MAX_LENGTH)
+    passagens = iterar_passagens(iterar_tickets(alterados), manifest, particao, model.tokenizer, modelo=identidade)
+    try:
+        with EscritorParticao(PASTA_GOLD, particao, dtype=EMBEDDING_DTYPE, com_esparsos=GOLD_SPARSE) as escritor:
+            for lote in em_lotes(passagens, GOLD_BATCH_SIZE):
+                # o snapshot compara o modelo de cada linha com o do ponto no Qdrant
+                df_lote = pd.DataFrame(lote, columns=COLUNAS_METADADOS).assign(modelo=identidade)
+                embeddings, esparsos = criar_embeddings(model, df_lote['texto'].tolist(), cache)
+                escritor.escrever(df_lote, embeddings, esparsos)
+                print(f"{escritor.linhas} passagens gravadas ({escritor.linhas / (time.time() - start_time):.0f} passagens/s)")
+    finally:
+        print(f"cache de embeddings: {cache.stats()}")
+        cache.close()
+
+    # o manifest só é atualizado depois que a partição está gravada
+    manifest.save()
+    if not escritor.linhas:
+        print("nenhum ticket com texto para embedar")
+        return 0
+    print(f"{len(alterados)} tickets -> {escritor.linhas} passagens (dim {escritor.dim}) "
+          f"em {time.time() - start_time:.2f} segundos")
+    print(f" daddos salvos em '{os.path.join(PASTA_GOLD, particao)}'")
+    print("processo concluído")
+    return len(alterados)
+
+
+def compactar():
+    """Junta todas as partições delta em uma só, descartando versões antigas e tickets removidos."""
+    manifest = Manifest.load(MANIFEST_PATH)
+    antigas = listar_particoes(PASTA_GOLD)
+    if len(antigas) <= 1:
+        print("nada para compactar")
+        return
+
+    timestamp = int(datetime.datetime.now().timestamp())
+    particao = f'{timestamp}_tickets_embeddings'
+    total = compactar_particoes(PASTA_GOLD, particao, manifest, dtype=EMBEDDING_DTYPE)
+
+    for registro in manifest.arquivos.values():
+        if registro["particao"] != SEM_PASSAGENS:
+            registro["particao"] = particao
+    manifest.save()
+
+    for nome in antigas:
+        if nome != particao:
+            remover_particao(PASTA_GOLD, nome)
+    print(f"{len(antigas)} partições compactadas em '{particao}' ({total} registros)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "compact":
+        compactar()
+    else:
+        processar()
@@ -0,0 +1,364 @@
+"""
+Executor de DAG em threads para o pipeline medalhão. Cada etapa tem suas
+próprias threads e recebe itens das etapas de que depende por uma fila
+limitada: a etapa seguinte começa assim que o primeiro item fica pronto, e
+uma etapa lenta segura as anteriores (backpressure) em vez de deixar o
+trabalho acumular em memória. O tempo total tende ao da etapa mais lenta,
+não à soma das etapas.
+
+Cada etapa pode ter um checkpoint (JSON lines com as chaves já concluídas e
+as saídas que elas geraram): numa nova execução, esses itens não são
+processados de novo, só têm as saídas reemitidas, então uma falha no meio
+não obriga a refazer o que já tinha passado.
+
+Uma etapa que falha marca como falhas também as que dependem dela: as
+tarefas (que rodam sobre a saída inteira das dependências) são puladas.
+"""
+import json
+import os
+import queue
+import threading
+import time
+import traceback
+
+# marca de fim na fila de entrada de uma etapa
+_FIM = object()
+
+
+class Canal:
+    """Fila limitada de entrada de uma etapa; termina quando todos os produtores fecham."""
+
+    def __init__(self, capacidade, produtores):
+        self._fila = queue.Queue(maxsize=capacidade)
+        self._abertos = produtores
+        self._lock = threading.Lock()
+        if produtores == 0:
+            self._fila.put(_FIM)
+
+    def colocar(self, item):
+        self._fila.put(item)
+
+    def fechar(self):
+        with self._lock:
+            self._abertos -= 1
+            ultimo = self._abertos == 0
+        if ultimo:
+            self._fila.put(_FIM)
+
+    def tirar(self, timeout=None):
+        """Próximo item ou `_FIM`; levanta queue.Empty se nada chegar em `timeout` segundos."""
+        item = self._fila.get(timeout=timeout)
+        if item is _FIM:
+            # devolve a marca para os outros workers da etapa também pararem
+            self._fila.put(_FIM)
+        return item
+
+
+class Checkpoint:
+    """Chaves concluídas por uma etapa e suas saídas, gravadas (append) a cada item."""
+
+    def __init__(self, path):
+        self.path = path
+        self.concluidos = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for linha in f:
+                    try:
+                        registro = json.loads(linha)
+                    except ValueError:
+                        # linha cortada por uma queda no meio da escrita
+                        continue
+                    self.concluidos[registro["chave"]] = registro["saidas"]
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # reescreve compactado (uma linha por chave, sem linhas cortadas) e segue em append
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for chave, saidas in self.concluidos.items():
+                f.write(json.dumps({"chave": chave, "saidas": saidas}, ensure_ascii=False) + "\n")
+        os.replace(tmp, path)
+        self._arquivo = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def registrar(self, chave, saidas):
+        with self._lock:
+            self.concluidos[chave] = saidas
+            self._arquivo.write(json.dumps({"chave": chave, "saidas": saidas}, ensure_ascii=False) + "\n")
+            self._arquivo.flush()
+
+    def fechar(self):
+        self._arquivo.close()
+
+
+class Etapa:
+    """
+    Uma etapa do DAG. Há três formas:
+
+    - fonte (`gerar`): sem dependências, chama `gerar(emitir)` uma vez e
+      entrega cada item com `emitir(item)`;
+    - transformação (`processar`): para cada item recebido devolve a lista de
+      itens que seguem adiante; com `lote` > 1, recebe uma lista de até
+      `lote` itens (esperando no máximo `espera_lote` segundos para completar)
+      e devolve uma lista de saídas por item;
+    - tarefa: sem `gerar` nem `processar`, só consome as entradas e roda
+      `concluir`, que pode devolver quantos itens processou.
+
+    `concluir()` roda uma vez, depois do último item; `iniciar()` antes do
+    primeiro, na thread da etapa. `chave(item)` identifica o item no
+    checkpoint e `retomado(item, saidas)` é chamado para os itens pulados
+    por já estarem nele.
+    """
+
+    def __init__(self, nome, gerar=None, processar=None, depende_de=(), concorrencia=1, capacidade=256,
+                 lote=1, espera_lote=1.0, chave=None, checkpoint=True, iniciar=None, concluir=None,
+                 retomado=None):
+        if gerar is not None and (processar is not None or depende_de):
+            raise ValueError(f"{nome}: uma fonte não tem processar nem dependências")
+        self.nome = nome
+        self.gerar = gerar
+        self.processar = processar
+        self.depende_de = list(depende_de)
+        self.concorrencia = max(1, concorrencia)
+        self.capacidade = capacidade
+        self.lote = max(1, lote)
+        self.espera_lote = espera_lote
+        self.chave = chave or (lambda item: json.dumps(item, sort_keys=True, ensure_ascii=False))
+        self.checkpoint = checkpoint and processar is not None
+        self.iniciar = iniciar
+        self.concluir = concluir
+        self.retomado = retomado
+
+
+class Metricas:
+    def __init__(self):
+        self.recebidos = 0
+        self.processados = 0
+        self.retomados = 0
+        self.erros = 0
+        self.emitidos = 0
+        self.ocupado = 0.0
+        self.bloqueado = 0.0
+        self.inicio = None
+        self.primeiro = None
+        self.fim = None
+        self.falhou = None
+        self._lock = threading.Lock()
+
+    def somar(self, **valores):
+        with self._lock:
+            for campo, valor in valores.items():
+                setattr(self, campo, getattr(self, campo) + valor)
+
+    def resumo(self, concorrencia, origem):
+        segundos = (self.fim or time.perf_counter()) - self.inicio
+        return {
+            "recebidos": self.recebidos,
+            "processados": self.processados,
+            "retomados": self.retomados,
+            "erros": self.erros,
+            "emitidos": self.emitidos,
+            "segundos": segundos,
+            # quando a etapa começou a trabalhar, relativo ao início do DAG
+            "primeiro_item_s": None if self.primeiro is None else self.primeiro - origem,
+            "itens_por_segundo": self.processados / segundos if segundos else 0.0,
+            "ocupacao": self.ocupado / (segundos * concorrencia) if segundos else 0.0,
+            "bloqueado_s": self.bloqueado,
+            "concorrencia": concorrencia,
+            "falhou": self.falhou,
+        }
+
+
+class Orquestrador:
+    """Roda um conjunto de Etapa como DAG, com checkpoints em `pasta_checkpoints`."""
+
+    def __init__(self, etapas, pasta_checkpoints):
+        self.etapas = {etapa.nome: etapa for etapa in etapas}
+        self.pasta_checkpoints = pasta_checkpoints
+        for etapa in etapas:
+            for dependencia in etapa.depende_de:
+                if dependencia not in self.etapas:
+                    raise ValueError(f"{etapa.nome} depende de {dependencia}, que não está no DAG")
+        self.ordem = self._ordenar()
+        self.seguintes = {nome: [] for nome in self.etapas}
+        for etapa in etapas:
+            for dependencia in etapa.depende_de:
+                self.seguintes[dependencia].append(etapa.nome)
+        self.metricas = {nome: Metricas() for nome in self.etapas}
+
+    def _ordenar(self):
+        ordem, visitando, visitadas = [], set(), set()
+
+        def visitar(nome):
+            if nome in visitadas:
+                return
+            if nome in visitando:
+                raise ValueError(f"ciclo no DAG passando por {nome}")
+            visitando.add(nome)
+            for dependencia in self.etapas[nome].depende_de:
+                visitar(dependencia)
+            visitando.discard(nome)
+            visitadas.add(nome)
+            ordem.append(nome)
+
+        for nome in self.etapas:
+            visitar(nome)
+        return ordem
+
+    def executar(self):
+        """Roda o DAG até o fim e devolve o resumo por etapa."""
+        self.origem = time.perf_counter()
+        self.canais = {
+            nome: Canal(etapa.capacidade, len(etapa.depende_de))
+            for nome, etapa in self.etapas.items() if etapa.gerar is None
+        }
+        threads = [
+            threading.Thread(target=self._rodar_etapa, args=(self.etapas[nome],), name=f"etapa-{nome}")
+            for nome in self.ordem
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.segundos = time.perf_counter() - self.origem
+        return {nome: self.metricas[nome].resumo(self.etapas[nome].concorrencia, self.origem) for nome in self.ordem}
+
+    def _emitir(self, etapa, itens):
+        metricas = self.metricas[etapa.nome]
+        inicio = time.perf_counter()
+        for item in itens:
+            for seguinte in self.seguintes[etapa.nome]:
+                self.canais[seguinte].colocar(item)
+            metricas.somar(emitidos=1)
+        metricas.somar(bloqueado=time.perf_counter() - inicio)
+
+    def _rodar_etapa(self, etapa):
+        metricas = self.metricas[etapa.nome]
+        metricas.inicio = time.perf_counter()
+        checkpoint = None
+        try:
+            if etapa.checkpoint:
+                checkpoint = Checkpoint(os.path.join(self.pasta_checkpoints, f"{etapa.nome}.jsonl"))
+            if etapa.iniciar is not None:
+                etapa.iniciar()
+            if etapa.gerar is not None:
+                def emitir(item):
+                    if metricas.primeiro is None:
+                        metricas.primeiro = time.perf_counter()
+                    metricas.somar(processados=1)
+                    self._emitir(etapa, [item])
+                inicio = time.perf_counter()
+                etapa.gerar(emitir)
+                # o tempo parado em filas cheias adiante não conta como trabalho da fonte
+                metricas.somar(ocupado=time.perf_counter() - inicio - metricas.bloqueado)
+            else:
+                workers = [
+                    threading.Thread(target=self._worker, args=(etapa, checkpoint), name=f"{etapa.nome}-{i}")
+                    for i in range(etapa.concorrencia)
+                ]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+            tarefa = etapa.processar is None and etapa.gerar is None
+            # a entrada só termina depois que as dependências terminaram, com ou sem falha
+            falhas = [dependencia for dependencia in etapa.depende_de if self.metricas[dependencia].falhou]
+            if falhas:
+                # a falha segue adiante no DAG; uma tarefa roda sobre a saída completa das
+                # dependências e é pulada, uma transformação já tratou o que chegou
+                metricas.falhou = f"dependência {', '.join(falhas)} falhou"
+                print(f"[ERRO] etapa {etapa.nome} {'pulada' if tarefa else 'incompleta'}: {metricas.falhou}")
+            if etapa.concluir is not None and not (falhas and tarefa):
+                inicio = time.perf_counter()
+                if tarefa:
+                    metricas.primeiro = inicio
+                feitos = etapa.concluir()
+                if tarefa:
+                    # uma tarefa informa quantos itens processou
+                    metricas.somar(processados=feitos or 0, ocupado=time.perf_counter() - inicio)
+        except Exception:
+            metricas.falhou = traceback.format_exc()
+            print(f"[ERRO] etapa {etapa.nome} falhou:\n{metricas.falhou}")
+            # uma etapa quebrada não pode travar as anteriores: o resto da entrada é descartado
+            if etapa.gerar is None:
+                self._drenar(etapa)
+        finally:
+            if checkpoint is not None:
+                checkpoint.fechar()
+            metricas.fim = time.perf_counter()
+            for seguinte in self.seguintes[etapa.nome]:
+                self.canais[seguinte].fechar()
+
+    def _drenar(self, etapa):
+        while self.canais[etapa.nome].tirar() is not _FIM:
+            pass
+
+    def _proximo_lote(self, etapa, checkpoint):
+        """Até `etapa.lote` itens ainda não concluídos; None quando a entrada acabou."""
+        canal = self.canais[etapa.nome]
+        metricas = self.metricas[etapa.nome]
+        lote = []
+        limite = None
+        while len(lote) < etapa.lote:
+            espera = None if limite is None else limite - time.perf_counter()
+            if espera is not None and espera <= 0:
+                break
+            try:
+                item = canal.tirar(timeout=espera)
+            except queue.Empty:
+                break
+            if item is _FIM:
+                return lote or None
+            metricas.somar(recebidos=1)
+            if metricas.primeiro is None:
+                metricas.primeiro = time.perf_counter()
+            if etapa.processar is None:
+                continue
+            chave = etapa.chave(item)
+            if checkpoint is not None and chave in checkpoint.concluidos:
+                saidas = checkpoint.concluidos[chave]
+                if etapa.retomado is not None:
+                    etapa.retomado(item, saidas)
+                metricas.somar(retomados=1)
+                self._emitir(etapa, saidas)
+                continue
+            lote.append((chave, item))
+            if limite is None:
+                limite = time.perf_counter() + etapa.espera_lote
+        return lote
+
+    def _worker(self, etapa, checkpoint):
+        metricas = self.metricas[etapa.nome]
+        while True:
+            lote = self._proximo_lote(etapa, checkpoint)
+            if lote is None:
+                return
+            if not lote:
+                continue
+            inicio = time.perf_counter()
+            try:
+                if etapa.lote > 1:
+                    resultados = etapa.processar([item for _, item in lote])
+                else:
+                    resultados = [etapa.processar(lote[0][1])]
+            except Exception as e:
+                # o item não entra no checkpoint e é tentado de novo na próxima execução
+                metricas.somar(erros=len(lote), ocupado=time.perf_counter() - inicio)
+                print(f"[ERRO] {etapa.nome}: {[chave for chave, _ in lote][:5]} - {e}")
+                continue
+            metricas.somar(processados=len(lote), ocupado=time.perf_counter() - inicio)
+            for (chave, _), saidas in zip(lote, resultados):
+                saidas = list(saidas or [])
+                if checkpoint is not None:
+                    checkpoint.registrar(chave, saidas)
+                self._emitir(etapa, saidas)
+
+
+def imprimir_resumo(resumo, segundos):
+    print(f"\n{'etapa':<20}{'itens':>8}{'retom.':>8}{'erros':>7}{'emit.':>8}{'início':>9}{'seg.':>9}"
+          f"{'itens/s':>10}{'ocup.':>7}{'bloq.':>8}")
+    for nome, medida in resumo.items():
+        primeiro = "-" if medida["primeiro_item_s"] is None else f"{medida['primeiro_item_s']:.1f}s"
+        print(f"{nome:<20}{medida['processados']:>8}{medida['retomados']:>8}{medida['erros']:>7}"
+              f"{medida['emitidos']:>8}{primeiro:>9}{medida['segundos']:>8.1f}s{medida['itens_por_segundo']:>10.1f}"
+              f"{medida['ocupacao']:>7.0%}{medida['bloqueado_s']:>7.1f}s"
+              + ("  FALHOU" if medida["falhou"] else ""))
+    print(f"total: {segundos:.2f}s")
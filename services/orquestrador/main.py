@@ -0,0 +1,334 @@
+"""
+Pipeline medalhão como DAG, no lugar da cadeia sequencial do docker-compose:
+
+    bronze -> silver -> gold_kb -> gold_kb_snapshots   (base de conhecimento, item a item)
+    gold_tickets -> gold_snapshots                     (tickets, em paralelo com o ramo acima)
+
+Cada página resolvida pelo crawler do bronze já segue para o silver, e cada
+artigo convertido segue para o gold_kb, que embeda as passagens em lotes de
+documentos e grava uma partição por lote em GOLD_KB_PATH. No fim do ramo, o
+gold_kb_snapshots carrega essas partições na coleção GOLD_KB_COLLECTION do
+Qdrant, com o mesmo create_collection (alias, ids estáveis) dos tickets. As etapas de
+tickets são as mesmas de antes (gold/tickets e gold/snapshots), rodando ao
+mesmo tempo que o ramo da base de conhecimento e com o modelo compartilhado.
+
+Concorrência por etapa: ORQ_CONCORRENCIA (ex.: "silver=16,gold_kb=1") ou
+--concorrencia; o bronze segue BRONZE_CONCURRENCY. Os checkpoints ficam em
+ORQ_CHECKPOINT_PATH: rodar de novo depois de uma falha retoma de onde parou.
+
+Uso (a partir de services/):
+    python -m orquestrador.main
+    python -m orquestrador.main --etapas bronze,silver,gold_kb --concorrencia silver=8 --saida resumo.json
+"""
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+import pandas as pd
+
+from common.blob_store import abrir_store
+from common.crawl_state import CrawlState, ESTADO_SILVER, ler_json, gravar_json
+from common.embedding_backend import identidade_do_modelo
+from common.embedding_cache import EmbeddingCache
+from common.embedding_store import EscritorParticao
+from common.manifest import Manifest
+from orquestrador.dag import Etapa, Orquestrador, imprimir_resumo
+
+SERVICES = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUCKET = os.getenv("BUCKET_NAME", "pdm-2025-knowledge-base")
+SILVER_STORAGE = os.getenv("SILVER_STORAGE", f"gs://{BUCKET}")
+ETAPAS = os.getenv("ORQ_ETAPAS", "bronze,silver,gold_kb,gold_kb_snapshots,gold_tickets,gold_snapshots")
+# itens em espera entre duas etapas; uma fila cheia segura a etapa anterior
+ORQ_CAPACIDADE = int(os.getenv("ORQ_CAPACIDADE", "256"))
+ORQ_CONCORRENCIA = os.getenv("ORQ_CONCORRENCIA", "")
+ORQ_CHECKPOINT_PATH = os.getenv("ORQ_CHECKPOINT_PATH", "/cache/orquestrador/")
+# documentos por partição do gold_kb e espera máxima para completar um lote
+GOLD_KB_PATH = os.getenv("GOLD_KB_PATH", "/gold_kb/")
+GOLD_KB_LOTE = int(os.getenv("GOLD_KB_LOTE", "32"))
+GOLD_KB_ESPERA = float(os.getenv("GOLD_KB_ESPERA", "2"))
+# alias da coleção da base de conhecimento no Qdrant (a de tickets é a tickets_homolog)
+GOLD_KB_COLLECTION = os.getenv("GOLD_KB_COLLECTION", "knowledge_base_homolog")
+
+
+def importar(caminho, nome):
+    """
+    Carrega o script de uma etapa com um nome próprio (bronze e silver têm
+    os dois um main.py), com a pasta dele no sys.path para os imports locais.
+    """
+    pasta = os.path.join(SERVICES, os.path.dirname(caminho))
+    if pasta not in sys.path:
+        sys.path.insert(0, pasta)
+    spec = importlib.util.spec_from_file_location(nome, os.path.join(SERVICES, caminho))
+    modulo = importlib.util.module_from_spec(spec)
+    # registrado para as funções do módulo irem por pickle aos processos de parse
+    sys.modules[nome] = modulo
+    spec.loader.exec_module(modulo)
+    return modulo
+
+
+def ler_concorrencia(texto):
+    """"silver=16,gold_kb=1" -> {"silver": 16, "gold_kb": 1}"""
+    resultado = {}
+    for par in filter(None, (p.strip() for p in texto.split(","))):
+        nome, valor = par.split("=")
+        resultado[nome.strip()] = int(valor)
+    return resultado
+
+
+class ModeloCompartilhado:
+    """Carrega o modelo do gold uma vez só, na primeira etapa que pedir."""
+
+    def __init__(self, carregar):
+        self._carregar = carregar
+        self._modelo = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            if self._modelo is None:
+                self._modelo = self._carregar()
+            return self._modelo
+
+
+def etapa_bronze(bronze, store, arquivo_links=None, store_silver=None):
+    def links():
+        if arquivo_links:
+            with open(arquivo_links, encoding="utf-8") as f:
+                return pd.DataFrame({"link": [linha.strip() for linha in f if linha.strip()]})
+        return bronze.get_all_links_from_knowledge_base()
+
+    def gerar(emitir):
+        emitidos = set()
+
+        def ao_concluir(blob_name, sha):
+            emitidos.add(blob_name)
+            emitir({"blob": blob_name, "sha256": sha})
+
+        df = links()
+        print(f"[bronze] {len(df)} links na base de conhecimento")
+        asyncio.run(bronze.get_html_pages(df, store, ao_concluir=ao_concluir))
+        # páginas que o crawl não visitou (BRONZE_RECRAWL=false, MAX_DOWNLOADS, erro de rede)
+        # seguem com o último hash conhecido, para o silver não perder nenhuma
+        vivos = CrawlState(store).hashes_por_blob()
+        for blob_name, sha in vivos.items():
+            if blob_name not in emitidos:
+                emitir({"blob": blob_name, "sha256": sha})
+        # páginas que o silver já converteu e saíram do estado do crawl (fora da lista de
+        # links ou 404/410) seguem como removidas, até o gold_kb e a coleção do Qdrant
+        convertidos = ler_json(store_silver or store, ESTADO_SILVER, {})
+        removidos = {registro["origem"] for registro in convertidos.values()} - set(vivos)
+        for blob_name in sorted(removidos):
+            emitir({"blob": blob_name, "sha256": None, "removido": True})
+        print(f"[bronze] {len(removidos)} páginas removidas da base de conhecimento")
+
+    return Etapa("bronze", gerar=gerar)
+
+
+def etapa_silver(silver, store, processos, concorrencia):
+    estado = ler_json(store, ESTADO_SILVER, {})
+    existentes = set()
+
+    def iniciar():
+        existentes.update(store.listar("silver/"))
+
+    def processar(item):
+        txt_blob_name, chunks_blob_name = silver.nomes_silver(item["blob"])
+        id_documento = os.path.basename(txt_blob_name)
+        if item.get("removido"):
+            # o registro fica marcado (e segue sendo emitido pelo bronze) até a página voltar;
+            # assim a remoção chega ao gold_kb mesmo se uma execução parar no meio
+            estado[id_documento] = {"origem": item["blob"], "sha256": None, "removido": True}
+            return [{"documento": id_documento, "sha256": None, "removido": True}]
+        registro = estado.get(id_documento)
+        convertido = (registro is not None and registro["sha256"] == item["sha256"]
+                      and txt_blob_name in existentes and chunks_blob_name in existentes)
+        if convertido:
+            sha = registro["sha256"]
+        else:
+            id_documento, sha, _ = silver.converter_blob(store, item["blob"], silver.SILVER_HTML_PARSER, processos)
+            estado[id_documento] = {"origem": item["blob"], "sha256": sha}
+        return [{"documento": id_documento, "chunks": chunks_blob_name, "sha256": sha}]
+
+    def retomado(item, saidas):
+        # o estado só é gravado no fim; numa retomada, o checkpoint repõe o que já foi convertido
+        for saida in saidas:
+            estado[saida["documento"]] = {"origem": item["blob"], "sha256": saida["sha256"]}
+            if saida.get("removido"):
+                estado[saida["documento"]]["removido"] = True
+
+    def concluir():
+        if processos is not None:
+            processos.shutdown()
+        gravar_json(store, ESTADO_SILVER, estado)
+
+    return Etapa(
+        "silver", processar=processar, depende_de=["bronze"], concorrencia=concorrencia,
+        capacidade=ORQ_CAPACIDADE, chave=lambda item: f"{item['blob']}@{item['sha256']}",
+        iniciar=iniciar, concluir=concluir, retomado=retomado,
+    )
+
+
+def etapa_gold_kb(tickets, store, modelo, concorrencia):
+    """
+    Embeda as passagens (.chunks.jsonl do silver) dos artigos que chegam,
+    `GOLD_KB_LOTE` documentos por partição, com o mesmo modelo, cache e
+    formato de partição do gold de tickets. O manifest em GOLD_KB_PATH guarda
+    o hash de cada artigo: um artigo sem mudança passa direto, e um artigo
+    removido sai do manifest (e, no gold_kb_snapshots, da coleção).
+    """
+    os.makedirs(GOLD_KB_PATH, exist_ok=True)
+    manifest = Manifest.load(os.path.join(GOLD_KB_PATH, "manifest.json"))
+    lock = threading.Lock()
+    sequencia = itertools.count()
+    recursos = {}
+
+    identidade = identidade_do_modelo(tickets.MODEL_NAME)
+
+    def iniciar():
+        recursos["cache"] = EmbeddingCache(
+            tickets.EMBEDDING_CACHE_PATH, model_name=identidade, max_length=tickets.MAX_LENGTH,
+        )
+
+    def passagens(item, row_id):
+        for linha in store.ler_texto(item["chunks"]).splitlines():
+            if not linha.strip():
+                continue
+            passagem = json.loads(linha)
+            yield {
+                "row_id": row_id,
+                "file_name": item["documento"],
+                "id_passagem": passagem["id_passagem"],
+                "indice": passagem["indice"],
+                "inicio": passagem["inicio"],
+                "fim": passagem["fim"],
+                "texto": passagem["texto"],
+            }
+
+    def processar(itens):
+        removidos = [item for item in itens if item.get("removido")]
+        itens_vivos = [item for item in itens if not item.get("removido")]
+        if removidos:
+            with lock:
+                presentes = [item["documento"] for item in removidos if item["documento"] in manifest.arquivos]
+                for documento in presentes:
+                    manifest.remover(documento)
+                if presentes:
+                    manifest.save()
+                    print(f"[gold_kb] {len(presentes)} artigos removidos")
+        with lock:
+            # reembeda também o artigo igual que foi embedado com outro modelo
+            novos = [item for item in itens_vivos
+                     if manifest.arquivos.get(item["documento"], {}).get("sha256") != item["sha256"]
+                     or manifest.arquivos[item["documento"]].get("modelo") != identidade]
+            row_ids = {item["documento"]: manifest.reservar(item["documento"]) for item in novos}
+        if novos:
+            model = modelo()
+            particao = f"{int(time.time())}_{next(sequencia):06d}_kb_embeddings"
+            linhas = itertools.chain.from_iterable(passagens(item, row_ids[item["documento"]]) for item in novos)
+            with EscritorParticao(GOLD_KB_PATH, particao, dtype=tickets.EMBEDDING_DTYPE,
+                                  com_esparsos=tickets.GOLD_SPARSE) as escritor:
+                for lote in tickets.em_lotes(linhas, tickets.GOLD_BATCH_SIZE):
+                    df_lote = pd.DataFrame(lote, columns=tickets.COLUNAS_METADADOS).assign(modelo=identidade)
+                    embeddings, esparsos = tickets.criar_embeddings(model, df_lote["texto"].tolist(), recursos["cache"])
+                    escritor.escrever(df_lote, embeddings, esparsos)
+            # o manifest só é atualizado depois que a partição está gravada
+            with lock:
+                for item in novos:
+                    manifest.registrar(item["documento"], None, item["sha256"], particao,
+                                       row_id=row_ids[item["documento"]], modelo=identidade)
+                manifest.save()
+            print(f"[gold_kb] {len(novos)} artigos -> {escritor.linhas} passagens em '{particao}'")
+        return [[] for _ in itens]
+
+    def concluir():
+        if "cache" in recursos:
+            recursos["cache"].close()
+
+    return Etapa(
+        "gold_kb", processar=processar, depende_de=["silver"], concorrencia=concorrencia,
+        capacidade=ORQ_CAPACIDADE, lote=GOLD_KB_LOTE, espera_lote=GOLD_KB_ESPERA,
+        # sem checkpoint: o manifest já pula o que está embedado, e um checkpoint por hash
+        # esconderia um artigo que foi removido e voltou com o mesmo conteúdo
+        checkpoint=False,
+        iniciar=iniciar, concluir=concluir,
+    )
+
+
+def etapa_gold_tickets(tickets, modelo):
+    return Etapa("gold_tickets", concluir=lambda: tickets.processar(carregar=modelo))
+
+
+def etapa_gold_snapshots(create_collection):
+    return Etapa("gold_snapshots", depende_de=["gold_tickets"],
+                 concluir=lambda: create_collection.main()["enviados"])
+
+
+def etapa_gold_kb_snapshots(create_collection):
+    return Etapa("gold_kb_snapshots", depende_de=["gold_kb"], concluir=lambda: create_collection.main(
+        gold=GOLD_KB_PATH, colecao=GOLD_KB_COLLECTION, manifest_path=os.path.join(GOLD_KB_PATH, "manifest.json"),
+    )["enviados"])
+
+
+def montar(etapas, concorrencia, arquivo_links=None):
+    """Monta as etapas pedidas; os pools de processos do silver sobem aqui, antes das threads."""
+    concorrencia = {**ler_concorrencia(ORQ_CONCORRENCIA), **concorrencia}
+    resultado = []
+    if "silver" in etapas:
+        # fork antes de importar o resto (torch, clientes de rede), que pode criar threads
+        silver = importar("silver/main.py", "silver_main")
+        processos = silver.abrir_parsers(silver.SILVER_PARSE_WORKERS)
+    modelo = None
+    if {"gold_kb", "gold_tickets"} & set(etapas):
+        tickets = importar("gold/tickets/tickets.py", "gold_tickets")
+        modelo = ModeloCompartilhado(tickets.carregar_modelo)
+    if "bronze" in etapas:
+        bronze = importar("bronze/main.py", "bronze_main")
+        resultado.append(etapa_bronze(
+            bronze, abrir_store(bronze.BRONZE_STORAGE), arquivo_links, store_silver=abrir_store(SILVER_STORAGE),
+        ))
+    if "silver" in etapas:
+        resultado.append(etapa_silver(
+            silver, abrir_store(SILVER_STORAGE), processos, concorrencia.get("silver", silver.SILVER_IO_WORKERS),
+        ))
+    if "gold_kb" in etapas:
+        resultado.append(etapa_gold_kb(tickets, abrir_store(SILVER_STORAGE), modelo, concorrencia.get("gold_kb", 1)))
+    if "gold_tickets" in etapas:
+        resultado.append(etapa_gold_tickets(tickets, modelo))
+    if {"gold_snapshots", "gold_kb_snapshots"} & set(etapas):
+        create_collection = importar("gold/snapshots/create_collection.py", "create_collection")
+    if "gold_kb_snapshots" in etapas:
+        resultado.append(etapa_gold_kb_snapshots(create_collection))
+    if "gold_snapshots" in etapas:
+        resultado.append(etapa_gold_snapshots(create_collection))
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--etapas", default=ETAPAS, help="etapas do DAG; as dependências precisam estar incluídas")
+    parser.add_argument("--concorrencia", default="", help="threads por etapa, ex.: silver=16,gold_kb=1")
+    parser.add_argument("--links", help="arquivo com um link por linha, no lugar da listagem da base de conhecimento")
+    parser.add_argument("--checkpoints", default=ORQ_CHECKPOINT_PATH)
+    parser.add_argument("--saida", help="grava o resumo por etapa em JSON")
+    args = parser.parse_args()
+
+    etapas = [nome.strip() for nome in args.etapas.split(",") if nome.strip()]
+    orquestrador = Orquestrador(montar(etapas, ler_concorrencia(args.concorrencia), args.links), args.checkpoints)
+    resumo = orquestrador.executar()
+    imprimir_resumo(resumo, orquestrador.segundos)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"segundos": orquestrador.segundos, "etapas": resumo}, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if any(medida["falhou"] or medida["erros"] for medida in resumo.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
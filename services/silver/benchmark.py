@@ -0,0 +1,145 @@
+"""
+Mede a conversão HTML -> texto do silver offline, sobre um corpus sintético
+gravado em uma pasta local. A latência do GCS é simulada por operação
+(listagem, leitura, escrita, exists), para comparar o laço sequencial antigo
+com a versão concorrente. Também confere se o parser lxml produz exatamente
+o mesmo texto que o html.parser, e se o texto em blocos não perde nada do
+get_text() do artigo, que era o .txt antes da divisão em blocos.
+
+Uso:
+    CHUNK_TOKENIZER= python silver/benchmark.py --artigos 500 --latencia-ms 30
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bs4 import BeautifulSoup
+
+import main as silver
+from common.blob_store import LocalStore
+from benchmarks.corpus import gerar_corpus
+
+
+class LatenciaSimulada:
+    """Envolve um store e dorme `latencia_ms` em cada operação, como uma chamada de rede."""
+
+    def __init__(self, store, latencia_ms):
+        self.store = store
+        self.latencia = latencia_ms / 1000
+
+    def _esperar(self):
+        time.sleep(self.latencia)
+
+    def listar(self, prefixo):
+        self._esperar()
+        return self.store.listar(prefixo)
+
+    def ler_texto(self, nome):
+        self._esperar()
+        return self.store.ler_texto(nome)
+
+    def gravar_texto(self, nome, texto, content_type=None):
+        self._esperar()
+        self.store.gravar_texto(nome, texto, content_type)
+
+    def existe(self, nome):
+        self._esperar()
+        return self.store.existe(nome)
+
+    def __str__(self):
+        return f"{self.store} (+{self.latencia * 1000:.0f} ms/op)"
+
+
+def sequencial(store, prefixo):
+    """O laço original: um exists() por arquivo e tudo em série."""
+    silver._iniciar_parser()
+    inicio = time.perf_counter()
+    total = 0
+    for name in store.listar(prefixo):
+        if not name.endswith(".html"):
+            continue
+        txt_blob_name, chunks_blob_name = silver.nomes_silver(name)
+        if store.existe(txt_blob_name) and store.existe(chunks_blob_name):
+            continue
+        text, chunks, _ = silver.converter(store.ler_texto(name), os.path.basename(txt_blob_name), "html.parser")
+        store.gravar_texto(txt_blob_name, text)
+        store.gravar_texto(chunks_blob_name, chunks)
+        total += 1
+    return {"arquivos": total, "segundos": time.perf_counter() - inicio}
+
+
+def conferir_parsers(store, prefixo):
+    """Quantos artigos saem com texto diferente entre html.parser e lxml."""
+    diferentes = 0
+    nomes = [n for n in store.listar(prefixo) if n.endswith(".html")]
+    for name in nomes:
+        html_content = store.ler_texto(name)
+        if silver.process_html_to_text(html_content, "html.parser") != silver.process_html_to_text(html_content, "lxml"):
+            diferentes += 1
+    return len(nomes), diferentes
+
+
+def conferir_cobertura(store, prefixo, parser="html.parser"):
+    """
+    Quantos artigos saem com conteúdo diferente do get_text() do artigo
+    inteiro. O espaço em branco é ignorado: os blocos normalizam espaços e
+    quebras de linha, mas o restante do texto tem que sair igual e na mesma ordem.
+    """
+    diferentes = 0
+    nomes = [n for n in store.listar(prefixo) if n.endswith(".html")]
+    for name in nomes:
+        html_content = store.ler_texto(name)
+        artigo = BeautifulSoup(html_content, parser).find('article', {'id': 'kb-article'})
+        if artigo is None:
+            continue
+        for sub in artigo.find_all('div', {'class': 'rating-box-form'}):
+            sub.decompose()
+        if "".join(artigo.get_text().split()) != "".join(silver.process_html_to_text(html_content, parser).split()):
+            diferentes += 1
+    return len(nomes), diferentes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--artigos", type=int, default=500)
+    parser.add_argument("--latencia-ms", type=float, default=30)
+    parser.add_argument("--io-workers", type=int, default=silver.SILVER_IO_WORKERS)
+    parser.add_argument("--parse-workers", type=int, default=silver.SILVER_PARSE_WORKERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as pasta:
+        origem = LocalStore(os.path.join(pasta, "origem"))
+        gerar_corpus(origem, args.artigos)
+        total, diferentes = conferir_parsers(origem, "bronze")
+        print(f"[paridade] {diferentes} de {total} artigos com texto diferente entre html.parser e lxml")
+        total, diferentes = conferir_cobertura(origem, "bronze")
+        print(f"[cobertura] {diferentes} de {total} artigos com texto diferente do get_text() do artigo")
+
+        cenarios = [
+            ("sequencial", None, None),
+            ("concorrente html.parser", "html.parser", args.parse_workers),
+            ("concorrente lxml", "lxml", args.parse_workers),
+            ("concorrente lxml sem processos", "lxml", 0),
+        ]
+        for nome, html_parser, parse_workers in cenarios:
+            # cada cenário começa com o silver vazio
+            destino = os.path.join(pasta, nome.replace(" ", "_"))
+            shutil.copytree(os.path.join(origem.raiz, "bronze"), os.path.join(destino, "bronze"))
+            store = LatenciaSimulada(LocalStore(destino), args.latencia_ms)
+            if html_parser is None:
+                resumo = sequencial(store, "bronze")
+            else:
+                resumo = silver.convert_html_blobs_to_txt(
+                    store, "bronze", io_workers=args.io_workers, parse_workers=parse_workers, parser=html_parser,
+                )
+            print(f"[{nome}] {resumo['arquivos']} arquivos em {resumo['segundos']:.2f}s "
+                  f"({resumo['arquivos'] / resumo['segundos']:.1f} arquivos/s)")
+
+
+if __name__ == "__main__":
+    main()
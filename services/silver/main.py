@@ -1,53 +1,180 @@
 import os
-from google.cloud import storage
-from bs4 import BeautifulSoup
+import json
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from common.blob_store import abrir_store
+from common.crawl_state import CrawlState, ESTADO_SILVER, hash_texto, ler_json, gravar_json
+from common.chunking import extrair_blocos, texto_do_documento, dividir_em_passagens, tokens_por_palavra, tokenizador_hf
 
-def process_html_to_text(html_content):
+# tamanho das passagens em tokens do modelo de embeddings e sobreposição entre vizinhas
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "32"))
+# tokenizer usado para contar tokens; vazio conta por palavras
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "davidoneil/bge-m3-ft-corpus-pt")
+# threads para download/upload e processos para o parse; 0 processos faz o parse nas threads
+SILVER_IO_WORKERS = int(os.getenv("SILVER_IO_WORKERS", "16"))
+SILVER_PARSE_WORKERS = int(os.getenv("SILVER_PARSE_WORKERS", str(os.cpu_count() or 1)))
+# "lxml" é o caminho rápido; "html.parser" não depende de extensão em C
+SILVER_HTML_PARSER = os.getenv("SILVER_HTML_PARSER", "html.parser")
+
+# tokenizer de cada processo de parse, carregado uma vez no initializer
+_tokenizar = None
+
+def carregar_tokenizador():
+    if not CHUNK_TOKENIZER:
+        return tokens_por_palavra
+    from transformers import AutoTokenizer
+    return tokenizador_hf(AutoTokenizer.from_pretrained(CHUNK_TOKENIZER))
+
+def _iniciar_parser():
+    global _tokenizar
+    _tokenizar = carregar_tokenizador()
+
+def _pronto(_):
+    return True
+
+def process_html_to_text(html_content, parser=SILVER_HTML_PARSER):
     """Dada uma string HTML, extrai o conteúdo de texto desejado."""
-    soup = BeautifulSoup(html_content, "html.parser")
-    div = soup.find('article', {'id': 'kb-article'})
-    if div is None:
-        return ""
-    for sub in div.find_all('div', {'class': 'rating-box-form'}):
-        sub.decompose()
-    return div.get_text()
+    # um bloco (título, parágrafo, item de lista...) por parágrafo do .txt
+    return texto_do_documento(extrair_blocos(html_content, parser))
 
-def convert_html_blobs_to_txt(bucket_name, prefix_html_folder):
-    """
-    Percorre todos os blobs HTML sob `prefix_html_folder`,
-    extrai texto e salva .txt no **mesmo local** (diretório virtual do bucket).
-    """
-    client = storage.Client()
-    bucket = client.bucket(bucket_name)
+def process_html_to_passages(html_content, id_documento, tokenizar, parser=SILVER_HTML_PARSER):
+    """Divide o artigo em passagens respeitando títulos e parágrafos."""
+    return dividir_em_passagens(
+        extrair_blocos(html_content, parser), id_documento,
+        tamanho=CHUNK_TOKENS, sobreposicao=CHUNK_OVERLAP, tokenizar=tokenizar,
+    )
+
+def converter(html_content, id_documento, parser=SILVER_HTML_PARSER):
+    """Parse de um artigo: devolve o texto do .txt e o conteúdo do .chunks.jsonl."""
+    # o HTML é analisado uma vez só para o texto e para as passagens
+    blocos = extrair_blocos(html_content, parser)
+    passagens = dividir_em_passagens(
+        blocos, id_documento, tamanho=CHUNK_TOKENS, sobreposicao=CHUNK_OVERLAP, tokenizar=_tokenizar,
+    )
+    return texto_do_documento(blocos), "".join(json.dumps(p, ensure_ascii=False) + "\n" for p in passagens), len(passagens)
 
-    blobs = client.list_blobs(bucket_name, prefix=prefix_html_folder)
+def nomes_silver(html_name):
+    """ex: "bronze/knowledge_base/foo123/foo123.html" -> ("silver/foo123.txt", "silver/foo123.chunks.jsonl")"""
+    txt_blob_name = "silver/" + os.path.basename(html_name)[:-5] + ".txt"
+    return txt_blob_name, txt_blob_name[:-4] + ".chunks.jsonl"
 
-    for blob in blobs:
-        name = blob.name  # ex: "bronze/knowledge_base/foo123/foo123.html"
+def pendentes(store, prefix_html_folder, hashes_bronze, estado):
+    """
+    HTMLs que ainda não têm .txt e .chunks.jsonl no silver, ou cujo conteúdo no
+    bronze mudou desde a última conversão (hash do crawl state diferente do
+    registrado no estado do silver). Os dois lados são listados uma vez só, em
+    vez de um exists() por arquivo.
+    """
+    existentes = set(store.listar("silver/"))
+    resultado = []
+    for name in store.listar(prefix_html_folder):
         if not name.lower().endswith(".html"):
             continue
+        txt_blob_name, chunks_blob_name = nomes_silver(name)
+        sha = hashes_bronze.get(name)
+        registro = estado.get(os.path.basename(txt_blob_name))
+        if txt_blob_name in existentes and chunks_blob_name in existentes:
+            if registro is None and sha is not None:
+                # convertido antes de existir o estado: assume a versão atual do bronze
+                estado[os.path.basename(txt_blob_name)] = {"origem": name, "sha256": sha}
+                continue
+            if registro is None or sha is None or registro["sha256"] == sha:
+                continue
+        resultado.append(name)
+    return resultado
 
-        # Derivar o nome do .txt: substituir .html por .txt
-        txt_blob_name = name[:-5] + ".txt"  # remove “.html” e adiciona “.txt”
+def abrir_parsers(parse_workers=SILVER_PARSE_WORKERS):
+    """
+    Pool de processos para o parse, ou None com `parse_workers` 0 (o parse
+    fica nas threads e o tokenizer é carregado aqui). Chamar antes de criar
+    qualquer thread: os processos são criados com fork.
+    """
+    if parse_workers <= 0:
+        _iniciar_parser()
+        return None
+    processos = ProcessPoolExecutor(
+        max_workers=parse_workers, mp_context=multiprocessing.get_context("fork"), initializer=_iniciar_parser,
+    )
+    # sobe os processos (fork) antes de qualquer thread de I/O existir
+    list(processos.map(_pronto, range(parse_workers)))
+    return processos
 
-        txt_blob_name = "silver/" + txt_blob_name.split("/")[-1]
+def converter_blob(store, name, parser=SILVER_HTML_PARSER, processos=None):
+    """
+    Converte um HTML do bronze e grava o .txt e o .chunks.jsonl no silver.
+    Devolve (id_documento, sha256 do HTML convertido, total de passagens).
+    """
+    txt_blob_name, chunks_blob_name = nomes_silver(name)
+    html_content = store.ler_texto(name)
+    id_documento = os.path.basename(txt_blob_name)
+    if processos is not None:
+        text, chunks, total = processos.submit(converter, html_content, id_documento, parser).result()
+    else:
+        text, chunks, total = converter(html_content, id_documento, parser)
+    store.gravar_texto(txt_blob_name, text, content_type="text/plain; charset=utf-8")
+    store.gravar_texto(chunks_blob_name, chunks, content_type="application/x-ndjson; charset=utf-8")
+    print(f"[OK] Criado: {txt_blob_name} ({total} passagens)")
+    # hash do HTML efetivamente convertido (igual ao do crawl state se o bronze não mudou no meio)
+    return id_documento, hash_texto(html_content), total
 
-        # Verificar se já existe
-        txt_blob = bucket.blob(txt_blob_name)
-        if txt_blob.exists():
-            print(f"[SKIP] Já existe {txt_blob_name}")
-            continue
+def convert_html_blobs_to_txt(store, prefix_html_folder, io_workers=SILVER_IO_WORKERS,
+                              parse_workers=SILVER_PARSE_WORKERS, parser=SILVER_HTML_PARSER):
+    """
+    Percorre todos os blobs HTML sob `prefix_html_folder`,
+    extrai texto e salva .txt no **mesmo local** (diretório virtual do bucket),
+    junto com as passagens do artigo em .chunks.jsonl (uma por linha, com o id
+    do documento e os offsets no .txt).
+
+    Downloads e uploads rodam em `io_workers` threads; o parse, que é CPU, vai
+    para `parse_workers` processos. Cada thread espera o parse do seu arquivo,
+    então há no máximo `io_workers` HTMLs em memória ao mesmo tempo.
+
+    Só são convertidos os artigos novos ou cujo hash no crawl state do bronze
+    mudou; o hash convertido fica em silver/_silver_state.json para o gold.
+    """
+    inicio = time.perf_counter()
+    hashes_bronze = CrawlState(store).hashes_por_blob()
+    estado = ler_json(store, ESTADO_SILVER, {})
+    nomes = pendentes(store, prefix_html_folder, hashes_bronze, estado)
+    print(f"[INFO] {len(nomes)} HTMLs novos ou alterados para converter em {store}")
+    if not nomes:
+        gravar_json(store, ESTADO_SILVER, estado)
+        return {"arquivos": 0, "erros": 0, "alterados": [], "segundos": time.perf_counter() - inicio}
+
+    processos = abrir_parsers(parse_workers)
+    alterados = []
+
+    def processar(name):
+        id_documento, sha, _ = converter_blob(store, name, parser, processos)
+        # o gold compara este hash com o do controle para saber o que re-embedar
+        estado[id_documento] = {"origem": name, "sha256": sha}
+        alterados.append(id_documento)
 
-        # Baixar HTML
-        html_content = blob.download_as_text(encoding="utf-8")
-        text = process_html_to_text(html_content)
+    erros = 0
+    try:
+        with ThreadPoolExecutor(max_workers=io_workers) as executor:
+            for name, futuro in [(name, executor.submit(processar, name)) for name in nomes]:
+                try:
+                    futuro.result()
+                except Exception as e:
+                    erros += 1
+                    print(f"[ERRO] {name}: {e}")
+    finally:
+        if processos is not None:
+            processos.shutdown()
+        gravar_json(store, ESTADO_SILVER, estado)
 
-        # Salvar o .txt no bucket
-        txt_blob.upload_from_string(text, content_type="text/plain; charset=utf-8")
-        print(f"[OK] Criado: {txt_blob_name}")
+    segundos = time.perf_counter() - inicio
+    print(f"[INFO] {len(nomes) - erros} arquivos convertidos em {segundos:.2f}s "
+          f"({(len(nomes) - erros) / segundos:.1f} arquivos/s), {erros} erros")
+    return {"arquivos": len(nomes) - erros, "erros": erros, "alterados": alterados, "segundos": segundos}
 
 if __name__ == "__main__":
     BUCKET = os.getenv("BUCKET_NAME", "pdm-2025-knowledge-base")
-    PREFIX_HTML = "bronze"  
+    # gs://bucket ou uma pasta local com a mesma estrutura (bronze/..., silver/...)
+    SILVER_STORAGE = os.getenv("SILVER_STORAGE", f"gs://{BUCKET}")
+    PREFIX_HTML = "bronze"
 
-    convert_html_blobs_to_txt(BUCKET, PREFIX_HTML)
+    convert_html_blobs_to_txt(abrir_store(SILVER_STORAGE), PREFIX_HTML)